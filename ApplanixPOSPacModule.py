@@ -1,7 +1,75 @@
-import os, math, struct
+import os, math, json, shutil, struct, operator, threading
 import pylab as pl
+from numpy.lib.format import open_memmap
+from numpy.lib.stride_tricks import as_strided
+import geodetic
+import profiling
+from collections import OrderedDict
 
 PROJECT_FILETYPE_MASK = "*.pospac"
+# project manifest (see project.loadManifest), the kernel and the field count,
+# messages and time bounds of every data file opened, saved next to the
+# project file so reopening a project doesn't read the folders and files again
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 1
+
+# field numbers of the standard navigation record (sbet, vnav, iin)
+SBET_FIELDS = {"time": 1, "lat": 2, "lon": 3, "alt": 4, "xVel": 5, "yVel": 6, "zVel": 7,
+               "roll": 8, "pitch": 9, "heading": 10, "wander": 11,
+               "xForce": 12, "yForce": 13, "zForce": 14,
+               "xAngRate": 15, "yAngRate": 16, "zAngRate": 17}
+# fields that wrap at +/-pi and need angle aware interpolation
+SBET_ANGLE_FIELDS = [SBET_FIELDS["roll"], SBET_FIELDS["pitch"], SBET_FIELDS["heading"], SBET_FIELDS["wander"]]
+
+# field numbers of the smoothed error estimates (smers) used by the QC, an
+# assumed layout (time, position, velocity and attitude errors then the IMU
+# and lever arm estimates in the units of the autoqc tolerances, micro-g,
+# deg/hr, ppm and metres) taken to be the same in the 50 field (5.4 SP1)
+# and 53 field (earlier) files, replace entries to match other layouts
+SMERS_FIELDS = {"time": 1, "north": 2, "east": 3, "down": 4, "northVel": 5, "eastVel": 6, "downVel": 7,
+                "roll": 8, "pitch": 9, "heading": 10,
+                "xAccelBias": 11, "yAccelBias": 12, "zAccelBias": 13,
+                "xGyroBias": 14, "yGyroBias": 15, "zGyroBias": 16,
+                "xAccelScale": 17, "yAccelScale": 18, "zAccelScale": 19,
+                "xGyroScale": 20, "yGyroScale": 21, "zGyroScale": 22,
+                "xLeverArm": 23, "yLeverArm": 24, "zLeverArm": 25}
+
+# field counts tried when detecting the field count of a data file
+DETECT_FIELD_COUNTS = range(5,100)
+# messages per candidate field count scored when detecting the field count
+DETECT_SAMPLE_MESSAGES = 2048
+# detectFieldCount results by (path, size, modified time)
+detectedFieldCounts = {}
+
+# messages per block of the block summary index (see dataFile.getBlockIndex)
+BLOCK_INDEX_MESSAGES = 4096
+# block summary index sidecar, saved next to the data file
+BLOCK_INDEX_SUFFIX = ".blkidx.npz"
+# messages read at a time when building indexes
+READ_CHUNK_MESSAGES = 1 << 18
+
+# uniform rate segment index sidecar (see dataFile.getSegmentIndex). The
+# local period is the median of SEGMENT_WINDOW_STEPS steps between messages
+# so timestamp jitter doesn't split the file. A step larger than
+# SEGMENT_GAP_PERIODS times the local period before and after it is a gap,
+# a local period that changes by more than SEGMENT_RATE_TOLERANCE (relative)
+# starts a segment at a new rate and neighbouring segments whose rates agree
+# within SEGMENT_RATE_TOLERANCE are merged.
+SEGMENT_INDEX_SUFFIX = ".segidx.npz"
+SEGMENT_GAP_PERIODS = 1.5
+SEGMENT_RATE_TOLERANCE = 0.1
+SEGMENT_WINDOW_STEPS = 15
+
+# columnar copy of a data file (see convertToColumnar), a folder next to the
+# file holding one .npy per field and the metadata file
+COLUMNAR_SUFFIX = ".cols"
+COLUMNAR_META = "meta.json"
+
+# comparators for tolerance checks, e.g. ['<', 0.07]
+COMPARATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+               "==": operator.eq, "!=": operator.ne}
+# gaps longer than this many message periods split sustained intervals
+INTERVAL_GAP_PERIODS = 1.5
 
 class project():
     """
@@ -11,20 +79,25 @@ class project():
     EXTRACTED_DIR = "Extract"
     PROCESSED_DIR = "Proc"
     
-    def __init__(self, projectFile, version = "5.4 SP1"):
+    def __init__(self, projectFile, version = "5.4 SP1", useManifest = True):
         if ".pospac" in projectFile:
             self.projectFile = projectFile
             #get the project path (minus .pospac extension)
             self.path = os.path.splitext(projectFile)[0]
             #get project name
             self.name = os.path.basename(self.path)
-    
-            # Detect Kernel
-            if not self.detectKernel():
-                raise IOError(0, "Unable to determine kernel name.", projectFile)
-            
-            
             self.version = version
+
+            # the manifest saves detecting the kernel and opening data files again
+            self.manifestFile = self.path + MANIFEST_SUFFIX
+            self.manifestLock = threading.Lock()
+            self.manifest = self.loadManifest() if useManifest else None
+
+            # Detect Kernel
+            if not self.getManifestKernel():
+                if not self.detectKernel():
+                    raise IOError(0, "Unable to determine kernel name.", projectFile)
+                self.setManifestKernel()
             
             if self.version == "5.4 SP1":
                 self.dataFileFieldCounts = {"sbet": 17, # Post-Processed Solution File
@@ -73,27 +146,184 @@ class project():
 
         return False
             
+    def loadManifest(self):
+        """
+        Reads the project manifest (MANIFEST_SUFFIX next to the project file),
+        an empty manifest when there isn't one for this manifest and POSPac
+        version
+        """
+        manifest = None
+        try:
+            fid = open(self.manifestFile, 'r')
+            manifest = json.load(fid, object_pairs_hook = OrderedDict)
+            fid.close()
+        except (IOError, OSError, ValueError):
+            pass
+        if not isinstance(manifest, dict) or manifest.get("manifest") != MANIFEST_VERSION \
+                or manifest.get("version") != self.version:
+            manifest = OrderedDict([("manifest", MANIFEST_VERSION), ("version", self.version), ("kernel", None),
+                                    ("files", OrderedDict())])
+        return manifest
+
+    def saveManifest(self):
+        """
+        Writes the manifest, to a temporary file first so readers never load
+        part of it. Folders that can't be written to are ignored like
+        saveSidecar, the manifest is just rebuilt next time.
+        """
+        tempFilename = self.manifestFile + ".tmp%s" % os.getpid()
+        try:
+            fid = open(tempFilename, 'w')
+            json.dump(self.manifest, fid, indent = 2)
+            fid.close()
+            if os.path.exists(self.manifestFile):
+                os.remove(self.manifestFile)
+            os.rename(tempFilename, self.manifestFile)
+        except (IOError, OSError):
+            if os.path.exists(tempFilename):
+                try:
+                    os.remove(tempFilename)
+                except OSError:
+                    pass
+
+    def getKernelSignature(self):
+        """
+        Modified time of the project folder, changes when kernel folders are
+        added, removed or renamed
+        """
+        return [os.path.getmtime(self.path)]
+
+    def getManifestKernel(self):
+        """
+        Takes the kernel from the manifest when the project folder hasn't
+        changed since it was detected, returns False when it has to be
+        detected again
+        """
+        if self.manifest is None or not self.manifest["kernel"]:
+            return False
+        kernel = self.manifest["kernel"]
+        try:
+            if kernel["signature"] != self.getKernelSignature():
+                return False
+        except OSError:
+            return False
+        if not os.path.isdir(os.path.join(self.path, kernel["name"], self.EXTRACTED_DIR)):
+            return False
+        self.kernel = kernel["name"]
+        return True
+
+    def setManifestKernel(self):
+        if self.manifest is None:
+            return
+        with self.manifestLock:
+            self.manifest["kernel"] = OrderedDict([("name", self.kernel), ("signature", self.getKernelSignature())])
+            self.saveManifest()
+
+    def getManifestEntry(self, filepath):
+        """
+        Returns the manifest entry of a data file when it is up to date (same
+        size and modified time as the file), otherwise None
+        """
+        if self.manifest is None:
+            return None
+        entry = self.manifest["files"].get(os.path.relpath(filepath, self.path))
+        try:
+            if entry is None or entry["signature"] != fileSignature(filepath):
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def getManifestEntryOf(self, filepath, fileTypePrefix, dataTypeDir, dataObject):
+        """
+        The manifest entry of an opened data file, its type, folder, size and
+        modified time, field count, messages, time bounds and rate
+        """
+        return OrderedDict([("fileType", fileTypePrefix), ("directory", dataTypeDir),
+                            ("signature", fileSignature(filepath)), ("fields", dataObject.fields),
+                            ("messages", dataObject.messages), ("startTime", dataObject.startTime),
+                            ("endTime", dataObject.endTime), ("timeInc", dataObject.timeInc),
+                            ("rate", 1.0 / dataObject.timeInc if dataObject.timeInc else None)])
+
+    def updateManifest(self, filepath, fileTypePrefix, dataTypeDir, dataObject):
+        """
+        Records an opened data file in the manifest, saved when the entry
+        changed
+        """
+        if self.manifest is None:
+            return
+        entry = self.getManifestEntryOf(filepath, fileTypePrefix, dataTypeDir, dataObject)
+        key = os.path.relpath(filepath, self.path)
+        with self.manifestLock:
+            if self.manifest["files"].get(key) != entry:
+                self.manifest["files"][key] = entry
+                self.saveManifest()
+
+    def listDataFiles(self):
+        """
+        Lists the data files of the kernel (<type>_<kernel>.out in the Extract
+        and Proc folders), an OrderedDict of path to the manifest entry (file
+        type, folder, field count, messages, time bounds and rate). Only the
+        files the manifest is out of date for are opened, files that can't
+        be read are left out.
+        """
+        files = OrderedDict()
+        suffix = "_%s.out" % self.kernel
+        for dataTypeDir in [self.EXTRACTED_DIR, self.PROCESSED_DIR]:
+            folder = os.path.join(self.path, self.kernel, dataTypeDir)
+            if not os.path.isdir(folder):
+                continue
+            for filename in sorted(os.listdir(folder)):
+                if not filename.endswith(suffix) or filename == suffix:
+                    continue
+                fileTypePrefix = filename[:-len(suffix)]
+                filepath = os.path.join(folder, filename)
+                entry = self.getManifestEntry(filepath)
+                if entry is None:
+                    try:
+                        dataObject = self.getDataFileObject(fileTypePrefix, dataTypeDir)
+                    except Exception:
+                        continue
+                    entry = self.getManifestEntryOf(filepath, fileTypePrefix, dataTypeDir, dataObject)
+                    del dataObject
+                files[filepath] = entry
+
+        # forget the files that are gone
+        if self.manifest is not None:
+            with self.manifestLock:
+                listed = set(os.path.relpath(filepath, self.path) for filepath in files)
+                removed = [key for key in self.manifest["files"] if key not in listed]
+                for key in removed:
+                    del self.manifest["files"][key]
+                if removed:
+                    self.saveManifest()
+        return files
+
     def detectDataFileObjectFieldCount(self,filepath):
-        for fieldCount in range(5,100):
-            try:
-                # data file class wil raise an Exception if it can't detect start and end time
-                # or if the message length doesn't divide equaly into the file size.
-                # Auto detect can in rare cases select erronious fieldcounts
-                dataObject = dataFile(filepath, fieldCount)
-                print "Field count detected: %s" % fieldCount
-                return dataObject
-            except IOError:
-                pass
-        raise Exception("Can't detect message field count.")
+        fieldCount, confidence = detectFieldCount(filepath)
+        print "Field count detected: %s (confidence %.2f)" % (fieldCount, confidence)
+        return dataFile(filepath, fieldCount)
 
 
     def getDataFileObject(self, fileTypePrefix, dataTypeDir):
         """
-        Returns a POSPacDataFile object for access to the data file
+        Returns a POSPacDataFile object for access to the data file, read
+        from its columnar copy (see convertDataFiles) when that is up to date.
+        The field count and time bounds come from the manifest while it is
+        up to date, otherwise they are read and recorded in the manifest.
         """
         filepath = self.getDataFilePath(fileTypePrefix, dataTypeDir)
 
         if os.path.exists(filepath):
+            dataObject = openColumnarFile(filepath, self.dataFileFieldCounts.get(fileTypePrefix))
+            if dataObject is not None:
+                self.updateManifest(filepath, fileTypePrefix, dataTypeDir, dataObject)
+                return dataObject
+
+            entry = self.getManifestEntry(filepath)
+            if entry is not None:
+                return dataFile(filepath, entry["fields"], header = entry)
+
             if fileTypePrefix in self.dataFileFieldCounts:
                 fieldCount = self.dataFileFieldCounts[fileTypePrefix]
                 try:
@@ -105,11 +335,34 @@ class project():
             else:
                 print "Warning: File type prefix \"%s\" unrecognized. Auto detecting message field count." % fileTypePrefix
                 dataObject = self.detectDataFileObjectFieldCount(filepath)
+            self.updateManifest(filepath, fileTypePrefix, dataTypeDir, dataObject)
         else:
             raise IOError(0,"Data file does not exist.",filepath)
 
         return dataObject
     
+    def convertDataFiles(self, fileTypePrefixes = None):
+        """
+        Writes the columnar copy (see convertToColumnar) of the project's
+        data files in the Extract and Proc folders that don't have an up to
+        date one, fileTypePrefixes limits the file types (default all known
+        types). Returns the paths converted.
+        """
+        if fileTypePrefixes is None:
+            fileTypePrefixes = sorted(self.dataFileFieldCounts)
+        converted = []
+        for dataTypeDir in [self.EXTRACTED_DIR, self.PROCESSED_DIR]:
+            for fileTypePrefix in fileTypePrefixes:
+                filepath = self.getDataFilePath(fileTypePrefix, dataTypeDir)
+                if not os.path.exists(filepath) or openColumnarFile(filepath) is not None:
+                    continue
+                dataObject = self.getDataFileObject(fileTypePrefix, dataTypeDir)
+                fields = dataObject.fields
+                del dataObject
+                convertToColumnar(filepath, fields)
+                converted.append(filepath)
+        return converted
+
     def getExtractedDataObject(self,fileTypePrefix):
         """Convenience function"""
         return self.getDataFileObject(fileTypePrefix, self.EXTRACTED_DIR)
@@ -143,27 +396,59 @@ class dataFile():
 
     arrayStart = 1
 
-    def __init__(self, filename, fields):
+    def __init__(self, filename, fields, useMmap = True, partial = False, header = None):
     # Description: class constructor
     #
     # Inputs: filename - path to POSPAC file to open
     #         fields - number of double fields in the POSPAC file
+    #         useMmap - memory map the file (default), set to False to fall
+    #                   back to the seek and read access for every value
+    #         partial - the file is still being written, ignore a trailing
+    #                   partial message instead of raising, see refresh
+    #         header - known "messages", "startTime", "endTime" and "timeInc"
+    #                  of the file (a project manifest entry), used instead of
+    #                  reading the first and last messages when the message
+    #                  count matches
 
         self.filename = filename
         self.fid = open(self.filename,'rb')
         self.fields = fields
         self.messageLength = self.fieldLength * self.fields
         self.size = os.path.getsize(filename)
+        self.partial = partial
         
         # compute the number of messages in the file
         messages = float(self.size) / self.messageLength
         if round(messages,0) == messages: # make sure the length divides evenly, otherwise there are malformed messages
             self.messages = int(messages)
+        elif self.partial: # the last message is still being written
+            self.messages = self.size // self.messageLength
         else:
             raise IOError(0,"Filesize is not an integer multiple of the message length.",self.filename)
+        if self.messages == 0:
+            raise IOError(0,"File contains no messages.",self.filename)
+
+        self.useMmap = useMmap
+        self.data = None
+        self.timeColumn = None # contiguous copy of the time field, see getTimes
+        self.blockIndex = None # block summaries, see getBlockIndex
+        self.segmentIndex = None # uniform rate segments, see getSegmentIndex
+        if self.useMmap:
+            self.mapFile()
         
         # get time data
-        self.startTime = round(self.getField(self.arrayStart,self.arrayStart),3)
+        if header is not None and header["messages"] == self.messages:
+            self.startTime = header["startTime"]
+            self.endTime = header["endTime"]
+            self.timeInc = header["timeInc"]
+            self.timeLength = self.endTime - self.startTime
+        else:
+            self.startTime = round(self.getField(self.arrayStart,self.arrayStart),3)
+            self.updateTimeBounds()
+
+    def updateTimeBounds(self):
+    # Description: sets endTime, timeInc and timeLength from the first and
+    # last messages
         self.endTime = round(self.getField(self.arrayStart + self.messages - 1,self.arrayStart),3)
         # divide the difference of first and last time by the number of messages
         # this is more precise than the difference between two messages because
@@ -171,10 +456,83 @@ class dataFile():
         self.timeInc = round((self.getField(self.messages,self.arrayStart) - self.getField(self.arrayStart,self.arrayStart))/self.messages, 3)
         self.timeLength = self.endTime - self.startTime
         if self.timeLength <= 0:
-            raise IOError(0,"File start time (%.3f) is greater than end time (%.3f)." % (self.startTime,self.endTime),filename)
+            raise IOError(0,"File start time (%.3f) is greater than end time (%.3f)." % (self.startTime,self.endTime),self.filename)
+
+    def refresh(self):
+    # Description: picks up the whole messages appended since the file was
+    # opened or last refreshed, for following a file that is still being
+    # written. Only the last message is read to update the time bounds, the
+    # cost doesn't grow with the length of the file.
+    #
+    # Output: (msgStart, msgEnd) - message numbers of the new messages, msgEnd
+    #         is one past the last, msgStart == msgEnd when nothing was added
+        msgEnd = self.messages + self.arrayStart
+        size = os.path.getsize(self.filename)
+        if size % self.messageLength and not self.partial:
+            raise IOError(0,"Filesize is not an integer multiple of the message length.",self.filename)
+        messages = size // self.messageLength
+        if messages <= self.messages:
+            return (msgEnd, msgEnd)
+
+        self.size = size
+        self.messages = messages
+        if self.useMmap:
+            self.mapFile()
+        self.updateTimeBounds()
+        if self.timeColumn is not None:
+            newTimes = self.getDataRange(msgEnd,self.messages + self.arrayStart,[self.arrayStart])[:,0]
+            self.timeColumn = pl.concatenate((self.timeColumn,newTimes))
+        self.blockIndex = None # rebuilt on the next getBlockIndex
+        self.segmentIndex = None # rebuilt on the next getSegmentIndex
+        return (msgEnd, self.messages + self.arrayStart)
 
     def __del__(self):
-        self.fid.close()
+        self.data = None
+        if hasattr(self, "fid"): # not set when the file couldn't be opened
+            self.fid.close()
+
+    def mapFile(self):
+    # Description: maps the file into memory as a (messages x fields) array of
+    # float64, rows and columns of the array are zero-copy views of the file.
+    # Note that the array indexes start at 0, not arrayStart.
+        self.data = pl.memmap(self.filename, dtype=pl.float64, mode='r', shape=(self.messages,self.fields))
+
+    def getColumn(self,field):
+    # Description: get every value of a single field
+    #
+    # Inputs: field - field number (1 is first field)
+    #
+    # Output: values - 1D array of the field, a view of the file when mapped
+        if field > self.fields or field < self.arrayStart:
+            raise IOError(0,"Field (%s) out of range." % field,self.filename)
+        if self.data is not None:
+            if profiling.report is not None:
+                profiling.report.addRead(self.filename, 0, self.getReadBytes(self.messages, 1))
+            return self.data[:,field - self.arrayStart]
+        else:
+            return pl.array([self.getField(message,field) for message in xrange(self.arrayStart,self.messages + self.arrayStart)],dtype=pl.float64)
+
+    def getRows(self,msgStart,msgEnd):
+    # Description: get the messages from msgStart up to (but not including)
+    # msgEnd as a (messages x fields) array
+    #
+    # Inputs: msgStart - first message number
+    #         msgEnd - message number to stop before
+    #
+    # Output: values - 2D array of messages, a view of the file when mapped
+        if msgStart < self.arrayStart or msgEnd > self.messages + self.arrayStart or msgEnd < msgStart:
+            raise IOError(0,"Messages (%s to %s) out of range." % (msgStart,msgEnd),self.filename)
+        if self.data is not None:
+            if profiling.report is not None:
+                profiling.report.addRead(self.filename, 0, self.getReadBytes(msgEnd - msgStart, self.fields))
+            return self.data[msgStart - self.arrayStart:msgEnd - self.arrayStart]
+        else:
+            self.fid.seek((msgStart - self.arrayStart) * self.messageLength)
+            count = (msgEnd - msgStart) * self.fields
+            if profiling.report is not None:
+                profiling.report.addRead(self.filename, 1, count * self.fieldLength)
+            values = pl.fromfile(self.fid,dtype=pl.float64,count=count)
+            return values.reshape((msgEnd - msgStart,self.fields))
 
     def getField(self,message,field):
     # Description: get a single value from the file at the designated message
@@ -185,10 +543,17 @@ class dataFile():
     #
     # Output: value - float value stored at (message,field)
         if message <= self.messages and field <= self.fields and message >= self.arrayStart:
+            if self.data is not None:
+                if profiling.report is not None:
+                    profiling.report.addRead(self.filename, 0, self.fieldLength)
+                return float(self.data[int(message) - self.arrayStart,int(field) - self.arrayStart])
+
             offset = (message - self.arrayStart) * self.messageLength + (field - self.arrayStart) * self.fieldLength;
 
             self.fid.seek(offset);
             data = self.fid.read(self.fieldLength);
+            if profiling.report is not None:
+                profiling.report.addRead(self.filename, 1, self.fieldLength)
             value = struct.unpack("=1d",data)
             return value[0]
         else:
@@ -199,6 +564,126 @@ class dataFile():
     def getMsgNumByTime(self, time):
         return int(round(self.getPreciseMsgNumByTime(time),0))
 
+    def getTimes(self):
+    # Description: gets the time field of every message as a contiguous array,
+    # the array is read once and kept for the time lookups
+    #
+    # Output: times - 1D array of message times
+        if self.timeColumn is None:
+            self.timeColumn = pl.ascontiguousarray(self.getColumn(self.arrayStart))
+        return self.timeColumn
+
+    def getTimesAt(self, msgNums):
+    # Description: gets the time of each message, from the kept time field
+    # if it has been read, otherwise from the file
+    #
+    # Inputs: msgNums - array of message numbers
+    #
+    # Output: times - array of message times
+        if self.timeColumn is not None:
+            return self.timeColumn[msgNums - self.arrayStart]
+        return self.readBlock(msgNums - self.arrayStart, [0])[:,0]
+
+    def getMsgWindowByTime(self, startTime, endTime):
+    # Description: finds a range of messages that brackets every time from
+    # startTime to endTime without reading the whole time field, starts from
+    # the predicted message numbers with a 60 second margin for drift and
+    # widens the range until the first and last messages bracket the times
+    #
+    # Inputs: startTime - first time the range must cover
+    #         endTime - last time the range must cover
+    #
+    # Output: window - (msgStart, msgEnd) message number range, msgEnd is one
+    #         past the last message
+        if startTime < self.startTime or endTime > self.endTime or endTime < startTime:
+            raise IOError(0,'Times (%.1f to %.1f) not within bounds of file.' % (startTime,endTime),self.filename)
+        firstMsg = self.arrayStart
+        lastMsg = self.messages + self.arrayStart - 1
+
+        margin = max(int(60 / self.timeInc), 1)
+        msgStart = max(self.getPredictedMsgNumByTime(startTime) - margin, firstMsg)
+        while msgStart > firstMsg and self.getField(msgStart,self.arrayStart) > startTime:
+            margin *= 2
+            msgStart = max(msgStart - margin, firstMsg)
+
+        margin = max(int(60 / self.timeInc), 1)
+        msgEnd = min(self.getPredictedMsgNumByTime(endTime) + margin, lastMsg)
+        while msgEnd < lastMsg and self.getField(msgEnd,self.arrayStart) < endTime:
+            margin *= 2
+            msgEnd = min(msgEnd + margin, lastMsg)
+
+        return (msgStart, msgEnd + 1)
+
+    def getBracketingMsgNumsByTime(self, times, window = None):
+    # Description: finds the messages either side of each time with a binary
+    # search over the time field (one vectorized call for all times). The
+    # message times must be increasing. Times between the rounded startTime or
+    # endTime and the first or last message snap to the first or last message.
+    #
+    # Inputs: times - list or array of times to find the message numbers for
+    #         window - optional (msgStart, msgEnd) range from
+    #                  getMsgWindowByTime to search instead of the kept time
+    #                  field of the whole file, keeps memory bounded
+    #
+    # Output: leftMsgNums - array of message numbers at or before each time
+    #         rightMsgNums - array of message numbers at or after each time
+        times = pl.asarray(times, dtype=pl.float64)
+        if len(times) and (times.min() < self.startTime or times.max() > self.endTime):
+            raise IOError(0,'Times (%.1f to %.1f) not within bounds of file.' % (times.min(),times.max()),self.filename)
+
+        if window is None:
+            msgStart = self.arrayStart
+            msgTimes = self.getTimes()
+        else:
+            msgStart = window[0]
+            msgTimes = pl.ascontiguousarray(self.getRows(window[0],window[1])[:,0])
+        count = len(msgTimes)
+        right = pl.searchsorted(msgTimes, times).clip(0, count - 1)
+        left = right - (msgTimes[right] > times)
+        left = left.clip(0, count - 1)
+        return left + msgStart, right + msgStart
+
+    def getPreciseMsgNumsByTime(self, times, window = None):
+    # Description: vectorized getPreciseMsgNumByTime, the fractional message
+    # number is interpolated between the bracketing messages so it is exact
+    # even when the data rate isn't uniform
+    #
+    # Inputs: times - list or array of times to find the message numbers for
+    #         window - optional message range, see getBracketingMsgNumsByTime
+    #
+    # Output: messageNumbers - array of fractional message numbers
+        leftMsgNums, rightMsgNums, fraction = self.getInterpFractionsByTime(times, window)
+        return leftMsgNums + fraction
+
+    def getInterpFractionsByTime(self, times, window = None):
+    # Description: finds the bracketing messages of each time and how far
+    # between them (by time) the time falls
+    #
+    # Inputs: times - list or array of times
+    #         window - optional message range, see getBracketingMsgNumsByTime
+    #
+    # Output: leftMsgNums - array of message numbers at or before each time
+    #         rightMsgNums - array of message numbers at or after each time
+    #         fraction - array from 0 (left message) to 1 (right message)
+        times = pl.asarray(times, dtype=pl.float64)
+        leftMsgNums, rightMsgNums = self.getBracketingMsgNumsByTime(times, window)
+        leftTimes = self.getTimesAt(leftMsgNums)
+        span = self.getTimesAt(rightMsgNums) - leftTimes
+        fraction = pl.zeros(len(times))
+        between = span > 0
+        fraction[between] = (times[between] - leftTimes[between]) / span[between]
+        return leftMsgNums, rightMsgNums, fraction.clip(0, 1)
+
+    def getMsgNumsByTime(self, times, window = None):
+    # Description: vectorized getMsgNumByTime, nearest message to each time
+    #
+    # Inputs: times - list or array of times to find the message numbers for
+    #         window - optional message range, see getBracketingMsgNumsByTime
+    #
+    # Output: messageNumbers - array of message numbers
+        # round half up, as round() does for positive numbers
+        return pl.floor(self.getPreciseMsgNumsByTime(times, window) + 0.5).astype(pl.int64)
+
     def getPreciseMsgNumByTime(self,time):
     # Description: finds the nearest message number in the file that corresponds
     # to the input time, performs a file read to determine the frequency bias. A more
@@ -212,6 +697,13 @@ class dataFile():
     # Inputs: time - time to find the message number for
     #
     # Output: messageNumber - message number in the file
+        if self.data is not None:
+            # mapped files use the exact lookup over the time field, only the
+            # messages around the time are read unless the whole field is kept
+            window = None
+            if self.timeColumn is None:
+                window = self.getMsgWindowByTime(time,time)
+            return float(self.getPreciseMsgNumsByTime([time],window)[0])
         if time >= self.startTime and time <= self.endTime:
             predictedMsgNum = self.getPredictedMsgNumByTime(time)
             timeAtPredictedMsg = self.getField(predictedMsgNum,self.arrayStart)
@@ -224,12 +716,17 @@ class dataFile():
 
     def getPredictedMsgNumByTime(self, time):
     # Description: finds the nearest predicted message number in the file that based on
-    # the time increment between messages and the start time
+    # the time increment between messages and the start time, once the
+    # segment index has been built or loaded (see getSegmentIndex) the
+    # prediction is from the uniform rate segment of the time so gaps and
+    # rate changes don't throw it off. A lookup never builds the index.
     #
     # Inputs: time - time to find the message number for
     #
     # Output: messageNumber - predicted message number in the file
-        
+        if self.segmentIndex is not None and time >= self.startTime and time <= self.endTime:
+            return int(round(self.getSegmentMsgNumsByTime([time])[0][0], 0))
+
         if time >= self.startTime and time <= self.startTime + self.timeLength / 2:
             messageNumber = int(round((time - self.startTime) / self.timeInc, 0) + self.arrayStart)
             return messageNumber
@@ -248,6 +745,11 @@ class dataFile():
     #         fields - list of fields to return for selected times
     #
     # Output: value - 2D list of fields at given times
+        if self.data is not None:
+            if not interp:
+                return self.getData(self.getMsgNumsByTime(times),fields)
+            return self.interpByTimes(times,fields)
+
         value = [] # initialize return
 
         for time in times:
@@ -262,12 +764,56 @@ class dataFile():
         return value
 
     def getData (self, messages, fields):
-    # Description: gets a large chunk of data by message and field numbers
+    # Description: gets a large chunk of data by message and field numbers,
+    # evenly spaced messages (e.g. range(msgStart,msgEnd,msgInc)) are read as a
+    # single strided slice, any other list is read with one fancy index
+    #
+    # Inputs: messages - list or array of messages to return
+    #         fields - list of fields to return for selected messages
+    #
+    # Output: values - 2D array of fields at given messages
+        if self.data is None:
+            return self.getDataBySeek(messages, fields)
+
+        msgIdx = pl.asarray(messages, dtype=pl.int64) - self.arrayStart
+        fieldIdx = self.getFieldIndexes(fields)
+
+        if len(msgIdx) == 0:
+            return pl.zeros((0,len(fieldIdx)),dtype=pl.float64)
+        if msgIdx.min() < 0 or msgIdx.max() >= self.messages:
+            raise IOError(0,"Messages out of range.",self.filename)
+
+        if len(msgIdx) > 1:
+            msgInc = msgIdx[1] - msgIdx[0]
+            if msgInc > 0 and (pl.diff(msgIdx) == msgInc).all():
+                return self.readBlock(slice(msgIdx[0],msgIdx[-1] + 1,msgInc),fieldIdx)
+        return self.readBlock(msgIdx,fieldIdx)
+
+    def getDataRange(self, msgStart, msgEnd, fields, msgInc = 1):
+    # Description: gets the fields for range(msgStart,msgEnd,msgInc) without
+    # building the list of message numbers
+    #
+    # Inputs: msgStart - first message number
+    #         msgEnd - message number to stop before
+    #         fields - list of fields to return for selected messages
+    #         msgInc - message step
+    #
+    # Output: values - 2D array of fields at given messages
+        if self.data is None:
+            return self.getDataBySeek(range(msgStart,msgEnd,msgInc), fields)
+
+        if msgStart < self.arrayStart or msgEnd > self.messages + self.arrayStart or msgInc < 1:
+            raise IOError(0,"Messages (%s to %s) out of range." % (msgStart,msgEnd),self.filename)
+        rows = slice(msgStart - self.arrayStart,max(msgEnd,msgStart) - self.arrayStart,msgInc)
+        return self.readBlock(rows,self.getFieldIndexes(fields))
+
+    def getDataBySeek(self, messages, fields):
+    # Description: original cell by cell getData, one seek and read per value
     #
     # Inputs: messages - list of messages to return
     #         fields - list of fields to return for selected messages
     #
-    # Output: values - 2D list of fields at given messages
+    # Output: values - 2D array of fields at given messages
         rows = len(messages)
         cols = len(fields)
 
@@ -278,6 +824,42 @@ class dataFile():
                 values[row,col] = self.getField(messages[row],fields[col])
         return values
 
+    def getFieldIndexes(self, fields):
+    # Description: converts field numbers to array column indexes
+    #
+    # Inputs: fields - list of field numbers
+    #
+    # Output: fieldIdx - array of column indexes (0 is first field)
+        fieldIdx = pl.asarray(fields, dtype=pl.int64) - self.arrayStart
+        if len(fieldIdx) and (fieldIdx.min() < 0 or fieldIdx.max() >= self.fields):
+            raise IOError(0,"Fields out of range.",self.filename)
+        return fieldIdx
+
+    def readBlock(self, rows, fieldIdx):
+    # Description: reads the selected rows and columns of the mapped file with
+    # one indexing operation
+    #
+    # Inputs: rows - slice or array of row indexes (0 is first message)
+    #         fieldIdx - array of column indexes (0 is first field)
+    #
+    # Output: values - 2D array (copy) of the selection
+        if self.data is None:
+            if isinstance(rows, slice):
+                rows = range(*rows.indices(self.messages))
+            return self.getDataBySeek(pl.asarray(rows) + self.arrayStart, pl.asarray(fieldIdx) + self.arrayStart)
+        if isinstance(rows, slice):
+            values = self.data[rows][:,fieldIdx]
+        else:
+            values = self.data[pl.ix_(rows,fieldIdx)]
+        if profiling.report is not None:
+            profiling.report.addRead(self.filename, 0, self.getReadBytes(values.shape[0], values.shape[1]))
+        return pl.asarray(values)
+
+    def getReadBytes(self, messages, fields):
+    # Description: bytes of the file read to get fields of messages, whole
+    # messages as the fields of a message are stored together
+        return messages * self.messageLength
+
     def getCommonIntStart(self,dblfile):
     # Description: gets the earliest common whole integer time
     #
@@ -309,6 +891,9 @@ class dataFile():
     # Inputs: time - time to interpolate the value for
     #
     # Output: value - the interpolated value
+        if self.data is not None:
+            return float(self.interpByTimes([time],[field])[0,0])
+
         # fractional (float) message number
         exactMsg = self.getPreciseMsgNumByTime(time)
         # get the message number before and after
@@ -339,6 +924,488 @@ class dataFile():
             # throw error
             print "can't interpolate, time outside file extents."
 
+    def interpByTimes(self, times, fields, angleFields = (), hermite = False, window = None):
+    # Description: interpolates a set of fields at a vector of times in one
+    # pass, the bracketing messages of every time are found and read with
+    # two bulk reads.
+    #
+    # Inputs: times - list or array of times to interpolate at
+    #         fields - list of fields to interpolate
+    #         angleFields - fields interpolated along the shortest arc so they
+    #                       don't break where they wrap at +/-pi (e.g.
+    #                       SBET_ANGLE_FIELDS for roll, pitch, heading, wander)
+    #         hermite - interpolate lat, lon and alt with a cubic Hermite
+    #                   spline using the velocity fields as the derivatives,
+    #                   only for standard navigation record files (sbet, vnav)
+    #         window - optional message range, see getBracketingMsgNumsByTime
+    #
+    # Output: values - 2D array (times x fields) of interpolated values
+        fields = list(fields)
+        leftMsgNums, rightMsgNums, fraction = self.getInterpFractionsByTime(times, window)
+
+        positionFields = [SBET_FIELDS["lat"], SBET_FIELDS["lon"], SBET_FIELDS["alt"]]
+        readFields = set(fields)
+        if hermite:
+            if self.fields < SBET_FIELDS["wander"]:
+                raise IOError(0,"Hermite interpolation requires the standard navigation record.",self.filename)
+            readFields.update(positionFields)
+            readFields.update([SBET_FIELDS["xVel"], SBET_FIELDS["yVel"], SBET_FIELDS["zVel"], SBET_FIELDS["wander"]])
+        readFields = sorted(readFields)
+        col = dict((field, i) for i, field in enumerate(readFields))
+
+        fieldIdx = self.getFieldIndexes(readFields)
+        leftData = self.readBlock(leftMsgNums - self.arrayStart, fieldIdx)
+        rightData = self.readBlock(rightMsgNums - self.arrayStart, fieldIdx)
+
+        values = pl.zeros((len(fraction),len(fields)),dtype=pl.float64)
+        for i, field in enumerate(fields):
+            left = leftData[:,col[field]]
+            right = rightData[:,col[field]]
+            if field in angleFields:
+                values[:,i] = interpAngle(left, right, fraction)
+            else:
+                values[:,i] = left + fraction * (right - left)
+
+        if hermite:
+            span = self.getTimesAt(rightMsgNums) - self.getTimesAt(leftMsgNums)
+            position = hermitePosition(leftData, rightData, readFields, fraction, span)
+            for i, field in enumerate(fields):
+                if field in positionFields:
+                    values[:,i] = position[field]
+
+        return values
+
+    def getBlockIndex(self, blockMessages = BLOCK_INDEX_MESSAGES):
+    # Description: gets the block summary index (zone map) of the file, the
+    # min, max, sum, sum of squares of every field and the message count for
+    # every block of blockMessages messages. The index is saved next to the
+    # file (BLOCK_INDEX_SUFFIX) and rebuilt when the file size or modified
+    # time no longer match.
+    #
+    # Inputs: blockMessages - messages per block
+    #
+    # Output: index - dictionary of "min", "max", "sum", "sumsq" (blocks x
+    #         fields arrays), "count" (blocks) and "blockMessages"
+        if self.blockIndex is not None and self.blockIndex["blockMessages"] == blockMessages:
+            return self.blockIndex
+
+        sidecar = self.filename + BLOCK_INDEX_SUFFIX
+        signature = pl.array(fileSignature(self.filename) + [self.fields, blockMessages], dtype=pl.float64)
+        index = None
+        try:
+            saved = pl.load(sidecar)
+            if (saved["signature"] == signature).all():
+                index = dict((key, saved[key]) for key in saved.files)
+            saved.close()
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+        if index is None:
+            index = self.buildBlockIndex(blockMessages)
+            index["signature"] = signature
+            saveSidecar(sidecar, index)
+
+        index["blockMessages"] = blockMessages
+        self.blockIndex = index
+        return index
+
+    def buildBlockIndex(self, blockMessages = BLOCK_INDEX_MESSAGES):
+    # Description: builds the block summary index in one pass over the file,
+    # see getBlockIndex
+    #
+    # Inputs: blockMessages - messages per block
+    #
+    # Output: index - dictionary of "min", "max", "sum", "sumsq" and "count"
+        blocks = int(math.ceil(float(self.messages) / blockMessages))
+        index = {"min": pl.zeros((blocks,self.fields)), "max": pl.zeros((blocks,self.fields)),
+                 "sum": pl.zeros((blocks,self.fields)), "sumsq": pl.zeros((blocks,self.fields)),
+                 "count": pl.zeros(blocks,dtype=pl.int64)}
+
+        chunkBlocks = max(READ_CHUNK_MESSAGES // blockMessages, 1)
+        for first in xrange(0, blocks, chunkBlocks):
+            last = min(first + chunkBlocks, blocks)
+            msgStart = first * blockMessages
+            msgEnd = min(last * blockMessages, self.messages)
+            rows = pl.asarray(self.getRows(msgStart + self.arrayStart, msgEnd + self.arrayStart))
+            full = (msgEnd - msgStart) // blockMessages
+            parts = []
+            if full:
+                parts.append((slice(first, first + full), rows[:full * blockMessages].reshape((full,blockMessages,self.fields))))
+            if full < last - first:
+                parts.append((slice(first + full, last), rows[full * blockMessages:].reshape((1,-1,self.fields))))
+            for blockSlice, data in parts:
+                index["min"][blockSlice] = data.min(axis=1)
+                index["max"][blockSlice] = data.max(axis=1)
+                index["sum"][blockSlice] = data.sum(axis=1)
+                index["sumsq"][blockSlice] = (data * data).sum(axis=1)
+                index["count"][blockSlice] = data.shape[1]
+        return index
+
+    def getSegmentIndex(self):
+    # Description: gets the uniform rate segment index of the file, the
+    # message runs logged at one rate between gaps and rate changes. The
+    # index is saved next to the file (SEGMENT_INDEX_SUFFIX) and rebuilt
+    # when the file size or modified time no longer match.
+    #
+    # Output: index - dictionary of segment arrays, "msgStart" (0 based row
+    #         of the first message), "count", "startTime", "endTime", "inc"
+    #         (seconds between messages, 0 for single message segments) and
+    #         "gapBefore" (the segment starts after a gap)
+        if self.segmentIndex is not None:
+            return self.segmentIndex
+
+        sidecar = self.filename + SEGMENT_INDEX_SUFFIX
+        signature = pl.array(fileSignature(self.filename) + [self.fields, SEGMENT_GAP_PERIODS, SEGMENT_RATE_TOLERANCE,
+                                                             SEGMENT_WINDOW_STEPS], dtype=pl.float64)
+        index = None
+        try:
+            saved = pl.load(sidecar)
+            if pl.array_equal(saved["signature"], signature):
+                index = dict((key, saved[key]) for key in saved.files)
+            saved.close()
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+        if index is None:
+            index = self.buildSegmentIndex()
+            index["signature"] = signature
+            saveSidecar(sidecar, index)
+
+        self.segmentIndex = index
+        return index
+
+    def buildSegmentIndex(self):
+    # Description: builds the segment index in one vectorized pass over the
+    # time field, READ_CHUNK_MESSAGES at a time, see getSegmentIndex. Steps
+    # are compared with the local period, the median of the
+    # SEGMENT_WINDOW_STEPS steps before and after them, not with single
+    # neighbouring steps. A rate change is where the median of the steps
+    # around a message changes and the mean step (which jitter doesn't move)
+    # of the windows either side of it differs too. Segments at the same
+    # rate are then merged.
+    #
+    # Output: index - dictionary of segment arrays
+        times = self.getColumn(self.arrayStart)
+        window = SEGMENT_WINDOW_STEPS
+        half = window // 2
+        lastStep = self.messages - 2 # steps are between message k and k + 1
+        starts = [pl.zeros(1, dtype=pl.int64)]
+        gapStarts = []
+        for first in xrange(0, lastStep + 1, READ_CHUNK_MESSAGES):
+            last = min(first + READ_CHUNK_MESSAGES, lastStep + 1)
+            # steps first - 1 to last with two windows of context either
+            # side, NaN past the ends of the file
+            lo = first - 2 * window - 2
+            hi = last + 2 * window
+            steps = pl.empty(hi - lo)
+            steps.fill(pl.nan)
+            readLo = max(lo, 0)
+            readHi = min(hi, lastStep + 1)
+            steps[readLo - lo:readHi - lo] = pl.diff(pl.asarray(times[readLo:readHi + 1], dtype=pl.float64))
+            # medians[i] is the median of the window of steps starting at
+            # lo + i, central[i] of the window centred on step lo + i
+            medians = rollingMedian(steps, window)
+            central = pl.empty(len(steps))
+            central.fill(pl.nan)
+            central[half:half + len(medians)] = medians
+            # running sums of the steps that aren't gaps for the window means
+            with pl.errstate(invalid='ignore'):
+                regular = (steps > 0) & (steps <= SEGMENT_GAP_PERIODS * central)
+            sums = pl.concatenate(([0.0], pl.cumsum(pl.where(regular, steps, 0.0))))
+            counts = pl.concatenate(([0], pl.cumsum(regular)))
+
+            k = pl.arange(first - 1, last, dtype=pl.int64)
+            at = k - lo
+            step = steps[at]
+            before = medians[at - window]
+            after = medians[at + 1]
+            before = pl.where(pl.isnan(before), after, before) # the ends only have steps on one side
+            after = pl.where(pl.isnan(after), before, after)
+            with pl.errstate(invalid='ignore', divide='ignore'):
+                meanBefore = (sums[at] - sums[at - window]) / (counts[at] - counts[at - window])
+                meanAfter = (sums[at + 1 + window] - sums[at + 1]) / (counts[at + 1 + window] - counts[at + 1])
+                # a late or early timestamp makes a long step next to a short
+                # one, a gap is a step whose extra time the steps either side
+                # of it don't make up
+                made = step + pl.fmin(steps[at - 1], steps[at + 1]) - central[at]
+                gap = ((step > SEGMENT_GAP_PERIODS * before) & (step > SEGMENT_GAP_PERIODS * after) &
+                       (made > SEGMENT_GAP_PERIODS * central[at])) | (step <= 0)
+                change = (pl.absolute(central[at] - central[at - 1]) > SEGMENT_RATE_TOLERANCE * central[at - 1]) & \
+                         (pl.absolute(meanAfter - meanBefore) > SEGMENT_RATE_TOLERANCE * meanBefore)
+            change = change[1:] & ~gap[1:] & ~gap[:-1]
+            gap = gap[1:]
+            stepIdx = k[1:]
+            # a gap step k starts a segment at message k + 1, a new rate at message k
+            gapStarts.append(stepIdx[gap] + 1)
+            starts.append(stepIdx[gap] + 1)
+            starts.append(stepIdx[change & (stepIdx > 0)])
+        starts = pl.unique(pl.concatenate(starts))
+        gapStarts = pl.concatenate(gapStarts) if gapStarts else pl.zeros(0, dtype=pl.int64)
+        gapBefore = pl.in1d(starts, gapStarts)
+
+        # merge neighbouring segments without a gap between them whose rates
+        # agree, a segment shorter than the window takes the rate of the one
+        # before it
+        count = pl.diff(pl.concatenate((starts, [self.messages])))
+        startTime = pl.asarray(times[starts], dtype=pl.float64)
+        endTime = pl.asarray(times[starts + count - 1], dtype=pl.float64)
+        keep = [0]
+        for i in xrange(1, len(starts)):
+            if not gapBefore[i]:
+                merged = keep[-1]
+                mergedInc = (endTime[i - 1] - startTime[merged]) / max(starts[i] - 1 - starts[merged], 1)
+                inc = (endTime[i] - startTime[i]) / max(count[i] - 1, 1)
+                if count[i] < window or starts[i] - starts[merged] < window or \
+                        abs(inc - mergedInc) <= SEGMENT_RATE_TOLERANCE * mergedInc:
+                    continue
+            keep.append(i)
+        starts = starts[keep]
+        gapBefore = gapBefore[keep]
+
+        count = pl.diff(pl.concatenate((starts, [self.messages])))
+        ends = starts + count - 1
+        startTime = pl.asarray(times[starts], dtype=pl.float64)
+        endTime = pl.asarray(times[ends], dtype=pl.float64)
+        inc = pl.zeros(len(starts))
+        several = count > 1
+        inc[several] = (endTime[several] - startTime[several]) / (count[several] - 1)
+        return {"msgStart": starts, "count": count, "startTime": startTime, "endTime": endTime, "inc": inc,
+                "gapBefore": gapBefore}
+
+    def getSegments(self):
+    # Description: the uniform rate segments of the file
+    #
+    # Output: segments - dictionary of arrays, "msgStart" (message number),
+    #         "startTime", "endTime", "rate" (messages a second, 0 for single
+    #         message segments), "count" and "gapBefore"
+        index = self.getSegmentIndex()
+        rate = pl.zeros(len(index["inc"]))
+        rate[index["inc"] > 0] = 1.0 / index["inc"][index["inc"] > 0]
+        return OrderedDict([("msgStart", index["msgStart"] + self.arrayStart), ("startTime", index["startTime"]),
+                            ("endTime", index["endTime"]), ("rate", rate), ("count", index["count"]),
+                            ("gapBefore", index["gapBefore"])])
+
+    def getGaps(self):
+    # Description: the gaps in the file, from the segment index
+    #
+    # Output: gaps - dictionary of arrays, "start" (time of the last message
+    #         before the gap), "end" (time of the first message after it),
+    #         "duration" and "msgNum" (first message after the gap)
+        index = self.getSegmentIndex()
+        after = pl.flatnonzero(index["gapBefore"])
+        start = index["endTime"][after - 1]
+        end = index["startTime"][after]
+        return OrderedDict([("start", start), ("end", end), ("duration", end - start),
+                            ("msgNum", index["msgStart"][after] + self.arrayStart)])
+
+    def getSegmentMsgNumsByTime(self, times):
+    # Description: predicts the fractional message number of each time from
+    # its segment, a binary search over the segment start times and one
+    # arithmetic step, exact for messages logged at a uniform rate. Times
+    # between segments are interpolated between the last message of one and
+    # the first of the next unless there is a gap between them.
+    #
+    # Inputs: times - list or array of times
+    #
+    # Output: messageNumbers - array of fractional message numbers
+    #         inGap - array, True where the time falls in a gap
+        index = self.getSegmentIndex()
+        times = pl.asarray(times, dtype=pl.float64)
+        seg = (pl.searchsorted(index["startTime"], times, 'right') - 1).clip(0, len(index["count"]) - 1)
+        offset = pl.zeros(len(times))
+        uniform = index["inc"][seg] > 0
+        offset[uniform] = (times[uniform] - index["startTime"][seg[uniform]]) / index["inc"][seg[uniform]]
+        offset = offset.clip(0, index["count"][seg] - 1)
+
+        # past the last message of the segment, before the next one
+        past = (times > index["endTime"][seg]) & (seg < len(index["count"]) - 1)
+        following = (seg + 1).clip(0, len(index["count"]) - 1)
+        inGap = past & index["gapBefore"][following]
+        between = past & ~inGap
+        span = index["startTime"][following[between]] - index["endTime"][seg[between]]
+        offset[between] += (times[between] - index["endTime"][seg[between]]) / span
+        return index["msgStart"][seg] + offset + self.arrayStart, inGap
+
+    def getIndexMsgRangeByTime(self, startTime = None, endTime = None):
+    # Description: finds the messages from startTime to endTime using the
+    # block index, only the time field of the (at most two) blocks holding
+    # the ends is read
+    #
+    # Inputs: startTime - first time (None for the start of the file)
+    #         endTime - last time (None for the end of the file)
+    #
+    # Output: (msgStart, msgEnd) - array indexes (0 is first message) of the
+    #         first message at or after startTime and one past the last
+    #         message at or before endTime
+        index = self.getBlockIndex()
+        blockMessages = index["blockMessages"]
+
+        def firstAfter(time, side):
+            # first message with time > (side right) or >= (side left) time
+            if side == "left":
+                block = pl.searchsorted(index["max"][:,0], time, "left")
+            else:
+                block = pl.searchsorted(index["max"][:,0], time, "right")
+            if block >= len(index["count"]):
+                return self.messages
+            msgStart = block * blockMessages
+            times = self.readBlock(slice(msgStart, msgStart + index["count"][block]), [0])[:,0]
+            return msgStart + pl.searchsorted(times, time, side)
+
+        msgStart = 0
+        msgEnd = self.messages
+        if startTime is not None:
+            msgStart = firstAfter(startTime, "left")
+        if endTime is not None:
+            msgEnd = firstAfter(endTime, "right")
+        return msgStart, max(msgStart, msgEnd)
+
+    def getFieldSummary(self, field, startTime = None, endTime = None):
+    # Description: summary statistics of a field for the whole file or a time
+    # window, answered from the block index plus at most two partial blocks
+    #
+    # Inputs: field - field number
+    #         startTime - first time of the window (None for start of file)
+    #         endTime - last time of the window (None for end of file)
+    #
+    # Output: summary - dictionary of count, min, max, sum, sumsq, mean and
+    #         std (population)
+        index = self.getBlockIndex()
+        blockMessages = index["blockMessages"]
+        col = self.getFieldIndexes([field])[0]
+        msgStart, msgEnd = self.getIndexMsgRangeByTime(startTime, endTime)
+
+        # blocks entirely within the window
+        blockStart = -(-msgStart // blockMessages)
+        blockEnd = msgEnd // blockMessages
+        if msgEnd == self.messages:
+            blockEnd = len(index["count"])
+
+        parts = []
+        if blockStart < blockEnd:
+            blocks = slice(blockStart, blockEnd)
+            parts.append((index["count"][blocks].sum(), index["min"][blocks,col].min(), index["max"][blocks,col].max(),
+                          index["sum"][blocks,col].sum(), index["sumsq"][blocks,col].sum()))
+            partials = [(msgStart, blockStart * blockMessages), (min(blockEnd * blockMessages, msgEnd), msgEnd)]
+        else:
+            partials = [(msgStart, msgEnd)]
+        for first, last in partials:
+            if last > first:
+                values = self.readBlock(slice(first, last), [col])[:,0]
+                parts.append((len(values), values.min(), values.max(), values.sum(), (values * values).sum()))
+
+        summary = OrderedDict([("count", 0), ("min", pl.nan), ("max", pl.nan), ("sum", 0.0), ("sumsq", 0.0),
+                               ("mean", pl.nan), ("std", pl.nan)])
+        if parts:
+            summary["count"] = int(sum(part[0] for part in parts))
+            summary["min"] = float(min(part[1] for part in parts))
+            summary["max"] = float(max(part[2] for part in parts))
+            summary["sum"] = float(sum(part[3] for part in parts))
+            summary["sumsq"] = float(sum(part[4] for part in parts))
+        if summary["count"]:
+            summary["mean"] = summary["sum"] / summary["count"]
+            summary["std"] = math.sqrt(max(summary["sumsq"] / summary["count"] - summary["mean"]**2, 0))
+        return summary
+
+    def countWhere(self, field, comparator, value, startTime = None, endTime = None):
+    # Description: counts the messages where the field compares true to value
+    # (e.g. how long PDOP was above 3), blocks the index shows are entirely in
+    # or out are not read
+    #
+    # Inputs: field - field number
+    #         comparator - "<", "<=", ">", ">=", "==" or "!=" (see COMPARATORS)
+    #         value - value to compare with
+    #         startTime - first time of the window (None for start of file)
+    #         endTime - last time of the window (None for end of file)
+    #
+    # Output: count - number of messages, multiply by timeInc for seconds
+        index = self.getBlockIndex()
+        blockMessages = index["blockMessages"]
+        col = self.getFieldIndexes([field])[0]
+        compare = COMPARATORS[comparator]
+        msgStart, msgEnd = self.getIndexMsgRangeByTime(startTime, endTime)
+
+        blockMin = index["min"][:,col]
+        blockMax = index["max"][:,col]
+        # the block is true everywhere when its worst value is, nowhere when its best value isn't
+        if comparator in ("<", "<="):
+            allTrue = compare(blockMax, value)
+            noneTrue = ~compare(blockMin, value)
+        elif comparator in ("==", "!="):
+            constant = (blockMin == value) & (blockMax == value)
+            outside = (blockMin > value) | (blockMax < value)
+            allTrue, noneTrue = (constant, outside) if comparator == "==" else (outside, constant)
+        else:
+            allTrue = compare(blockMin, value)
+            noneTrue = ~compare(blockMax, value)
+
+        count = 0
+        for block in xrange(msgStart // blockMessages, -(-msgEnd // blockMessages)):
+            first = max(block * blockMessages, msgStart)
+            last = min(block * blockMessages + index["count"][block], msgEnd)
+            if last <= first or noneTrue[block]:
+                continue
+            if allTrue[block]:
+                count += last - first
+            else:
+                values = self.readBlock(slice(first, last), [col])[:,0]
+                count += int(compare(values, value).sum())
+        return count
+
+    def getStatistics(self, fields, startTime = None, endTime = None, blanking = 0, msgInc = 1, skipNaN = False,
+                      blockMessages = READ_CHUNK_MESSAGES):
+    # Description: count, min, max, mean, variance and the times of the min
+    # and max of fields in one pass over the file, read blockMessages at a
+    # time so memory stays flat (see runningStatistics)
+    #
+    # Inputs: fields - list of field numbers
+    #         startTime - first time (None for start of file)
+    #         endTime - last time (None for end of file)
+    #         blanking - seconds left out after startTime and before endTime
+    #         msgInc - message step
+    #         skipNaN - leave out messages with NaN in any of the fields
+    #         blockMessages - messages read at a time
+    #
+    # Output: statistics - runningStatistics of the fields
+        statistics = runningStatistics(fields)
+        if startTime is None:
+            startTime = self.startTime
+        if endTime is None:
+            endTime = self.endTime
+        for times, values in self.readBlocks(fields, startTime + blanking, endTime - blanking, msgInc, blockMessages):
+            if skipNaN:
+                keep = ~pl.isnan(values).any(axis=1)
+                times, values = times[keep], values[keep]
+            statistics.add(times, values)
+        return statistics
+
+    def readBlocks(self, fields, startTime = None, endTime = None, msgInc = 1, blockMessages = READ_CHUNK_MESSAGES):
+    # Description: reads fields of the messages from startTime to endTime a
+    # block at a time, only the messages around the window are read
+    #
+    # Inputs: fields - list of field numbers
+    #         startTime - first time (None for start of file)
+    #         endTime - last time (None for end of file)
+    #         msgInc - message step
+    #         blockMessages - messages read at a time
+    #
+    # Output: generator of (times, values) blocks, values is (messages x
+    #         fields)
+        startTime = self.startTime if startTime is None else max(startTime, self.startTime)
+        endTime = self.endTime if endTime is None else min(endTime, self.endTime)
+        if endTime < startTime:
+            return
+
+        msgStart, msgEnd = self.getMsgWindowByTime(startTime, endTime)
+        fieldIdx = self.getFieldIndexes([self.arrayStart] + list(fields))
+        step = max(blockMessages // msgInc, 1) * msgInc
+        for first in xrange(msgStart - self.arrayStart, msgEnd - self.arrayStart, step):
+            block = self.readBlock(slice(first, min(first + step, msgEnd - self.arrayStart), msgInc), fieldIdx)
+            keep = (block[:,0] >= startTime) & (block[:,0] <= endTime)
+            if not keep.all():
+                block = block[keep]
+            yield block[:,0], block[:,1:]
+
     def __str__(self):
         string = ""
         for key in self.__dict__:
@@ -346,6 +1413,530 @@ class dataFile():
 
         return string
 
+class runningStatistics():
+    """
+    Count, min, max, mean and variance of a set of fields accumulated a
+    block of messages at a time, blocks (and other runningStatistics) are
+    combined with Chan's parallel update of the mean and sum of squared
+    differences so the results are numerically stable and don't depend on
+    how the messages are split. The times of the min and max are kept.
+    """
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.count = 0
+        self.min = pl.zeros(len(self.fields)) + pl.nan
+        self.max = pl.zeros(len(self.fields)) + pl.nan
+        self.minTime = pl.zeros(len(self.fields)) + pl.nan
+        self.maxTime = pl.zeros(len(self.fields)) + pl.nan
+        self.mean = pl.zeros(len(self.fields))
+        self.m2 = pl.zeros(len(self.fields))
+
+    def add(self, times, values):
+        """
+        Adds a block of messages, values is (messages x fields)
+        """
+        values = pl.asarray(values, dtype=pl.float64)
+        if len(values) == 0:
+            return
+        block = runningStatistics(self.fields)
+        block.count = len(values)
+        block.mean = values.mean(axis=0)
+        block.m2 = ((values - block.mean) ** 2).sum(axis=0)
+        minIdx = values.argmin(axis=0)
+        maxIdx = values.argmax(axis=0)
+        columns = pl.arange(len(self.fields))
+        block.min = values[minIdx, columns]
+        block.max = values[maxIdx, columns]
+        block.minTime = pl.asarray(times, dtype=pl.float64)[minIdx]
+        block.maxTime = pl.asarray(times, dtype=pl.float64)[maxIdx]
+        self.merge(block)
+
+    def merge(self, other):
+        """
+        Adds the messages of another runningStatistics of the same fields
+        """
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count = other.count
+            self.min, self.max = other.min.copy(), other.max.copy()
+            self.minTime, self.maxTime = other.minTime.copy(), other.maxTime.copy()
+            self.mean, self.m2 = other.mean.copy(), other.m2.copy()
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (float(other.count) / count)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (float(self.count) * other.count / count)
+        self.count = count
+        lower = other.min < self.min
+        self.min = pl.where(lower, other.min, self.min)
+        self.minTime = pl.where(lower, other.minTime, self.minTime)
+        higher = other.max > self.max
+        self.max = pl.where(higher, other.max, self.max)
+        self.maxTime = pl.where(higher, other.maxTime, self.maxTime)
+
+    def getVariance(self):
+        """
+        Population variance (like pl.var) of every field
+        """
+        if self.count == 0:
+            return pl.zeros(len(self.fields)) + pl.nan
+        return self.m2 / self.count
+
+    def getResults(self):
+        """
+        Dictionary of field number to count, min, max, mean, variance, std
+        (population), min_time and max_time
+        """
+        variance = self.getVariance()
+        results = OrderedDict()
+        for i, field in enumerate(self.fields):
+            results[field] = OrderedDict([("count", self.count), ("min", float(self.min[i])), ("max", float(self.max[i])),
+                                          ("mean", float(self.mean[i]) if self.count else pl.nan),
+                                          ("variance", float(variance[i])), ("std", float(math.sqrt(variance[i]))),
+                                          ("min_time", float(self.minTime[i])), ("max_time", float(self.maxTime[i]))])
+        return results
+
+class columnStack():
+    """
+    Read only (messages x fields) view of per field column arrays, indexing
+    only reads the columns selected
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self.shape = (len(columns[0]), len(columns))
+        self.dtype = columns[0].dtype
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        rows, cols = key
+        if isinstance(cols, (int, long, pl.integer)):
+            return self.columns[cols][rows]
+        if isinstance(cols, slice):
+            cols = range(*cols.indices(len(self.columns)))
+        cols = pl.asarray(cols).ravel()
+        if isinstance(rows, pl.ndarray) and rows.ndim > 1: # pl.ix_ rows
+            rows = rows.ravel()
+        if isinstance(rows, (int, long, pl.integer)):
+            return pl.array([self.columns[col][rows] for col in cols], dtype=self.dtype)
+        values = [pl.asarray(self.columns[col][rows]) for col in cols]
+        if not values:
+            return pl.zeros((len(pl.arange(self.shape[0])[rows]), 0), dtype=self.dtype)
+        return pl.column_stack(values)
+
+class columnarFile(dataFile):
+    """
+    Reads a data file from its columnar copy (see convertToColumnar), one
+    .npy file per field memory mapped on its own so reading a field only
+    reads that field. Behaves like a dataFile of the original file.
+    """
+    def __init__(self, filename, fields = None):
+    # Description: class constructor
+    #
+    # Inputs: filename - path to the original POSPAC file, the columnar copy
+    #                    is read from filename + COLUMNAR_SUFFIX
+    #         fields - expected number of fields, None to take the count of
+    #                  the columnar copy
+        self.filename = filename
+        self.storeDir = filename + COLUMNAR_SUFFIX
+        self.meta = readColumnarMeta(self.storeDir)
+        if self.meta is None:
+            raise IOError(0,"No columnar copy of the file.",filename)
+        if fields is not None and fields != self.meta["fields"]:
+            raise IOError(0,"Columnar copy has %s fields, not %s." % (self.meta["fields"],fields),filename)
+        self.fields = self.meta["fields"]
+        self.messageLength = self.fieldLength * self.fields
+        self.size = self.meta["signature"][0]
+        self.messages = self.meta["messages"]
+        self.partial = False
+        self.useMmap = True
+        self.data = None
+        self.timeColumn = None
+        self.blockIndex = None
+        self.segmentIndex = None
+        self.mapFile()
+
+        self.startTime = round(self.getField(self.arrayStart,self.arrayStart),3)
+        self.updateTimeBounds()
+
+    def mapFile(self):
+    # Description: maps every column file, self.data is a columnStack of them
+        columns = [pl.load(columnFilename(self.storeDir, field), mmap_mode='r')
+                   for field in xrange(self.arrayStart, self.fields + self.arrayStart)]
+        self.data = columnStack(columns)
+
+    def refresh(self):
+    # Description: columnar copies don't grow, see openColumnarFile
+        msgEnd = self.messages + self.arrayStart
+        return (msgEnd, msgEnd)
+
+    def readBlock(self, rows, fieldIdx):
+    # Description: reads the selected rows of the selected columns only
+    #
+    # Inputs: rows - slice or array of row indexes (0 is first message)
+    #         fieldIdx - array of column indexes (0 is first field)
+    #
+    # Output: values - 2D array (copy) of the selection
+        values = self.data[rows, fieldIdx]
+        if profiling.report is not None:
+            profiling.report.addRead(self.filename, 0, self.getReadBytes(values.shape[0], values.shape[1]))
+        return values
+
+    def getReadBytes(self, messages, fields):
+    # Description: bytes read to get fields of messages, only the fields
+        return messages * fields * self.fieldLength
+
+def findIntervals(times, condition, values = None, worst = pl.maximum, minDuration = 0, timeInc = 0, breaks = None):
+    """
+    Run length detection of the intervals where condition (boolean array)
+    holds, vectorized over the whole array. breaks are indexes that always
+    start a new interval (e.g. after gaps in the data). The duration of an
+    interval is the time from its first to its last message plus timeInc,
+    intervals shorter than minDuration are dropped.
+
+    Returns a dictionary of arrays, "start" and "end" (times of the first and
+    last message), "duration", "count" (messages), "first" and "last" (0
+    based indexes) and, with values, "worst" (worst.reduce of values over
+    the interval, e.g. pl.maximum for the largest PDOP)
+    """
+    condition = pl.asarray(condition, dtype=bool)
+    before = pl.concatenate(([False], condition[:-1]))
+    after = pl.concatenate((condition[1:], [False]))
+    if breaks is not None and len(breaks):
+        breaks = pl.asarray(breaks)
+        before[breaks] = False
+        after[breaks - 1] = False
+    first = pl.flatnonzero(condition & ~before)
+    last = pl.flatnonzero(condition & ~after)
+
+    start = pl.asarray(times[first], dtype=pl.float64)
+    end = pl.asarray(times[last], dtype=pl.float64)
+    duration = end - start + timeInc
+    keep = duration >= minDuration
+
+    intervals = OrderedDict([("start", start[keep]), ("end", end[keep]), ("duration", duration[keep]),
+                             ("count", (last - first + 1)[keep]), ("first", first[keep]), ("last", last[keep])])
+    if values is not None:
+        first, last = first[keep], last[keep]
+        if len(first):
+            # reduce over [first, last + 1) pairs, the segments between intervals are dropped
+            bounds = pl.column_stack((first, last + 1)).ravel()
+            if bounds[-1] >= len(condition):
+                bounds = bounds[:-1]
+            intervals["worst"] = pl.asarray(worst.reduceat(values, bounds)[::2], dtype=pl.float64)
+        else:
+            intervals["worst"] = pl.zeros(0)
+    return intervals
+
+class runningIntervals():
+    """
+    findIntervals over a file read a block at a time, runs that reach the end
+    of a block are carried into the next so only the intervals are kept.
+    Blocks are added in time order, a step of more than maxGap seconds
+    between messages ends an interval.
+    """
+    def __init__(self, worst = pl.maximum, minDuration = 0, timeInc = 0, maxGap = None):
+        self.worst = worst
+        self.minDuration = minDuration
+        self.fixedGap = maxGap
+        self.setTimeInc(timeInc)
+        self.lastTime = None
+        # open run as [start, end, count, worst]
+        self.open = None
+        self.closed = []
+
+    def setTimeInc(self, timeInc):
+        """
+        Updates the message period, e.g. of a file still being written
+        """
+        self.timeInc = timeInc
+        self.maxGap = self.fixedGap if self.fixedGap is not None else INTERVAL_GAP_PERIODS * timeInc
+
+    def add(self, times, condition, values):
+        if len(times) == 0:
+            return
+        breaks = pl.flatnonzero(pl.diff(times) > self.maxGap) + 1
+        runs = findIntervals(times, condition, values, self.worst, 0, 0, breaks)
+        runs = [[runs["start"][i], runs["end"][i], runs["count"][i], runs["worst"][i], runs["first"][i], runs["last"][i]]
+                for i in xrange(len(runs["start"]))]
+
+        if self.open is not None:
+            if runs and runs[0][4] == 0 and times[0] - self.lastTime <= self.maxGap:
+                first = runs.pop(0)
+                runs.insert(0, [self.open[0], first[1], self.open[2] + first[2],
+                                self.worst(self.open[3], first[3]), 0, first[5]])
+            else:
+                self.closed.append(self.open)
+            self.open = None
+
+        if runs and runs[-1][5] == len(times) - 1:
+            self.open = runs.pop()[:4]
+        self.closed.extend(run[:4] for run in runs)
+        self.lastTime = times[-1]
+
+    def getIntervals(self):
+        """
+        The intervals of the blocks added so far (including one still open
+        at the end of the last block) at least minDuration long, a
+        dictionary of "start", "end", "duration", "count" and "worst" arrays
+        """
+        runs = self.closed + ([self.open] if self.open is not None else [])
+        runs = pl.array(runs, dtype=pl.float64).reshape((len(runs), 4))
+        duration = runs[:,1] - runs[:,0] + self.timeInc
+        keep = duration >= self.minDuration
+        return OrderedDict([("start", runs[keep,0]), ("end", runs[keep,1]), ("duration", duration[keep]),
+                            ("count", runs[keep,2].astype(pl.int64)), ("worst", runs[keep,3])])
+
+def rollingMedian(values, window, blockRows = 1 << 16):
+    """
+    Medians of the windows of values, element i is the median of
+    values[i:i + window] ignoring NaN (NaN when the whole window is), computed
+    blockRows windows at a time from a strided view
+    """
+    values = pl.ascontiguousarray(values, dtype=pl.float64)
+    medians = pl.empty(max(len(values) - window + 1, 0))
+    medians.fill(pl.nan)
+    for first in xrange(0, len(medians), blockRows):
+        rows = min(blockRows, len(medians) - first)
+        windows = as_strided(values[first:], (rows, window), (values.strides[0],) * 2)
+        missing = pl.isnan(windows)
+        whole = ~missing.any(axis=1)
+        part = ~whole & ~missing.all(axis=1) # windows at the ends, nanmedian is much slower
+        block = medians[first:first + rows]
+        if whole.all():
+            block[:] = pl.median(windows, axis=1)
+        else:
+            block[whole] = pl.median(windows[whole], axis=1)
+            if part.any():
+                block[part] = pl.nanmedian(windows[part], axis=1)
+    return medians
+
+def fileSignature(filename):
+    """
+    Size and modified time of a file, used to check that indexes saved next
+    to data files are still up to date
+    """
+    return [os.path.getsize(filename), os.path.getmtime(filename)]
+
+def saveSidecar(filename, arrays):
+    """
+    Saves a dictionary of arrays next to a data file (numpy .npz), written to
+    a temporary file first so readers never load part of it. Folders that
+    can't be written to (e.g. read only shares) are skipped, the index is
+    just rebuilt next time.
+    """
+    if not os.access(os.path.dirname(os.path.abspath(filename)), os.W_OK):
+        return
+    tempFilename = filename + ".tmp%s" % os.getpid()
+    try:
+        fid = open(tempFilename, 'wb')
+        pl.savez(fid, **arrays)
+        fid.close()
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tempFilename, filename)
+    except (IOError, OSError):
+        if os.path.exists(tempFilename):
+            try:
+                os.remove(tempFilename)
+            except OSError:
+                pass
+
+def columnFilename(storeDir, field):
+    return os.path.join(storeDir, "field%02d.npy" % field)
+
+def readColumnarMeta(storeDir):
+    """
+    Returns the metadata of a columnar copy or None if there isn't a
+    complete one
+    """
+    try:
+        fid = open(os.path.join(storeDir, COLUMNAR_META), 'r')
+        meta = json.load(fid)
+        fid.close()
+    except (IOError, OSError, ValueError):
+        return None
+    return meta
+
+def convertToColumnar(filename, fields):
+    """
+    Writes the columnar copy of a data file, filename + COLUMNAR_SUFFIX, a
+    folder of one .npy file per field (field01.npy, ...) and COLUMNAR_META
+    with the size and modified time of the original, the field and message
+    counts and the time range. The file is read READ_CHUNK_MESSAGES at a
+    time and the copy is written to a temporary folder that is renamed into
+    place. Returns the columnarFile.
+    """
+    source = dataFile(filename, fields)
+    storeDir = filename + COLUMNAR_SUFFIX
+    tempDir = storeDir + ".tmp%s" % os.getpid()
+    if os.path.isdir(tempDir):
+        shutil.rmtree(tempDir, True)
+    os.makedirs(tempDir)
+    try:
+        columns = [open_memmap(columnFilename(tempDir, field), mode='w+', dtype=pl.float64, shape=(source.messages,))
+                   for field in xrange(source.arrayStart, fields + source.arrayStart)]
+        for msgStart in xrange(0, source.messages, READ_CHUNK_MESSAGES):
+            msgEnd = min(msgStart + READ_CHUNK_MESSAGES, source.messages)
+            rows = pl.asarray(source.getRows(msgStart + source.arrayStart, msgEnd + source.arrayStart))
+            for col in xrange(fields):
+                columns[col][msgStart:msgEnd] = rows[:,col]
+        for column in columns:
+            column.flush()
+        del columns
+
+        meta = OrderedDict([("signature", fileSignature(filename)), ("fields", fields), ("messages", source.messages),
+                            ("startTime", source.startTime), ("endTime", source.endTime), ("timeInc", source.timeInc)])
+        fid = open(os.path.join(tempDir, COLUMNAR_META), 'w')
+        json.dump(meta, fid, indent = 2)
+        fid.close()
+        del source
+
+        if os.path.isdir(storeDir):
+            shutil.rmtree(storeDir, True)
+        os.rename(tempDir, storeDir)
+    except (IOError, OSError):
+        shutil.rmtree(tempDir, True)
+        raise
+    return columnarFile(filename, fields)
+
+def openColumnarFile(filename, fields = None):
+    """
+    Returns the columnarFile of a data file when its columnar copy is up to
+    date (same size and modified time as the file), otherwise None
+    """
+    meta = readColumnarMeta(filename + COLUMNAR_SUFFIX)
+    if meta is None or meta["signature"] != fileSignature(filename):
+        return None
+    try:
+        return columnarFile(filename, fields)
+    except (IOError, OSError, ValueError):
+        return None
+
+def detectFieldCount(filepath, fieldCounts = DETECT_FIELD_COUNTS):
+    """
+    Detects the number of double fields per message of a POSPac data file.
+    The start of the file is read once and every candidate field count that
+    divides the file size evenly is scored on its time (first) field:
+    increasing, a plausible and consistent data rate, a plausible GPS time,
+    agreement with the last message of the file and no NaN, infinite or
+    denormal values in the messages. Multiples of the real field count score
+    as well as the real one so the smallest of the best scoring candidates
+    is picked.
+
+    Returns (fieldCount, confidence), confidence is the score of the picked
+    candidate from 0 to 1. Results are kept per file and reused until the
+    file size or modified time changes.
+    """
+    key = (os.path.abspath(filepath), os.path.getsize(filepath), os.path.getmtime(filepath))
+    if key in detectedFieldCounts:
+        return detectedFieldCounts[key]
+
+    size = key[1]
+    fieldLength = dataFile.fieldLength
+    values = size // fieldLength
+    if values == 0 or size % fieldLength:
+        raise Exception("Can't detect message field count.")
+
+    doubles = pl.memmap(filepath, dtype=pl.float64, mode='r', shape=(values,))
+    sample = pl.array(doubles[:min(values, max(fieldCounts) * DETECT_SAMPLE_MESSAGES)])
+    tiny = pl.finfo(pl.float64).tiny
+
+    scores = {}
+    for fieldCount in fieldCounts:
+        messages = values // fieldCount
+        if values % fieldCount or messages < 2:
+            continue
+        rows = sample[:(len(sample) // fieldCount) * fieldCount].reshape((-1, fieldCount))
+        if len(rows) < 2:
+            continue
+        with pl.errstate(invalid='ignore'):
+            finite = pl.isfinite(rows).all()
+            denormal = ((rows != 0) & (abs(rows) < tiny)).any()
+            if not finite or denormal:
+                continue
+
+            times = rows[:,0]
+            timeDiff = pl.diff(times)
+            timeInc = pl.median(timeDiff)
+            lastTime = doubles[(messages - 1) * fieldCount]
+            meanInc = (lastTime - times[0]) / (messages - 1)
+
+            checks = [(timeDiff > 0).mean(), # increasing
+                      float(1e-4 <= timeInc <= 10), # 0.1 Hz to 10 kHz
+                      (abs(timeDiff - timeInc) <= 0.5 * timeInc).mean(), # consistent rate
+                      float(0 <= times[0] and lastTime <= 8 * 86400), # GPS seconds of the week
+                      float(timeInc > 0 and 0.5 * timeInc <= meanInc <= 2 * timeInc)] # last message agrees
+        scores[fieldCount] = sum(checks) / len(checks)
+
+    if not scores or max(scores.values()) < 0.5:
+        raise Exception("Can't detect message field count.")
+
+    best = max(scores.values())
+    fieldCount = min(fieldCount for fieldCount in scores if scores[fieldCount] >= best - 0.02)
+    detectedFieldCounts[key] = (fieldCount, scores[fieldCount])
+    return detectedFieldCounts[key]
+
+def wrapAngle(angle, lower = -math.pi):
+    """
+    Wraps angles (radians, scalar or array) into [lower, lower + 2 pi)
+    """
+    return (angle - lower) % (2 * math.pi) + lower
+
+def interpAngle(left, right, fraction):
+    """
+    Interpolates angles along the shortest arc between left and right. The
+    result keeps the [0, 2 pi) convention when both ends are positive and
+    [-pi, pi) otherwise.
+    """
+    value = left + fraction * wrapAngle(right - left)
+    lower = pl.where((left >= 0) & (right >= 0), 0.0, -math.pi)
+    return wrapAngle(value, lower)
+
+def hermitePosition(leftData, rightData, fields, fraction, span):
+    """
+    Cubic Hermite interpolation of the standard navigation record position
+    between two messages, the north, east and up velocities are converted to
+    latitude, longitude and altitude rates for the spline tangents.
+
+    leftData and rightData are (messages x fields) arrays holding at least the
+    lat, lon, alt, velocity and wander fields, fields lists their field
+    numbers, span is the time between the messages. Returns a dictionary of
+    field number to interpolated array.
+    """
+    col = dict((field, i) for i, field in enumerate(fields))
+
+    def rates(data):
+        lat = data[:,col[SBET_FIELDS["lat"]]]
+        alt = data[:,col[SBET_FIELDS["alt"]]]
+        velNorth, velEast, velDown = trueVelocity(data[:,col[SBET_FIELDS["xVel"]]], data[:,col[SBET_FIELDS["yVel"]]],
+                                                  data[:,col[SBET_FIELDS["zVel"]]], data[:,col[SBET_FIELDS["wander"]]])
+        meridian, primeVertical = geodetic.radiiOfCurvature(lat)
+        return {SBET_FIELDS["lat"]: velNorth / (meridian + alt),
+                SBET_FIELDS["lon"]: velEast / ((primeVertical + alt) * pl.cos(lat)),
+                SBET_FIELDS["alt"]: -velDown}
+
+    leftRates = rates(leftData)
+    rightRates = rates(rightData)
+
+    u = fraction
+    h00 = 2 * u**3 - 3 * u**2 + 1
+    h10 = u**3 - 2 * u**2 + u
+    h01 = -2 * u**3 + 3 * u**2
+    h11 = u**3 - u**2
+
+    position = {}
+    for field in [SBET_FIELDS["lat"], SBET_FIELDS["lon"], SBET_FIELDS["alt"]]:
+        left = leftData[:,col[field]]
+        right = rightData[:,col[field]]
+        if field == SBET_FIELDS["lon"]:
+            # continue across the +/-pi meridian
+            right = left + wrapAngle(right - left)
+        position[field] = h00 * left + h10 * span * leftRates[field] + h01 * right + h11 * span * rightRates[field]
+    position[SBET_FIELDS["lon"]] = wrapAngle(position[SBET_FIELDS["lon"]])
+    return position
+
 def trueVelocity(velocityX, velocityY, velocityZ, wanderAngle):
     """
     "The standard navigation record casts the computed velocity in a
@@ -356,8 +1947,8 @@ def trueVelocity(velocityX, velocityY, velocityZ, wanderAngle):
     transformation of the computed velocity components to North, East
     and Down."
     """
-    velocityNorth = velocityX * math.cos(wanderAngle) - velocityY * math.sin(wanderAngle)
-    velocityEast = - velocityX * math.sin(wanderAngle) - velocityY * math.cos(wanderAngle)
+    velocityNorth = velocityX * pl.cos(wanderAngle) - velocityY * pl.sin(wanderAngle)
+    velocityEast = - velocityX * pl.sin(wanderAngle) - velocityY * pl.cos(wanderAngle)
     velocityDown = - velocityZ
     return [velocityNorth, velocityEast, velocityDown]
 
@@ -370,4 +1961,4 @@ def trueHeading(platformHeading, wanderAngle):
     return (platformHeading - wanderAngle) % (2 * math.pi)
 
 def groundSpeed(velocityX, velocityY):
-    return math.sqrt(velocityX**2 + velocityY**2)
+    return pl.sqrt(velocityX**2 + velocityY**2)
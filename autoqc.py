@@ -1,22 +1,16 @@
 import os
 import sys
+import time
+import Queue
+import threading
+import traceback
 import pylab as pl
 import ApplanixPOSPacModule as pos
 import navdif
-
-def countLessThan (data, value):
-    cnt = 0
-    for i in data:
-        if i < value:
-            cnt += 1
-    return cnt
-
-def countMoreThan (data, value):
-    cnt = 0
-    for i in data:
-        if i > value:
-            cnt += 1
-    return cnt
+import profiling
+import tolerances
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 def printHeader(text,printHandle):
 
@@ -39,14 +33,27 @@ RMS_roll_tolerance = ['<',1.2] # arc-minutes = 0.02 degrees
 RMS_pitch_tolerance = ['<',1.2] # arc-minutes = 0.02 degrees
 RMS_heading_tolerance = ['<',1.2] # arc-minutes = 0.02 degrees
 
-# Error estimate tolerenaces and ranges
+# Error estimate tolerenaces and ranges, a range limits the spread (max - min)
+# of the converged estimate, a tolerance the magnitude of every estimate
 error_accel_bias_range = 500 # micro-g
 error_accel_scale_range = 500 # ppm
 error_gyro_bias_tolerance = ['<',5] # deg/hr
 error_gyro_scale_range = 500 # ppm
 error_lever_arm_tolerance = ['<',0.01] # meters
-
-# Solution status tolerances
+error_blanking = 300 # seconds to ignore at beginning and end while the estimates converge
+error_converged = 600 # seconds at the end (before blanking) averaged for the converged values
+error_sustained = 10 # seconds out of tolerance before an interval is reported
+# the smers field layout is assumed (pos.SMERS_FIELDS) and has only been checked
+# against synthetic files, the Smoothed Error Estimates section only runs with
+# CHECK_ERROR_ESTIMATES, set it (and the field map if needed) once the layout
+# is confirmed for the POSPac version
+CHECK_ERROR_ESTIMATES = False
+error_estimate_fields = pos.SMERS_FIELDS
+# set once error_estimate_fields has been checked against the POSPac smers
+# documentation, until then the section says the layout is unverified
+ERROR_ESTIMATE_LAYOUT_VERIFIED = False
+
+# Solution status tolerances, checked as tolerance rules (see getToleranceRules)
 SV_count_tolerance = 4 # no less than
 PDOP_tolerance = 3 # no greater than
 Baseline_length_tolerance = ['<',20000] # meters, no greater than
@@ -54,17 +61,226 @@ Baseline_length_tolerance = ['<',20000] # meters, no greater than
 # Sustained tolerances
 GAMS_not_in_use = 60 # seconds
 processing_mode = 60 # seconds
+RMS_sustained = 10 # seconds, RMS out of tolerance
+processing_mode_tolerance = ['<=',1] # iinkaru field 5, fixed NL/WL
+GAMS_status_tolerance = ['!=',0] # gamsu field 5 (layout assumed), 0 when GAMS is not in use
+# the gamsu status field is assumed and has only been checked against synthetic
+# files, the GAMS rule is only checked with CHECK_GAMS_STATUS
+CHECK_GAMS_STATUS = False
+# intervals listed per tolerance in the report, all are returned
+MAX_LISTED_INTERVALS = 20
+
+# tolerance rules file (JSON, see tolerances.loadRules) checked by the
+# Tolerance Rules section, None for the rules made from the tolerances above
+TOLERANCE_RULES_FILE = None
+
+# seconds between navdif epochs
+NAVDIF_INC = 5
+# navdif sampling of the files at the epochs, False nearest message, True
+# interpolated or navdif.LOWPASS low-pass filtered to the epoch rate
+NAVDIF_INTERP = False
+# navdif epochs computed at a time (see navdif blockSize), None for the
+# default, bounds the memory of long missions
+NAVDIF_BLOCK_SIZE = None
+# navdif worker processes (see navdif workers), 1 for a serial navdif
+NAVDIF_WORKERS = 1
+
+# seconds between progress updates while waiting on parallel sections
+PROGRESS_INTERVAL = 0.2
 
 #-------------------------------------------------------------------------------
 # Get Project Path
 #-------------------------------------------------------------------------------
 
-def autoqc (projectFile,navdifRefFile,printHandle,progressHandle):
+def autoqc (projectFile,navdifRefFile,printHandle,progressHandle,parallel = False,cache = None,timing = None,
+            cancelled = None):
+    """
+    Runs the report sections (getSections) for the project. With parallel
+    the sections run at the same time in a thread pool, their report text
+    is still printed in the order of QC_SECTIONS and progress is the
+    average over the sections. All printHandle and progressHandle calls are made from the
+    calling thread.
+
+    With a resultcache.resultCache the report text, statistics and navdif
+    output of a section are reused while its input files and tolerances are
+    unchanged.
+
+    With a profiling.timingReport the run is instrumented, the report gets
+    the wall and CPU time of every section, the reads of every data file,
+    navdif epochs per second and the time spent in printHandle and
+    progressHandle.
+
+    cancelled is a threading.Event, once it is set the print and progress
+    callbacks of every section raise qcCancelled and the run stops.
+
+    Returns the statistics of every section, a dictionary of section name
+    (function name) to the dictionary returned by the section.
+    """
+
+    if timing is not None:
+        previous = timing.start()
+        printHandle = timing.timeCallback("print",printHandle)
+        if progressHandle:
+            progressHandle = timing.timeCallback("progress",progressHandle)
+
+    if cancelled is not None:
+        printHandle = cancellable(printHandle,cancelled)
+        if progressHandle:
+            progressHandle = cancellable(progressHandle,cancelled)
+
+    try:
+        project = pos.project(projectFile)
+
+        printHandle("Processing %s" % project.name)
+
+        sections = getSections()
+        if cache is not None:
+            sections = [cachedSection(section,cache) for section in sections]
+        if timing is not None:
+            sections = [timing.timeSection(section) for section in sections]
+
+        if parallel:
+            return runSectionsParallel(sections,project,navdifRefFile,printHandle,progressHandle,cancelled)
+        else:
+            results = OrderedDict()
+            for section in sections:
+                results[section.__name__] = section(project,navdifRefFile,printHandle,progressHandle)
+            return results
+    finally:
+        if timing is not None:
+            timing.stop(previous)
+
+def cancellable (handle,cancelled):
+    """
+    Wraps a print or progress callback so it raises qcCancelled once the
+    cancelled event is set
+    """
+    def check(*args):
+        if cancelled.is_set():
+            raise qcCancelled()
+        return handle(*args)
+    return check
+
+def runSectionsParallel (sections,project,navdifRefFile,printHandle,progressHandle,cancelled = None):
+    """
+    Runs the sections in a thread pool. Each section prints to its own buffer
+    which is flushed to printHandle once every earlier section has been
+    flushed. Section progress is collected and reported while waiting.
+    Once a section fails or cancelled (a threading.Event) is set the section
+    callbacks raise qcCancelled so every other section stops at its next
+    callback, the error is raised once they have stopped.
+    Returns the section results like autoqc.
+    """
+    results = OrderedDict()
+    buffers = [[] for section in sections]
+    progress = [0.0] * len(sections)
+    stop = threading.Event()
+
+    def sectionProgress(index):
+        def handle(value, *args):
+            progress[index] = value
+        return handle
+
+    handles = [(cancellable(buffers[i].append,stop),cancellable(sectionProgress(i),stop)) for i in xrange(len(sections))]
+
+    pool = ThreadPool(len(sections))
+    try:
+        tasks = [pool.apply_async(section,(project,navdifRefFile) + handles[i]) for i, section in enumerate(sections)]
+        reported = None
+        for i, task in enumerate(tasks):
+            while not task.ready():
+                task.wait(PROGRESS_INTERVAL)
+                if cancelled is not None and cancelled.is_set():
+                    raise qcCancelled()
+                for other in tasks:
+                    if other.ready() and not other.successful():
+                        other.get() # raises the failed section's exception
+                if progressHandle and sum(progress) != reported:
+                    reported = sum(progress)
+                    progressHandle(reported / len(sections))
+            results[sections[i].__name__] = task.get() # raises the section's exception
+            progress[i] = 100.0
+            for line in buffers[i]:
+                printHandle(line)
+        if progressHandle:
+            progressHandle(100.0)
+    except:
+        stop.set()
+        raise
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+def cachedSection (section,cache):
+    """
+    Wraps a section so its report text and statistics come from the cache
+    when the section's inputs (see sectionInputs) are unchanged, output files
+    are restored from the cache if they have been changed or removed
+    """
+    def run(project,navdifRefFile,printHandle,progressHandle):
+        try:
+            inputs, params, outputs = sectionInputs(section,project,navdifRefFile)
+            key = cache.makeKey(inputs,[section.__name__,params])
+        except OSError:
+            # missing input, let the section report it
+            return section(project,navdifRefFile,printHandle,progressHandle)
+
+        entry = cache.get(key)
+        if entry is not None:
+            for name in outputs:
+                cache.restoreFile(key,name,entry,outputs[name])
+            for line in entry["results"]["report"]:
+                printHandle(line)
+            if progressHandle:
+                progressHandle(100.0)
+            return entry["results"]["results"]
+
+        report = []
+        def cachePrintHandle(text):
+            report.append(text)
+            printHandle(text)
+
+        results = section(project,navdifRefFile,cachePrintHandle,progressHandle)
+        cache.put(key,OrderedDict([("report",report),("results",results)]),outputs)
+        return results
+
+    run.__name__ = section.__name__
+    return run
+
+def sectionInputs (section,project,navdifRefFile):
+    """
+    Returns the input files, the tolerances and settings, and the output
+    files (name: path) of a section for the result cache
+    """
+    name = section.__name__
+    if name == "smoothedPerformanceMetrics":
+        return ([project.getDataFilePath("smrmsg",project.PROCESSED_DIR)],
+                [RMS_blanking,RMS_north_tolerance,RMS_east_tolerance,RMS_down_tolerance,
+                 RMS_roll_tolerance,RMS_pitch_tolerance,RMS_heading_tolerance], {})
+    elif name == "calibrationParameters":
+        return ([project.getDataFilePath("iincal",project.PROCESSED_DIR)], [], {})
+    elif name == "solutionStatus":
+        return ([project.getDataFilePath("iinkaru",project.PROCESSED_DIR)],
+                [rule.toDict() for rule in getStatusRules()], {})
+    elif name == "realtimeDifference":
+        return ([navdifRefFile,project.getDataFilePath("vnav",project.EXTRACTED_DIR)], [NAVDIF_INC,NAVDIF_INTERP],
+                {"navdif": project.getDataFilePath("autoqc_navdif_bet",project.PROCESSED_DIR)})
+    elif name == "smoothedErrorEstimates":
+        smersPath = project.getDataFilePath("smers",project.PROCESSED_DIR)
+        return ([smersPath] if os.path.exists(smersPath) else [],
+                [getErrorChecks(),error_blanking,error_converged,error_sustained,ERROR_ESTIMATE_LAYOUT_VERIFIED], {})
+    elif name == "toleranceRules":
+        rules = getReportRules()
+        return (tolerances.ruleInputs(project,rules), [rule.toDict() for rule in rules], {})
+    raise KeyError("No cache inputs for section %s." % name)
 
-    project = pos.project(projectFile)
-    
-    printHandle("Processing %s" % project.name)
+#-------------------------------------------------------------------------------
+# Report Sections
+#-------------------------------------------------------------------------------
 
+def smoothedPerformanceMetrics (project,navdifRefFile,printHandle,progressHandle):
     #-----------------------------------------------------------------------
     # Smoothed Performance Metrics
     #-----------------------------------------------------------------------
@@ -72,26 +288,25 @@ def autoqc (projectFile,navdifRefFile,printHandle,progressHandle):
 
     rms = project.getProcessedDataObject("smrmsg")
 
-    msgStart = rms.getMsgNumByTime(rms.startTime + RMS_blanking)
     msgInc = 5 # seconds
-    msgEnd = rms.getMsgNumByTime(rms.startTime + rms.messages*rms.timeInc - RMS_blanking)
+    fields = [2,3,4,8,9,10]
 
-    fields = [1,2,3,4,8,9,10]
-
-    messages = range(msgStart,msgEnd,msgInc) # entire series at 5 seconds
-    rms_data = rms.getData(messages,fields)
+    stats = rms.getStatistics(fields,blanking = RMS_blanking,msgInc = msgInc).getResults() # entire series at 5 seconds
 
     printHandle('\tMax\t(StDev) - Tolerance')
-    printHandle('North:\t%s\t(%s) - %s m' % (round(max(rms_data[:,1]),3),round(pl.std(rms_data[:,1]),3),RMS_north_tolerance[1]))
-    printHandle('East:\t%s\t(%s) - %s m' % (round(max(rms_data[:,2]),3),round(pl.std(rms_data[:,2]),3),RMS_east_tolerance[1]))
-    printHandle('Down:\t%s\t(%s) - %s m' % (round(max(rms_data[:,3]),3),round(pl.std(rms_data[:,3]),3),RMS_down_tolerance[1]))
-    printHandle('Roll:\t%s\t(%s) - %s arc-min' % (round(max(rms_data[:,4]),3),round(pl.std(rms_data[:,4]),3),RMS_roll_tolerance[1]))
-    printHandle('Pitch:\t%s\t(%s) - %s arc-min' % (round(max(rms_data[:,5]),3),round(pl.std(rms_data[:,5]),3),RMS_pitch_tolerance[1]))
-    printHandle('Heading:\t%s\t(%s) - %s arc-min' % (round(max(rms_data[:,6]),3),round(pl.std(rms_data[:,6]),3),RMS_heading_tolerance[1]))
+    results = OrderedDict()
+    for field, name, units, tolerance in [(2,"North","m",RMS_north_tolerance),(3,"East","m",RMS_east_tolerance), \
+                                          (4,"Down","m",RMS_down_tolerance),(8,"Roll","arc-min",RMS_roll_tolerance), \
+                                          (9,"Pitch","arc-min",RMS_pitch_tolerance),(10,"Heading","arc-min",RMS_heading_tolerance)]:
+        printHandle('%s:\t%s\t(%s) - %s %s' % (name,round(stats[field]["max"],3),round(stats[field]["std"],3),tolerance[1],units))
+        results[name.lower()] = OrderedDict([("max",stats[field]["max"]),("std",stats[field]["std"]), \
+                                             ("max_time",stats[field]["max_time"]),("tolerance",tolerance[1])])
 
     del rms
-    del rms_data
 
+    return results
+
+def calibrationParameters (project,navdifRefFile,printHandle,progressHandle):
     #-----------------------------------------------------------------------
     # Calibration Installation Parameters
     #-----------------------------------------------------------------------
@@ -99,26 +314,28 @@ def autoqc (projectFile,navdifRefFile,printHandle,progressHandle):
 
     cal = project.getProcessedDataObject("iincal")
 
-    msgStart = cal.messages - 10*60 # last 10 minutes
-    if msgStart <= cal.arrayStart: # make sure the file is at least 10 minutes long
-        msgStart = cal.arrayStart
-    msgEnd = cal.messages
-
-    fields = [1,2,3,4,5]
-    messages = range(msgStart,msgEnd,1)
+    startTime = max(cal.endTime - 10*60,cal.startTime) # last 10 minutes, or the whole file if shorter
 
-    cal_data = cal.getData(messages,fields)
+    fields = [2,3,4,5]
+    stats = cal.getStatistics(fields,startTime).getResults()
 
     printHandle('\tAvg.\t(StDev)')
-    printHandle('X Ref Pri:\t%s\t(%s)' % (round(sum(cal_data[:,1])/len(cal_data[:,1]),3),round(pl.std(cal_data[:,1]),4)))
-    printHandle('Y Ref Pri:\t%s\t(%s)' % (round(sum(cal_data[:,2])/len(cal_data[:,2]),3),round(pl.std(cal_data[:,2]),4)))
-    printHandle('Z Ref Pri:\t%s\t(%s)' % (round(sum(cal_data[:,3])/len(cal_data[:,3]),3),round(pl.std(cal_data[:,3]),4)))
+    printHandle('X Ref Pri:\t%s\t(%s)' % (round(stats[2]["mean"],3),round(stats[2]["std"],4)))
+    printHandle('Y Ref Pri:\t%s\t(%s)' % (round(stats[3]["mean"],3),round(stats[3]["std"],4)))
+    printHandle('Z Ref Pri:\t%s\t(%s)' % (round(stats[4]["mean"],3),round(stats[4]["std"],4)))
     printHandle(' ')
-    printHandle('Max Figure of Merit: %s' % max(cal_data[:,4]))
+    printHandle('Max Figure of Merit: %s' % stats[5]["max"])
+
+    results = OrderedDict()
+    for field, name in [(2,"x_ref_pri"),(3,"y_ref_pri"),(4,"z_ref_pri")]:
+        results[name] = OrderedDict([("mean",stats[field]["mean"]),("std",stats[field]["std"])])
+    results["max_figure_of_merit"] = stats[5]["max"]
 
     del cal
-    del cal_data
 
+    return results
+
+def solutionStatus (project,navdifRefFile,printHandle,progressHandle):
     #-----------------------------------------------------------------------
     # Solution Status
     #-----------------------------------------------------------------------
@@ -126,38 +343,26 @@ def autoqc (projectFile,navdifRefFile,printHandle,progressHandle):
 
     status = project.getProcessedDataObject("iinkaru")
 
-    msgStart = status.arrayStart
-    msgInc = 1
-    msgEnd = status.messages
-
-    fields = [1,2,3,4,5]
-    messages = range(msgStart,msgEnd,msgInc) # entire series at 1 second
-
-    status_data = status.getData(messages,fields)
-
-    # Min SV Count
-    min_SV = min(status_data[:,1])
-    if min_SV <= SV_count_tolerance:
-        timeOutOfTolerance = countLessThan(status_data[:,1],SV_count_tolerance + 1)
-        printHandle('Min # SVs:    %s (out of tolerance for %s minutes)' % (min_SV,round(timeOutOfTolerance/60.0,1)))
-    else:
-        printHandle('Min # SVs:    %s' % min_SV)
-
-    # Max PDOP
-    max_PDOP = round(max(status_data[:,2]),2)
-    if max_PDOP > PDOP_tolerance:
-        timeOutOfTolerance = countMoreThan(status_data[:,2],PDOP_tolerance)
-        printHandle('Max PDOP:     %s (out of tolerance for %s minutes)' % (max_PDOP,round(timeOutOfTolerance/60.0,1)))
-    else:
-        printHandle('Max PDOP:     %s' % max_PDOP)
-
-    printHandle('Max Baseline: %s m' % round(max(status_data[:,3]),0))
+    # the status tolerances are the solution status tolerance rules, checked
+    # with the summary in one pass over the file (see statusTotals)
+    rules = getStatusRules()
+    tolerances.checkFields(status,rules)
+    totals = statusTotals(rules,status.timeInc,status.startTime,status.endTime)
+    for times, values in status.readBlocks(totals.fields):
+        totals.update(times,values)
+    summary = totals.getResults()
+
+    results = OrderedDict()
+    for name in ["min_sv","max_pdop","max_baseline"]:
+        results[name] = summary[name]
+
+    printHandle('Min # SVs:    %s' % results["min_sv"])
+    printHandle('Max PDOP:     %s' % round(results["max_pdop"],2))
+    printHandle('Max Baseline: %s m' % round(results["max_baseline"],0))
     printHandle(' ')
     printHandle('Processing Mode:')
 
-    proc_mode = pl.zeros(9)
-    for _mode in status_data[:,4]:
-        proc_mode[_mode] += 1
+    proc_mode = totals.getModeSeconds()
 
     printHandle('\tFixed NL/WL (0/1):\t%s minutes' % round((proc_mode[0] + proc_mode[1])/60,1))
     if proc_mode[2] > 60:
@@ -175,9 +380,20 @@ def autoqc (projectFile,navdifRefFile,printHandle,progressHandle):
     if proc_mode[8] > 1:
         printHandle('\tDR Mode (8):\t%s minutes' % round(proc_mode[8]/60,1))
 
+    results["processing_mode_minutes"] = summary["processing_mode_minutes"]
+
+    if rules:
+        printHandle(' ')
+        printHandle('Tolerances:')
+        for rule in rules:
+            printRuleResult(summary["rules"][rule.name],printHandle)
+    results["rules"] = summary["rules"]
+
     del status
-    del status_data
 
+    return results
+
+def realtimeDifference (project,navdifRefFile,printHandle,progressHandle):
     #-----------------------------------------------------------------------
     # Smoothed Reference Data (Realtime Difference)
     #-----------------------------------------------------------------------
@@ -188,21 +404,434 @@ def autoqc (projectFile,navdifRefFile,printHandle,progressHandle):
     vnav = project.getExtractedDataObject("vnav")
 
     navdif_filename = project.getDataFilePath("autoqc_navdif_bet",project.PROCESSED_DIR)
-    navdif.navdif(sbet,vnav,navdif_filename,5,progressHandle)
+    navdif.navdif(sbet,vnav,navdif_filename,NAVDIF_INC,progressHandle,NAVDIF_INTERP,NAVDIF_BLOCK_SIZE,NAVDIF_WORKERS)
 
     diff = pos.dataFile(navdif_filename,project.dataFileFieldCounts["navdif_bet"])
 
-    msgStart = diff.arrayStart
-    msgInc = 1
-    msgEnd = diff.messages
+    fields = [2,3,4]
+    stats = diff.getStatistics(fields,skipNaN = True).getResults() # entire series, low-pass epochs in gaps are NaN
 
-    fields = [1,2,3,4]
-    messages = pl.arange(msgStart,msgEnd,msgInc) # entire series at 1 second
+    printHandle('\t\tAvg.\t(StDev)')
+    printHandle('North Pos. Diff:\t%s\t(%s) m' % (round(stats[2]["mean"],3),round(stats[2]["std"],3)))
+    printHandle('East Pos. Diff:\t%s\t(%s) m' % (round(stats[3]["mean"],3),round(stats[3]["std"],3)))
+    printHandle('Down Pos. Diff:\t%s\t(%s) m' % (round(stats[4]["mean"],3),round(stats[4]["std"],3)))
+
+    # epochs in these gaps are left out of the navdif file
+    gaps = OrderedDict([("reference",sbet.getGaps()),("vnav",vnav.getGaps())])
+    for name in gaps:
+        printHandle('%s gaps:\t%s\t(%s s)' % (name.capitalize(),len(gaps[name]["start"]),round(gaps[name]["duration"].sum(),2)))
+
+    results = OrderedDict()
+    for field, name in [(2,"north"),(3,"east"),(4,"down")]:
+        results[name] = OrderedDict([("mean",stats[field]["mean"]),("std",stats[field]["std"])])
+    for name in gaps:
+        results["%s_gaps" % name] = OrderedDict([("count",len(gaps[name]["start"])),("seconds",float(gaps[name]["duration"].sum()))])
+    results["navdif_file"] = navdif_filename
+
+    return results
+
+def getErrorChecks ():
+    """
+    Smoothed error estimate checks, (name, smers field, check, comparator,
+    limit, units). A "range" check compares the spread (max - min) of the
+    converged estimate with the limit, a "tolerance" check the magnitude of
+    every estimate after blanking. Fields are from error_estimate_fields.
+    """
+    checks = []
+    for name, key, check, comparator, limit, units in [
+            ("Accel Bias","AccelBias","range",'<=',error_accel_bias_range,"micro-g"),
+            ("Accel Scale","AccelScale","range",'<=',error_accel_scale_range,"ppm"),
+            ("Gyro Bias","GyroBias","tolerance",error_gyro_bias_tolerance[0],error_gyro_bias_tolerance[1],"deg/hr"),
+            ("Gyro Scale","GyroScale","range",'<=',error_gyro_scale_range,"ppm"),
+            ("Lever Arm","LeverArm","tolerance",error_lever_arm_tolerance[0],error_lever_arm_tolerance[1],"m")]:
+        for axis in ["x","y","z"]:
+            checks.append(("%s %s" % (name,axis.upper()),error_estimate_fields[axis + key],check,comparator,limit,units))
+    return checks
+
+def smoothedErrorEstimates (project,navdifRefFile,printHandle,progressHandle):
+    #-----------------------------------------------------------------------
+    # Smoothed Error Estimates
+    #-----------------------------------------------------------------------
+    printHeader("Smoothed Error Estimates",printHandle)
+
+    if not ERROR_ESTIMATE_LAYOUT_VERIFIED:
+        printHandle('Unverified smers field layout (error_estimate_fields), check it against the POSPac')
+        printHandle('documentation for the version before relying on these values')
+        printHandle(' ')
+
+    if not os.path.exists(project.getDataFilePath("smers",project.PROCESSED_DIR)):
+        printHandle('No smers file')
+        return OrderedDict()
+
+    smers = project.getProcessedDataObject("smers")
+
+    checks = getErrorChecks()
+    fields = [check[1] for check in checks]
+    startTime = smers.startTime + error_blanking
+    endTime = smers.endTime - error_blanking
+    convergedTime = endTime - error_converged
+
+    # one pass over the error estimate fields, the estimates over the whole
+    # file, the converged estimates at the end (their mean and range) and
+    # the intervals where the magnitude is out of tolerance
+    stats = pos.runningStatistics(fields)
+    converged = pos.runningStatistics(fields)
+    intervals = [pos.runningIntervals(pl.maximum,error_sustained,smers.timeInc) for check in checks]
+    for times, values in smers.readBlocks(fields,startTime,endTime):
+        stats.add(times,values)
+        late = times >= convergedTime
+        converged.add(times[late],values[late])
+        magnitude = pl.absolute(values)
+        for i, check in enumerate(checks):
+            if check[2] == "tolerance":
+                outside = ~pos.COMPARATORS[check[3]](magnitude[:,i],check[4])
+                intervals[i].add(times,outside,magnitude[:,i])
+    stats = stats.getResults()
+    converged = converged.getResults()
+
+    printHandle('\tConverged\t(Min / Max or Range) - Tolerance')
+    results = OrderedDict()
+    results["layout_verified"] = ERROR_ESTIMATE_LAYOUT_VERIFIED
+    for i, (name, field, check, comparator, limit, units) in enumerate(checks):
+        result = OrderedDict([("converged",converged[field]["mean"]),("min",stats[field]["min"]),
+                              ("max",stats[field]["max"]),("std",stats[field]["std"]),("tolerance",limit)])
+        if check == "range":
+            spread = converged[field]["max"] - converged[field]["min"]
+            result["range"] = spread
+            result["passed"] = bool(pos.COMPARATORS[comparator](spread,limit))
+            printHandle('%s:\t%s\t(range %s) - %s %s%s' % (name,round(converged[field]["mean"],4),round(spread,4),
+                                                           limit,units,"" if result["passed"] else " FAILED"))
+        else:
+            result["intervals"] = intervalList(intervals[i].getIntervals())
+            result["passed"] = not result["intervals"]
+            printHandle('%s:\t%s\t(%s / %s) - %s %s' % (name,round(converged[field]["mean"],4),round(stats[field]["min"],4),
+                                                         round(stats[field]["max"],4),limit,units))
+        results[name.lower().replace(" ","_")] = result
+
+    for name, field, check, comparator, limit, units in checks:
+        listed = results[name.lower().replace(" ","_")].get("intervals")
+        if listed:
+            printHandle(' ')
+            printHandle('%s out of tolerance (> %s s):\t%s intervals, %s minutes' % (name,error_sustained,len(listed),
+                        round(sum(interval["duration"] for interval in listed)/60.0,1)))
+            printIntervals(listed,printHandle)
+
+    del smers
+
+    return results
+
+def intervalList (intervals):
+    """
+    List of interval dictionaries (start, end, duration and worst) of the
+    arrays from pos.findIntervals or pos.runningIntervals
+    """
+    return [OrderedDict([("start",float(intervals["start"][i])),("end",float(intervals["end"][i])),
+                         ("duration",float(intervals["duration"][i])),("worst",float(intervals["worst"][i]))])
+            for i in xrange(len(intervals["start"]))]
+
+def printIntervals (listed,printHandle):
+    """
+    Prints up to MAX_LISTED_INTERVALS intervals of a list from intervalList
+    """
+    for interval in listed[:MAX_LISTED_INTERVALS]:
+        printHandle('\t%.1f - %.1f\t(%s s)\tworst %s' % (interval["start"],interval["end"],
+                    round(interval["duration"],1),round(interval["worst"],3)))
+    if len(listed) > MAX_LISTED_INTERVALS:
+        printHandle('\t... %s more' % (len(listed) - MAX_LISTED_INTERVALS))
+
+def getToleranceRules ():
+    """
+    Tolerance rules of the report, from TOLERANCE_RULES_FILE or made from
+    the tolerances above. The solution status rules (isStatusRule) are
+    reported by the Solution Status section and the rest by the Tolerance
+    Rules section.
+    """
+    if TOLERANCE_RULES_FILE is not None:
+        return tolerances.loadRules(TOLERANCE_RULES_FILE)
+
+    rule = tolerances.toleranceRule
+    rules = [rule("sv_count","iinkaru",2,'>',SV_count_tolerance),
+             rule("pdop","iinkaru",3,'<=',PDOP_tolerance),
+             rule("baseline_length","iinkaru",4,Baseline_length_tolerance[0],Baseline_length_tolerance[1]),
+             rule("processing_mode","iinkaru",5,processing_mode_tolerance[0],processing_mode_tolerance[1],processing_mode)]
+    if CHECK_GAMS_STATUS:
+        rules.append(rule("gams_not_in_use","gamsu",5,GAMS_status_tolerance[0],GAMS_status_tolerance[1],GAMS_not_in_use,
+                          optional = True))
+    for field, name, tolerance in [(2,"north",RMS_north_tolerance),(3,"east",RMS_east_tolerance),(4,"down",RMS_down_tolerance), \
+                                   (8,"roll",RMS_roll_tolerance),(9,"pitch",RMS_pitch_tolerance),(10,"heading",RMS_heading_tolerance)]:
+        rules.append(rule("rms_" + name,"smrmsg",field,tolerance[0],tolerance[1],RMS_sustained,RMS_blanking))
+    return rules
+
+def isStatusRule (rule):
+    """
+    Rules of the solution status file are reported by the Solution Status
+    section, not the Tolerance Rules section
+    """
+    return rule.fileType == "iinkaru" and rule.directory == pos.project.PROCESSED_DIR
+
+def getStatusRules ():
+    return [rule for rule in getToleranceRules() if isStatusRule(rule)]
+
+def getReportRules ():
+    """
+    Rules of the Tolerance Rules section, every rule but the status rules
+    """
+    return [rule for rule in getToleranceRules() if not isStatusRule(rule)]
+
+def printRuleResult (result,printHandle):
+    """
+    Prints a tolerance rule result (see tolerances.evaluateFile) with up to
+    MAX_LISTED_INTERVALS of its intervals
+    """
+    if result["passed"]:
+        state = "ok"
+    else:
+        state = "FAILED"
+    if result["worst"] is None:
+        printHandle('%s:\tno messages after blanking' % result["name"])
+        return
+    printHandle('%s (%s %s, %s s):\t%s, %s minutes out of tolerance, worst %s' % (result["name"],result["comparator"],
+                result["threshold"],result["min_duration"],state,round(result["seconds"]/60.0,1),round(result["worst"],3)))
+    printIntervals(result["intervals"],printHandle)
+
+def toleranceRules (project,navdifRefFile,printHandle,progressHandle):
+    #-----------------------------------------------------------------------
+    # Tolerance Rules
+    #-----------------------------------------------------------------------
+    printHeader("Tolerance Rules",printHandle)
 
-    diff_data = diff.getData(messages,fields)
+    rules = getReportRules()
+    results = tolerances.evaluateRules(project,rules,progressHandle)
 
-    printHandle('\t\tAvg.\t(StDev)')
-    printHandle('North Pos. Diff:\t%s\t(%s) m' % (round(sum(diff_data[:,1])/len(diff_data[:,1]),3),round(pl.std(diff_data[:,1]),3)))
-    printHandle('East Pos. Diff:\t%s\t(%s) m' % (round(sum(diff_data[:,2])/len(diff_data[:,2]),3),round(pl.std(diff_data[:,2]),3)))
-    printHandle('Down Pos. Diff:\t%s\t(%s) m' % (round(sum(diff_data[:,3])/len(diff_data[:,3]),3),round(pl.std(diff_data[:,3]),3)))
+    for rule in rules:
+        if results[rule.name] is None:
+            printHandle('%s:\tno %s file' % (rule.name,rule.fileType))
+        else:
+            printRuleResult(results[rule.name],printHandle)
+
+    return results
+
+# report sections in report order
+QC_SECTIONS = [smoothedPerformanceMetrics, smoothedErrorEstimates, calibrationParameters, solutionStatus,
+               realtimeDifference, toleranceRules]
+
+def getSections ():
+    """
+    The sections of QC_SECTIONS that are run, Smoothed Error Estimates only
+    with CHECK_ERROR_ESTIMATES
+    """
+    return [section for section in QC_SECTIONS if section is not smoothedErrorEstimates or CHECK_ERROR_ESTIMATES]
+
+#-------------------------------------------------------------------------------
+# Follow Mode
+#-------------------------------------------------------------------------------
+
+# seconds between polls of a file that is still being written
+FOLLOW_INTERVAL = 1.0
+
+class statusTotals():
+    """
+    Running Solution Status summary and status rule results (see
+    tolerances.runningRules), each update only looks at the messages it is
+    given so the cost of an update doesn't grow with the file. Durations are
+    messages times timeInc.
+    """
+    SUMMARY_FIELDS = [2,3,4,5] # SVs, PDOP, baseline length, processing mode
+
+    def __init__(self, rules, timeInc = 0, startTime = None, endTime = None):
+        self.timeInc = timeInc
+        self.rules = tolerances.runningRules(rules,timeInc,startTime,endTime)
+        # fields of the blocks passed to update
+        self.fields = self.SUMMARY_FIELDS + [field for field in self.rules.fields if field not in self.SUMMARY_FIELDS]
+        self.ruleColumns = [self.fields.index(field) for field in self.rules.fields]
+        self.messages = 0
+        self.startTime = None
+        self.endTime = None
+        self.stats = pos.runningStatistics(self.SUMMARY_FIELDS[:3])
+        self.proc_mode = pl.zeros(9)
+
+    def update(self, times, values):
+        """
+        Adds status messages, values is (messages x fields)
+        """
+        if len(times) == 0:
+            return
+        if self.startTime is None:
+            self.startTime = float(times[0])
+        self.endTime = float(times[-1])
+        self.messages += len(times)
+        self.stats.add(times,values[:,:3])
+        self.proc_mode += pl.bincount(values[:,3].astype(int),minlength = 9)[:9]
+        self.rules.add(times,values[:,self.ruleColumns])
+
+    def setTimeInc(self, timeInc):
+        self.timeInc = timeInc
+        self.rules.setTimeInc(timeInc)
+
+    def getModeSeconds(self):
+        return self.proc_mode * self.timeInc
+
+    def getResults(self):
+        stats = self.stats.getResults()
+        results = OrderedDict()
+        results["messages"] = self.messages
+        results["start_time"] = self.startTime
+        results["end_time"] = self.endTime
+        results["min_sv"] = stats[2]["min"]
+        results["max_pdop"] = stats[3]["max"]
+        results["max_baseline"] = stats[4]["max"]
+        seconds = self.getModeSeconds()
+        results["processing_mode_minutes"] = OrderedDict((str(mode),seconds[mode]/60) for mode in range(9))
+        results["rules"] = self.rules.getResults()
+        return results
+
+    def report(self, printHandle):
+        """
+        One line summary of the totals so far, with the rules that have
+        messages out of tolerance
+        """
+        results = self.getResults()
+        flags = []
+        for result in results["rules"].values():
+            if result["violations"]:
+                flags.append("%s out %s min, %s intervals" % (result["name"],round(result["seconds"]/60.0,1),
+                                                                len(result["intervals"])))
+        printHandle('%.3f: %s msgs, min SVs %s, max PDOP %s, max baseline %s m, fixed %s min%s' %
+                    (self.endTime, self.messages, results["min_sv"], round(results["max_pdop"],2),
+                     round(results["max_baseline"],0), round(sum(self.getModeSeconds()[:2])/60,1),
+                     "".join(", " + flag for flag in flags)))
+
+def followStatus (statusFile,fieldCount,printHandle,interval = FOLLOW_INTERVAL,stopHandle = None,rules = None):
+    """
+    Rolling Solution Status QC of a status file (iinkaru layout) that is
+    still being written. Polls every interval seconds for appended whole
+    messages and pushes only those through the status rules (default
+    getStatusRules), a partial message at the end of the file is left for
+    the next poll. The end of the file isn't known so only the start is
+    blanked. Prints a summary line after each update and runs until
+    stopHandle() returns True (or forever without one). Returns the
+    statusTotals.
+    """
+    if rules is None:
+        rules = getStatusRules()
+    totals = statusTotals(rules)
+    status = None
+    while not (stopHandle and stopHandle()):
+        if status is None:
+            # wait for the file to hold enough messages to open
+            try:
+                status = pos.dataFile(statusFile,fieldCount,partial = True)
+            except (IOError, OSError):
+                msgStart = msgEnd = None
+            else:
+                tolerances.checkFields(status,rules)
+                totals = statusTotals(rules,status.timeInc,status.startTime)
+                msgStart, msgEnd = status.arrayStart, status.messages + status.arrayStart
+        else:
+            msgStart, msgEnd = status.refresh()
+
+        if msgStart is not None and msgEnd > msgStart:
+            # the message period is estimated better as the file grows
+            totals.setTimeInc(status.timeInc)
+            data = status.getDataRange(msgStart,msgEnd,[status.arrayStart] + totals.fields)
+            totals.update(data[:,0],data[:,1:])
+            totals.report(printHandle)
+
+        time.sleep(interval)
+
+    return totals
+
+#-------------------------------------------------------------------------------
+# Background Worker
+#-------------------------------------------------------------------------------
 
+class qcCancelled(Exception):
+    """
+    Raised by the callbacks of a cancelled autoqc run (see autoqc cancelled
+    and qcWorker)
+    """
+    pass
+
+class qcWorker():
+    """
+    Runs autoqc in a background thread. Report lines and progress are queued
+    for the thread owning the display (e.g. a GUI timer) to collect with
+    poll as often as it redraws, the callbacks only queue a line or a
+    progress change of at least a whole percent so they cost next to
+    nothing in the QC run. cancel stops the run at the next callback of
+    any section (see autoqc cancelled).
+    """
+    def __init__(self, projectFile, navdifRefFile, parallel = False, cache = None, timing = None):
+        self.projectFile = projectFile
+        self.navdifRefFile = navdifRefFile
+        self.parallel = parallel
+        self.cache = cache
+        self.timing = timing
+        self.queue = Queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = None
+        self.progress = 0.0
+        self.reported = 0
+        # "running", "done", "cancelled" or "failed" once collected by poll
+        self.state = None
+        self.results = None
+        self.error = None
+
+    def start(self):
+        self.state = "running"
+        self.thread = threading.Thread(target = self.run, name = "autoqc")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def isRunning(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def join(self, timeout = None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def printHandle(self, text):
+        self.queue.put(("text", text))
+
+    def progressHandle(self, value, *args):
+        if int(value) != self.reported:
+            self.reported = int(value)
+            self.queue.put(("progress", value))
+
+    def run(self):
+        try:
+            results = autoqc(self.projectFile, self.navdifRefFile, self.printHandle, self.progressHandle,
+                             self.parallel, self.cache, self.timing, self.cancelled)
+            self.queue.put(("done", results))
+        except qcCancelled:
+            self.queue.put(("cancelled", None))
+        except Exception:
+            self.queue.put(("failed", traceback.format_exc()))
+
+    def poll(self):
+        """
+        Collects everything queued since the last poll, returns the report
+        lines, the latest progress and the state ("running" until the run
+        has ended and its last lines have been collected)
+        """
+        lines = []
+        while True:
+            try:
+                kind, value = self.queue.get_nowait()
+            except Queue.Empty:
+                break
+            if kind == "text":
+                lines.append(value)
+            elif kind == "progress":
+                self.progress = value
+            else:
+                self.state = kind
+                if kind == "done":
+                    self.results = value
+                    self.progress = 100.0
+                elif kind == "failed":
+                    self.error = value
+        return lines, self.progress, self.state
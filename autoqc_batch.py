@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+#-------------------------------------------------------------------------------
+# Name:     autoqc_batch
+# Purpose:  Headless batch QC of every POSPac project found under a directory
+#           tree, writes a JSON/CSV summary per project plus an aggregate
+#
+# Usage:    python autoqc_batch.py [options] root [root ...]
+#           python autoqc_batch.py --follow iinkaru_S1.out
+#           python autoqc_batch.py --help
+#-------------------------------------------------------------------------------
+import os
+import sys
+import csv
+import glob
+import json
+import fnmatch
+import argparse
+import traceback
+import multiprocessing
+from collections import OrderedDict
+import ApplanixPOSPacModule as pos
+import autoqc
+import tolerances
+import resultcache
+import profiling
+
+# reference SBET paired with each project, %(path)s is the project folder
+# (project file minus .pospac), %(dir)s the folder holding the project file,
+# %(name)s the project name and %(kernel)s the detected kernel. Glob
+# wildcards are allowed, the first match (sorted) is used.
+DEFAULT_REFERENCE_RULE = os.path.join("%(path)s", "%(kernel)s", pos.project.PROCESSED_DIR, "sbet_%(kernel)s.out")
+
+AGGREGATE_NAME = "autoqc_summary"
+
+def findProjects(root):
+    """
+    Returns the sorted paths of every project file (PROJECT_FILETYPE_MASK)
+    under root
+    """
+    projects = []
+    for folder, dirs, files in os.walk(root):
+        for filename in fnmatch.filter(files, pos.PROJECT_FILETYPE_MASK):
+            projects.append(os.path.join(folder, filename))
+    return sorted(projects)
+
+def findReference(projectFile, rule = DEFAULT_REFERENCE_RULE):
+    """
+    Returns the reference SBET for the project by the pairing rule, raises
+    IOError if nothing matches
+    """
+    project = pos.project(projectFile)
+    pattern = rule % {"path": project.path, "dir": os.path.dirname(projectFile),
+                      "name": project.name, "kernel": project.kernel}
+    matches = sorted(glob.glob(pattern))
+    if not matches:
+        raise IOError(0, "No reference SBET matches %s." % pattern, projectFile)
+    return matches[0]
+
+def summaryName(projectFile, root):
+    """
+    File name (no extension) for a project's summary, the path of the
+    project file relative to root
+    """
+    relative = os.path.splitext(os.path.relpath(projectFile, root))[0]
+    return relative.replace(os.sep, "_").replace(":", "")
+
+def uniqueName(name, used):
+    """
+    Returns name, or name with a number appended if it's in used already
+    (compared ignoring case, for case insensitive file systems), and adds
+    it to used. Projects with the same path under different roots get
+    summaries of their own.
+    """
+    unique = name
+    number = 2
+    while unique.lower() in used:
+        unique = "%s_%s" % (name, number)
+        number += 1
+    used.add(unique.lower())
+    return unique
+
+def flatten(results, prefix = ""):
+    """
+    Flattens nested result dictionaries to {"section.name.stat": value}
+    """
+    flat = OrderedDict()
+    for key in results:
+        value = results[key]
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        else:
+            flat[name] = value
+    return flat
+
+def writeJSON(filename, data):
+    fid = open(filename, 'w')
+    json.dump(data, fid, indent = 2)
+    fid.close()
+
+def writeCSV(filename, rows, columns):
+    fid = open(filename, 'wb')
+    writer = csv.writer(fid)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([row.get(column, "") for column in columns])
+    fid.close()
+
+def qcProject(task):
+    """
+    Pool worker, runs autoqc for one project and writes its summary. Never
+    raises, failures are recorded in the returned summary so one project
+    can't stop the batch. The autoqc settings of the task are restored
+    afterwards so they don't leak into the caller when it runs in-process.
+    """
+    projectFile, name, rule, outputDir, formats, parallel, cacheDir, cacheBytes, timing, columnar, rulesFile, \
+        navdifBlockSize, navdifWorkers = task
+
+    summary = OrderedDict([("project", projectFile), ("reference", None), ("status", "ok"),
+                           ("error", None), ("results", None), ("report", [])])
+    report = None
+    if timing:
+        report = profiling.timingReport()
+    settings = (autoqc.TOLERANCE_RULES_FILE, autoqc.NAVDIF_BLOCK_SIZE, autoqc.NAVDIF_WORKERS)
+    try:
+        summary["reference"] = findReference(projectFile, rule)
+        if columnar:
+            pos.project(projectFile).convertDataFiles()
+        autoqc.TOLERANCE_RULES_FILE = rulesFile
+        autoqc.NAVDIF_BLOCK_SIZE = navdifBlockSize
+        autoqc.NAVDIF_WORKERS = navdifWorkers
+        cache = None
+        if cacheDir:
+            cache = resultcache.resultCache(cacheDir, cacheBytes)
+        summary["results"] = autoqc.autoqc(projectFile, summary["reference"], summary["report"].append,
+                                           False, parallel, cache, report)
+    except Exception:
+        summary["status"] = "failed"
+        summary["error"] = traceback.format_exc()
+    finally:
+        autoqc.TOLERANCE_RULES_FILE, autoqc.NAVDIF_BLOCK_SIZE, autoqc.NAVDIF_WORKERS = settings
+
+    try:
+        if report is not None:
+            report.writeJSON(os.path.join(outputDir, name + ".timing.json"))
+        if "json" in formats:
+            writeJSON(os.path.join(outputDir, name + ".json"), summary)
+        if "csv" in formats:
+            flat = flatten(OrderedDict([("project", projectFile), ("reference", summary["reference"]),
+                                        ("status", summary["status"])]))
+            flat.update(flatten(summary["results"] or {}))
+            writeCSV(os.path.join(outputDir, name + ".csv"), [{"field": key, "value": flat[key]} for key in flat],
+                     ["field", "value"])
+    except Exception:
+        summary["status"] = "failed"
+        summary["error"] = traceback.format_exc()
+
+    return summary
+
+def runBatch(roots, rule = DEFAULT_REFERENCE_RULE, outputDir = os.curdir, workers = 1,
+             formats = ("json", "csv"), parallel = False, printHandle = None, cacheDir = None,
+             cacheBytes = 1 << 30, timing = False, columnar = False, rulesFile = None, navdifBlockSize = None,
+             navdifWorkers = 1):
+    """
+    QC every project under roots with a pool of workers processes. Writes a
+    summary per project and an aggregate (AGGREGATE_NAME) to outputDir.
+    With cacheDir unchanged projects reuse the results cached there. With
+    timing a profiling report is written per project (name.timing.json).
+    With columnar the data files are converted to their columnar copies
+    first (see project.convertDataFiles), later runs read those. rulesFile
+    replaces the default tolerance rules (see tolerances.loadRules).
+    navdifBlockSize is the navdif epochs computed at a time (see
+    autoqc.NAVDIF_BLOCK_SIZE) and navdifWorkers the navdif processes of a
+    project (autoqc.NAVDIF_WORKERS), navdif is serial when projects are
+    processed by a pool. Returns the list of project summaries.
+    """
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+
+    tasks = []
+    used = set([AGGREGATE_NAME.lower()])
+    for root in roots:
+        for projectFile in findProjects(root):
+            name = uniqueName(summaryName(projectFile, root), used)
+            tasks.append((projectFile, name, rule, outputDir, formats, parallel, cacheDir, cacheBytes, timing,
+                          columnar, rulesFile, navdifBlockSize, navdifWorkers))
+
+    summaries = []
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for summary in pool.imap_unordered(qcProject, tasks):
+                summaries.append(summary)
+                if printHandle:
+                    printHandle("%s: %s" % (summary["status"], summary["project"]))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        for task in tasks:
+            summary = qcProject(task)
+            summaries.append(summary)
+            if printHandle:
+                printHandle("%s: %s" % (summary["status"], summary["project"]))
+
+    summaries.sort(key = lambda summary: summary["project"])
+
+    aggregate = [OrderedDict([("project", summary["project"]), ("reference", summary["reference"]),
+                              ("status", summary["status"]), ("error", summary["error"]),
+                              ("results", summary["results"])]) for summary in summaries]
+    if "json" in formats:
+        writeJSON(os.path.join(outputDir, AGGREGATE_NAME + ".json"), aggregate)
+    if "csv" in formats:
+        rows = []
+        columns = ["project", "reference", "status"]
+        for summary in summaries:
+            row = flatten(OrderedDict([("project", summary["project"]), ("reference", summary["reference"]),
+                                       ("status", summary["status"])]))
+            row.update(flatten(summary["results"] or {}))
+            for column in row:
+                if column not in columns:
+                    columns.append(column)
+            rows.append(row)
+        writeCSV(os.path.join(outputDir, AGGREGATE_NAME + ".csv"), rows, columns)
+
+    return summaries
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Run POSPac AutoQC on every project under a directory tree.")
+    parser.add_argument("roots", nargs = "*", help = "directories to scan for %s projects" % pos.PROJECT_FILETYPE_MASK)
+    parser.add_argument("-r", "--reference", default = DEFAULT_REFERENCE_RULE,
+                        help = "reference SBET rule, %%(path)s, %%(dir)s, %%(name)s and %%(kernel)s are "
+                               "substituted and glob wildcards allowed (default: %(default)s)")
+    parser.add_argument("-o", "--output", default = os.curdir, help = "folder for the summaries (default: current folder)")
+    parser.add_argument("-w", "--workers", type = int, default = multiprocessing.cpu_count(),
+                        help = "projects processed at once (default: number of cores)")
+    parser.add_argument("-f", "--format", choices = ["json", "csv", "both"], default = "both", help = "summary format")
+    parser.add_argument("--parallel-sections", action = "store_true", help = "run each project's sections in parallel")
+    parser.add_argument("-c", "--cache", help = "folder of the result cache, unchanged projects reuse cached results")
+    parser.add_argument("--cache-size", type = int, default = 1024, help = "result cache size limit in MB (default: %(default)s)")
+    parser.add_argument("--timing", action = "store_true", help = "write a timing report per project (name.timing.json)")
+    parser.add_argument("--columnar", action = "store_true",
+                        help = "convert the data files to columnar copies (one .npy per field) before QC")
+    parser.add_argument("--rules", help = "tolerance rules file (JSON) checked in place of the default tolerances")
+    parser.add_argument("--navdif-block-size", type = int,
+                        help = "navdif epochs computed at a time, bounds memory on long missions (default: all)")
+    parser.add_argument("--navdif-workers", type = int, default = 1,
+                        help = "navdif processes per project, only used with --workers 1 (default: %(default)s)")
+    parser.add_argument("--follow", metavar = "STATUS_FILE",
+                        help = "check the messages appended to a solution status file (iinkaru) that is still being "
+                               "written against the status rules until interrupted, no projects are scanned")
+    parser.add_argument("--status-fields", type = int, default = 5,
+                        help = "fields of the --follow status file (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    def printHandle(text):
+        print text
+
+    if args.follow:
+        rules = None
+        if args.rules:
+            rules = [rule for rule in tolerances.loadRules(args.rules) if autoqc.isStatusRule(rule)]
+        try:
+            autoqc.followStatus(args.follow, args.status_fields, printHandle, rules = rules)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if not args.roots:
+        parser.error("no roots to scan")
+
+    if args.format == "both":
+        formats = ("json", "csv")
+    else:
+        formats = (args.format,)
+
+    summaries = runBatch(args.roots, args.reference, args.output, args.workers, formats,
+                         args.parallel_sections, printHandle, args.cache, args.cache_size << 20, args.timing,
+                         args.columnar, args.rules, args.navdif_block_size, args.navdif_workers)
+
+    failed = [summary for summary in summaries if summary["status"] != "ok"]
+    print "%s projects, %s failed" % (len(summaries), len(failed))
+    if failed:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+#-------------------------------------------------------------------------------
+# Name:     autoqc_benchmark
+# Purpose:  Times dataFile and project open, getData, time lookups, navdif
+#           and a full autoqc run on synthetic projects (see synthpospac) of
+#           several mission lengths and appends the results to a history
+#           file so builds can be compared
+#
+# Usage:    python autoqc_benchmark.py [options]
+#           python autoqc_benchmark.py --help
+#-------------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import datetime
+import subprocess
+from collections import OrderedDict
+import numpy
+import ApplanixPOSPacModule as pos
+import navdif
+import autoqc
+import synthpospac
+
+# mission lengths benchmarked by default, hours
+DEFAULT_HOURS = [1, 8, 48]
+# results of every run, one JSON record per line
+DEFAULT_HISTORY = "benchmark_results.jsonl"
+# messages read by the getData and time lookup benchmarks
+SAMPLE_MESSAGES = 100000
+# scalar getMsgNumByTime lookups timed
+SCALAR_LOOKUPS = 1000
+
+def timeCall(function, repeat):
+    """
+    Returns the best wall clock seconds of repeat calls of function
+    """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def getBuild():
+    """
+    Identity of the code being benchmarked, the git commit (with a + when
+    the tree has local changes) or None outside a git checkout
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd = here,
+                                         stderr = open(os.devnull, 'w')).strip()
+        changes = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd = here,
+                                          stderr = open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    if changes:
+        commit += "+"
+    return commit
+
+def getDataset(workDir, hours, sbetRate, vnavRate, seed):
+    """
+    Returns the project file and reference SBET of the synthetic project for
+    hours in workDir, the project is only generated when it doesn't exist
+    with the same parameters
+    """
+    params = OrderedDict([("hours", hours), ("sbet_rate", sbetRate), ("vnav_rate", vnavRate), ("seed", seed)])
+    root = os.path.join(workDir, "synthetic_%sh" % hours)
+    paramsFile = os.path.join(root, "params.json")
+    name = "synthetic"
+    kernel = "S1"
+    projectFile = os.path.join(root, name + ".pospac")
+    sbetFile = os.path.join(root, name, kernel, pos.project.PROCESSED_DIR, "sbet_%s.out" % kernel)
+    try:
+        if json.load(open(paramsFile), object_pairs_hook = OrderedDict) == params:
+            return projectFile, sbetFile, 0.0
+    except (IOError, ValueError):
+        pass
+
+    start = time.time()
+    # a vnav gap, some clock drift and a bad segment an hour in (or half way)
+    middle = min(3600.0, hours * 1800.0)
+    synthpospac.makeProject(root, hours, name, kernel, sbetRate, vnavRate, gaps = [(middle, 30.0)], drift = 2.0,
+                            badSegments = [(middle + 300.0, 120.0)], seed = seed)
+    generate = time.time() - start
+    fid = open(paramsFile, 'w')
+    json.dump(params, fid)
+    fid.close()
+    return projectFile, sbetFile, generate
+
+def benchmarkDataset(projectFile, sbetFile, repeat, workDir):
+    """
+    Times the dataFile and QC operations on one synthetic project, returns
+    an OrderedDict of seconds by operation
+    """
+    project = pos.project(projectFile)
+    vnavFile = project.getDataFilePath("vnav", project.EXTRACTED_DIR)
+    fields = project.dataFileFieldCounts["sbet"]
+    sbet = pos.dataFile(sbetFile, fields)
+    random = numpy.random.RandomState(0)
+
+    sample = min(SAMPLE_MESSAGES, sbet.messages)
+    spaced = range(sbet.arrayStart, sbet.messages + sbet.arrayStart, max(sbet.messages // sample, 1))
+    scattered = numpy.sort(random.randint(sbet.arrayStart, sbet.messages + sbet.arrayStart, sample))
+    times = random.uniform(sbet.startTime, sbet.endTime, sample)
+    scalarTimes = times[:SCALAR_LOOKUPS]
+
+    def open_():
+        pos.dataFile(sbetFile, fields)
+
+    def openProject():
+        # kernel and data files from the manifest written by the first call
+        pos.project(projectFile).listDataFiles()
+
+    def lookupScalar():
+        for t in scalarTimes:
+            sbet.getMsgNumByTime(t)
+
+    def lookupBatch():
+        # fresh object so reading the time field is part of the cost
+        pos.dataFile(sbetFile, fields).getPreciseMsgNumsByTime(times)
+
+    navdifFile = os.path.join(workDir, "benchmark_navdif.out")
+
+    def navdif_():
+        navdif.navdif(pos.dataFile(sbetFile, fields), pos.dataFile(vnavFile, fields), navdifFile, autoqc.NAVDIF_INC)
+
+    def autoqc_():
+        autoqc.autoqc(projectFile, sbetFile, [].append, False)
+
+    timings = OrderedDict()
+    timings["open"] = timeCall(open_, repeat)
+    timings["project_open"] = timeCall(openProject, repeat)
+    timings["getData_spaced"] = timeCall(lambda: sbet.getData(spaced, range(1, fields + 1)), repeat)
+    timings["getData_scattered"] = timeCall(lambda: sbet.getData(scattered, range(1, fields + 1)), repeat)
+    timings["getDataRange_time"] = timeCall(lambda: sbet.getDataRange(sbet.arrayStart, sbet.messages + sbet.arrayStart, [1]), repeat)
+    timings["time_lookup_scalar"] = timeCall(lookupScalar, repeat)
+    timings["time_lookup_batch"] = timeCall(lookupBatch, repeat)
+    timings["navdif"] = timeCall(navdif_, repeat)
+    timings["autoqc"] = timeCall(autoqc_, repeat)
+    if os.path.exists(navdifFile):
+        os.remove(navdifFile)
+    return timings
+
+def runBenchmark(hoursList = DEFAULT_HOURS, workDir = "benchmark_data", repeat = 3, sbetRate = 200.0,
+                 vnavRate = 50.0, seed = 0, label = None, printHandle = None):
+    """
+    Benchmarks a synthetic project for every mission length in hoursList,
+    the projects are generated in workDir on first use and reused after.
+    Returns the result record.
+    """
+    if not os.path.isdir(workDir):
+        os.makedirs(workDir)
+
+    record = OrderedDict()
+    record["label"] = label
+    record["build"] = getBuild()
+    record["date"] = datetime.datetime.now().isoformat()
+    record["host"] = socket.gethostname()
+    record["python"] = platform.python_version()
+    record["numpy"] = numpy.__version__
+    record["repeat"] = repeat
+    record["sbet_rate"] = sbetRate
+    record["vnav_rate"] = vnavRate
+    record["scales"] = OrderedDict()
+
+    for hours in hoursList:
+        projectFile, sbetFile, generate = getDataset(workDir, hours, sbetRate, vnavRate, seed)
+        timings = benchmarkDataset(projectFile, sbetFile, repeat, workDir)
+        timings["generate"] = generate
+        record["scales"]["%sh" % hours] = timings
+        if printHandle:
+            for name in timings:
+                printHandle("%sh\t%-20s\t%.4f s" % (hours, name, timings[name]))
+
+    return record
+
+def loadHistory(historyFile):
+    """
+    Returns the records in the history file, oldest first
+    """
+    if not os.path.exists(historyFile):
+        return []
+    records = []
+    for line in open(historyFile):
+        if line.strip():
+            records.append(json.loads(line, object_pairs_hook = OrderedDict))
+    return records
+
+def appendHistory(historyFile, record):
+    fid = open(historyFile, 'a')
+    fid.write(json.dumps(record) + "\n")
+    fid.close()
+
+def compareRecords(previous, current, printHandle):
+    """
+    Prints the timings of current next to previous with the ratio, for the
+    scales and operations both records have
+    """
+    printHandle("%s (%s) vs %s (%s)" % (current["build"], current["label"], previous["build"], previous["label"]))
+    for scale in current["scales"]:
+        if scale not in previous["scales"]:
+            continue
+        for name in current["scales"][scale]:
+            if name == "generate" or name not in previous["scales"][scale]:
+                continue
+            now = current["scales"][scale][name]
+            before = previous["scales"][scale][name]
+            ratio = now / before if before else float("nan")
+            printHandle("%s\t%-20s\t%.4f s\t%.4f s\t%.2fx" % (scale, name, now, before, ratio))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark dataFile, navdif and autoqc on synthetic projects.")
+    parser.add_argument("--hours", type = lambda text: [float(h) if "." in h else int(h) for h in text.split(",")],
+                        default = DEFAULT_HOURS, help = "mission lengths in hours (default: 1,8,48)")
+    parser.add_argument("-d", "--data", default = "benchmark_data",
+                        help = "folder for the synthetic projects, reused between runs (default: %(default)s)")
+    parser.add_argument("-o", "--history", default = DEFAULT_HISTORY,
+                        help = "results history, one JSON record per run is appended (default: %(default)s)")
+    parser.add_argument("-n", "--repeat", type = int, default = 3, help = "best of n calls per operation (default: %(default)s)")
+    parser.add_argument("-l", "--label", help = "label stored with the results")
+    parser.add_argument("--sbet-rate", type = float, default = 200.0, help = "sbet messages a second (default: %(default)s)")
+    parser.add_argument("--vnav-rate", type = float, default = 50.0, help = "vnav messages a second (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    def printHandle(text):
+        print text
+
+    history = loadHistory(args.history)
+    record = runBenchmark(args.hours, args.data, args.repeat, args.sbet_rate, args.vnav_rate,
+                          label = args.label, printHandle = printHandle)
+    appendHistory(args.history, record)
+
+    if history:
+        print
+        compareRecords(history[-1], record, printHandle)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,6 +10,12 @@ from RegistryEnv_v1 import RegistryEnv
 # begin wxGlade: extracode
 # end wxGlade
 
+# milliseconds between display updates while QC runs in the background
+REFRESH_INTERVAL = 100
+# seconds to wait on closing for a cancelled QC run to stop, the worker is a
+# daemon thread so the window closes anyway
+CLOSE_TIMEOUT = 1.0
+
 env = RegistryEnv()
 if not "defaultPathPOS" in env:
     env["defaultPathPOS"] = os.curdir
@@ -40,10 +46,16 @@ class MyFrame(wx.Frame):
         wx.EVT_BUTTON(self.btn_pos, 		self.btn_pos.GetId(), 		self.OnOpenPOS)
         wx.EVT_BUTTON(self.btn_sbet, 		self.btn_sbet.GetId(), 		self.OnOpenSBET)
         wx.EVT_BUTTON(self.btn_run, 		self.btn_run.GetId(), 		self.OnRunQC)
+        wx.EVT_CLOSE(self, self.OnClose)
 
         # after run status is set to true
         self.result_status = False
 
+        # background QC run, collected by the timer
+        self.worker = None
+        self.timer = wx.Timer(self)
+        wx.EVT_TIMER(self, self.timer.GetId(), self.OnTimer)
+
 
     def __set_properties(self):
         # begin wxGlade: MyFrame.__set_properties
@@ -109,13 +121,48 @@ class MyFrame(wx.Frame):
             env["defaultPathSBET"] = os.path.split(path)[0]
 
     def OnRunQC(self, event):
+        if self.worker is not None:
+            # the button cancels while QC is running
+            self.worker.cancel()
+            self.btn_run.Disable()
+            return
         if not self.result_status or self.Reset():
             posPath = self.txt_pos.Value
             sbetPath = self.txt_sbet.Value
 
             if os.path.exists(posPath) and os.path.exists(sbetPath):
                 self.result_status = True
-                autoqc.autoqc(posPath,sbetPath,self.UpdateTxt,self.Progress)
+                self.gauge.SetValue(0)
+                self.worker = autoqc.qcWorker(posPath,sbetPath)
+                self.worker.start()
+                self.btn_run.SetLabel("Cancel Auto QC")
+                self.btn_pos.Disable()
+                self.btn_sbet.Disable()
+                self.timer.Start(REFRESH_INTERVAL)
+
+    def OnTimer(self, event):
+        lines, progress, state = self.worker.poll()
+        if lines:
+            self.UpdateTxt("\n".join(lines))
+        self.Progress(progress)
+        if state != "running":
+            self.timer.Stop()
+            if state == "cancelled":
+                self.UpdateTxt("Auto QC cancelled.")
+            elif state == "failed":
+                self.UpdateTxt("Auto QC failed:\n%s" % self.worker.error)
+            self.worker = None
+            self.btn_run.SetLabel("Run Auto QC")
+            self.btn_run.Enable()
+            self.btn_pos.Enable()
+            self.btn_sbet.Enable()
+
+    def OnClose(self, event):
+        if self.worker is not None:
+            self.timer.Stop()
+            self.worker.cancel()
+            self.worker.join(CLOSE_TIMEOUT)
+        event.Skip()
 
     def ClearTxt(self):
         self.text_ctrl_1.Clear()
@@ -123,16 +170,10 @@ class MyFrame(wx.Frame):
     def UpdateTxt(self,text):
         print text
         self.text_ctrl_1.WriteText("%s\n" % text)
-        # if needed give processor a break to catch up rendering the GUI
-        while wx.GetApp().Pending():
-            wx.GetApp().Dispatch()
 
     def Progress(self, value, start_time = 0):
-        #print time.time() - start_time
-        self.gauge.SetValue(value)
-        # if needed give processor a break to catch up rendering the GUI
-        while wx.GetApp().Pending():
-            wx.GetApp().Dispatch()
+        if int(value) != self.gauge.GetValue():
+            self.gauge.SetValue(int(value))
 
     def Reset(self):
         dlg = wx.MessageDialog(self,"This will reset the previous results. Continue?","Reset?", wx.YES_NO)
@@ -16,6 +16,12 @@
 # Licence:  <your licence>
 #-------------------------------------------------------------------------------
 import math
+import pylab as pl
+
+# GRS80 ellipsoid params
+GRS80_A = 6378137
+GRS80_B = 6356752.31414
+GRS80_F = 1/298.257222101
 
 #-------------------------------------------------------------------------------
 
@@ -39,25 +45,28 @@ def distVincenty (lat1, lon1, lat2, lon2):
     cosU2 = math.cos(U2)
 
     lmda = L
-    lmdaP = 0
     iterLimit = 100
 
-    while (abs(lmda-lmdaP) > 1e-12 and --iterLimit>0):
+    while True:
         sinlmda = math.sin(lmda)
         coslmda = math.cos(lmda)
         sinSigma = math.sqrt((cosU2*sinlmda) * (cosU2*sinlmda) + (cosU1*sinU2-sinU1*cosU2*coslmda) * (cosU1*sinU2-sinU1*cosU2*coslmda))
-        if (sinSigma==0): return 0  # co-incident points
+        if (sinSigma==0): return [0.0, 0.0, 0.0]  # co-incident points
         cosSigma = sinU1*sinU2 + cosU1*cosU2*coslmda
         sigma = math.atan2(sinSigma, cosSigma)
         sinAlpha = cosU1 * cosU2 * sinlmda / sinSigma
         cosSqAlpha = 1 - sinAlpha*sinAlpha
-        cos2SigmaM = cosSigma - 2*sinU1*sinU2/cosSqAlpha
-        #if (isNaN(cos2SigmaM)): cos2SigmaM = 0  # equatorial line: cosSqAlpha=0 (?6)
+        if (cosSqAlpha==0): cos2SigmaM = 0  # equatorial line: cosSqAlpha=0 (?6)
+        else: cos2SigmaM = cosSigma - 2*sinU1*sinU2/cosSqAlpha
         C = f/16*cosSqAlpha*(4+f*(4-3*cosSqAlpha))
         lmdaP = lmda
         lmda = L + (1-C) * f * sinAlpha * (sigma + C*sinSigma*(cos2SigmaM+C*cosSigma*(-1+2*cos2SigmaM*cos2SigmaM)))
+        # do while in the original javascript, at least one iteration
+        if not (abs(lmda-lmdaP) > 1e-12): break
+        iterLimit -= 1
+        if (iterLimit==0): break
 
-    if (iterLimit==0): return NaN  # formula failed to converge
+    if (iterLimit==0): return [float('nan')] * 3  # formula failed to converge
 
     uSq = cosSqAlpha * (a*a - b*b) / (b*b)
     A = 1 + uSq/16384*(4096+uSq*(-768+uSq*(320-175*uSq)))
@@ -72,6 +81,108 @@ def distVincenty (lat1, lon1, lat2, lon2):
     revAz = math.atan2(cosU1*sinlmda, -sinU1*cosU2+cosU1*sinU2*coslmda)
     return [ s, fwdAz, revAz]
 
+def distVincentyArray (lat1, lon1, lat2, lon2, iterLimit = 100):
+    # Array version of distVincenty, lat1, lon1, lat2 and lon2 are arrays (or
+    # scalars) in radians. Only the points that haven't converged are iterated
+    # and non-converging points are given up on after iterLimit iterations,
+    # the same as distVincenty. Returns [distance, fwdAz, revAz] arrays,
+    # co-incident points return 0 for all three and non-converging points NaN.
+    lat1, lon1, lat2, lon2 = pl.broadcast_arrays(*[pl.asarray(x, dtype=pl.float64) for x in (lat1, lon1, lat2, lon2)])
+    a = GRS80_A
+    b = GRS80_B
+    f = GRS80_F
+    L = (lon2 - lon1).ravel()
+    U1 = pl.arctan((1-f) * pl.tan(lat1.ravel()))
+    U2 = pl.arctan((1-f) * pl.tan(lat2.ravel()))
+    sinU1 = pl.sin(U1)
+    cosU1 = pl.cos(U1)
+    sinU2 = pl.sin(U2)
+    cosU2 = pl.cos(U2)
+
+    n = len(L)
+    lmda = L.copy()
+    sinlmda = pl.zeros(n)
+    coslmda = pl.zeros(n)
+    sinSigma = pl.zeros(n)
+    cosSigma = pl.zeros(n)
+    sigma = pl.zeros(n)
+    cosSqAlpha = pl.zeros(n)
+    cos2SigmaM = pl.zeros(n)
+
+    active = pl.arange(n) # indexes of the points still iterating
+    coincident = pl.zeros(n, dtype=bool)
+    for iteration in xrange(iterLimit):
+        if len(active) == 0:
+            break
+        sl = pl.sin(lmda[active])
+        cl = pl.cos(lmda[active])
+        cU1 = cosU1[active]
+        sU1 = sinU1[active]
+        cU2 = cosU2[active]
+        sU2 = sinU2[active]
+        ss = pl.sqrt((cU2*sl) * (cU2*sl) + (cU1*sU2-sU1*cU2*cl) * (cU1*sU2-sU1*cU2*cl))
+        cs = sU1*sU2 + cU1*cU2*cl
+
+        # co-incident points are done
+        done = ss == 0
+        coincident[active[done]] = True
+        ss[done] = 1 # avoid dividing by zero, results discarded
+
+        sg = pl.arctan2(ss, cs)
+        sa = cU1 * cU2 * sl / ss
+        csa = 1 - sa*sa
+        # equatorial line: cosSqAlpha=0 (?6)
+        c2sm = cs - 2*sU1*sU2/pl.where(csa==0, 1, csa)
+        c2sm[csa==0] = 0
+        C = f/16*csa*(4+f*(4-3*csa))
+        lmdaP = lmda[active]
+        lmdaNew = L[active] + (1-C) * f * sa * (sg + C*ss*(c2sm+C*cs*(-1+2*c2sm*c2sm)))
+
+        sinlmda[active] = sl
+        coslmda[active] = cl
+        sinSigma[active] = ss
+        cosSigma[active] = cs
+        sigma[active] = sg
+        cosSqAlpha[active] = csa
+        cos2SigmaM[active] = c2sm
+        lmda[active] = lmdaNew
+
+        # NaN points (e.g. missing epochs) are done, their results stay NaN
+        with pl.errstate(invalid='ignore'):
+            done |= ~(abs(lmdaNew-lmdaP) > 1e-12)
+        active = active[~done]
+
+    uSq = cosSqAlpha * (a*a - b*b) / (b*b)
+    A = 1 + uSq/16384*(4096+uSq*(-768+uSq*(320-175*uSq)))
+    B = uSq/1024 * (256+uSq*(-128+uSq*(74-47*uSq)))
+    deltaSigma = B*sinSigma*(cos2SigmaM+B/4*(cosSigma*(-1+2*cos2SigmaM*cos2SigmaM) - B/6*cos2SigmaM*(-3+4*sinSigma*sinSigma)*(-3+4*cos2SigmaM*cos2SigmaM)))
+    s = b*A*(sigma-deltaSigma)
+
+    s = pl.around(s,3) # round to 1mm precision
+
+    fwdAz = pl.arctan2(cosU2*sinlmda,  cosU1*sinU2-sinU1*cosU2*coslmda)
+    revAz = pl.arctan2(cosU1*sinlmda, -sinU1*cosU2+cosU1*sinU2*coslmda)
+
+    s[coincident] = 0
+    fwdAz[coincident] = 0
+    revAz[coincident] = 0
+    # formula failed to converge
+    s[active] = pl.nan
+    fwdAz[active] = pl.nan
+    revAz[active] = pl.nan
+
+    shape = lat1.shape
+    return [s.reshape(shape), fwdAz.reshape(shape), revAz.reshape(shape)]
+
+def radiiOfCurvature(lat):
+    # GRS80 meridian and prime vertical radii of curvature in metres at
+    # latitude lat (radians), lat may be an array
+    e2 = GRS80_F * (2 - GRS80_F)
+    w = pl.sqrt(1 - e2 * pl.sin(lat)**2)
+    meridian = GRS80_A * (1 - e2) / w**3
+    primeVertical = GRS80_A / w
+    return [meridian, primeVertical]
+
 def toRad(deg):
     return deg/180*math.pi
 def toDeg(rad):
@@ -81,6 +192,8 @@ if __name__ == "__main__":
 #
 # Test case:
 #
-    ret = distVincenty(toRad(50.06632222222222),toRad(-5.71475),toRad(58.64402222222222),(-3.0700944444444445))
-    print ret['distance'] # 969954.114
-    print toDeg(ret['initialBearing']) # 9.14186190832
\ No newline at end of file
+    ret = distVincenty(toRad(50.06632222222222),toRad(-5.71475),toRad(58.64402222222222),toRad(-3.0700944444444445))
+    print ret[0] # 969954.114
+    print toDeg(ret[1]) # 9.14186190832
+    ret = distVincentyArray(toRad(pl.array([50.06632222222222])),toRad(-5.71475),toRad(58.64402222222222),toRad(-3.0700944444444445))
+    print ret[0][0], toDeg(ret[1][0])
\ No newline at end of file
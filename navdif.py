@@ -1,13 +1,325 @@
+import time
 import struct
 import math
+import multiprocessing
 import geodetic
 import pylab as pl
 import ApplanixPOSPacModule as pos
+import profiling
+import resample
+
+# standard navigation record fields read from both files (time through wander)
+NAVDIF_READ_FIELDS = range(1,12)
+# number of double fields in a navdif output message
+NAVDIF_FIELD_COUNT = 14
+# interp mode that low-pass filters both files to the epoch rate
+LOWPASS = "lowpass"
+# epochs between progress updates without a blockSize, a progress callback
+# that raises (e.g. a cancelled autoqc run) stops navdif between blocks
+PROGRESS_EPOCHS = 1 << 14
 
 ################################################################################
 ## MAIN CODE
 ################################################################################
-def navdif (solution, ref, navdif_filename, inc = 5, progressHandle = False):
+def navdif (solution, ref, navdif_filename, inc = 5, progressHandle = False, interp = False, blockSize = None, workers = 1,
+            skipGaps = True):
+    """
+    Differences solution against ref every inc seconds over their common
+    whole second interval and writes the 14 field navdif messages to
+    navdif_filename. Epochs are computed as arrays and written with one
+    bulk write per block. With skipGaps (the default) the epochs inside a
+    gap of either file are left out, with skipGaps = False the output is the
+    same as navdifByEpoch.
+
+    With interp the files are interpolated at the epochs (Hermite position,
+    angle aware attitude) instead of sampled at the nearest message. With
+    interp = LOWPASS both files are low-pass filtered to the epoch rate
+    (see resample) so motion faster than the epochs doesn't alias, the
+    epochs start and end a filter half width inside the common interval
+    and epochs in gaps are NaN.
+
+    With blockSize the common interval is streamed blockSize epochs at a
+    time, each block reads only the messages bracketing its epochs so peak
+    memory doesn't grow with the length of the files. The output is the
+    same as a single block. Without it the epochs are one block, or blocks
+    of PROGRESS_EPOCHS with a progressHandle so progress is reported, and
+    the run can be stopped, between blocks.
+
+    With more than one worker the common interval is split into partitions
+    processed by a pool of processes (see navdifParallel), the output is the
+    same as a serial run. navdif runs serially in a pool worker process
+    (e.g. autoqc_batch), those can't start processes of their own.
+
+    The gaps skipped are those of dataFile.getGaps, the epochs strictly
+    between the last message before a gap and the first after it
+    (gapEpochRanges).
+
+    With profiling on the epochs and run time are added to the report, the
+    reads made by parallel workers are not counted.
+    """
+    runStart = time.time()
+
+    ## Get Times
+    startTime = solution.getCommonIntStart(ref)
+    endTime = solution.getCommonIntEnd(ref)
+    lastTime = min(solution.endTime,ref.endTime)
+
+    if interp == LOWPASS:
+        # every epoch needs a full filter window in both files
+        halfWidth = resample.filterSettings(1.0 / inc)[1]
+        startTime += math.ceil(halfWidth)
+        lastTime -= halfWidth
+
+    epochs = epochCount(startTime,endTime,inc,lastTime)
+    skipped = gapEpochRanges([solution,ref],startTime,inc,epochs) if skipGaps else pl.zeros((0,2),dtype=pl.int64)
+
+    if progressHandle:
+        progressHandle(0.0)
+
+    if workers > 1 and multiprocessing.current_process().daemon:
+        workers = 1
+    if workers > 1 and epochs > 1:
+        navdifParallel(solution,ref,navdif_filename,startTime,inc,epochs,progressHandle,interp,blockSize,workers,skipped)
+        if profiling.report is not None:
+            profiling.report.addEpochs("navdif",keptBefore(skipped,epochs),time.time() - runStart)
+        return
+
+    if not blockSize:
+        blockSize = PROGRESS_EPOCHS if progressHandle else max(epochs,1)
+
+    fid = open(navdif_filename,'wb')
+
+    for blockStart in xrange(0,epochs,blockSize):
+        blockEnd = min(blockStart + blockSize,epochs)
+        messages = navdifBlock(solution,ref,startTime,inc,blockStart,blockEnd,interp,blockEnd - blockStart < epochs,skipped)
+        messages.astype("=f8").tofile(fid)
+
+        if progressHandle:
+            progressHandle(float(blockEnd) / epochs * 100.0)
+
+    fid.close()
+
+    if profiling.report is not None:
+        profiling.report.addEpochs("navdif",keptBefore(skipped,epochs),time.time() - runStart)
+
+def navdifParallel(solution, ref, navdif_filename, startTime, inc, epochs, progressHandle = False, \
+                   interp = False, blockSize = None, workers = 2, skipped = None):
+    """
+    Splits epochs 0 to epochs into partitions and runs them in a pool of
+    workers processes. Each worker opens its own memory mapped view of both
+    files and writes its messages directly to their offset in the output
+    file, which is sized up front. skipped are the epoch ranges left out
+    (see gapEpochRanges).
+
+    Callers on Windows must start the process from under an
+    if __name__ == "__main__" guard (see multiprocessing).
+    """
+    if skipped is None:
+        skipped = pl.zeros((0,2),dtype=pl.int64)
+    fid = open(navdif_filename,'wb')
+    fid.truncate(keptBefore(skipped,epochs) * NAVDIF_FIELD_COUNT * pos.dataFile.fieldLength)
+    fid.close()
+
+    # a few partitions per worker to even out the load
+    partitions = min(epochs,workers * 4)
+    bounds = [epochs * i // partitions for i in xrange(partitions + 1)]
+    tasks = [(solution.filename,solution.fields,ref.filename,ref.fields,navdif_filename, \
+              startTime,inc,bounds[i],bounds[i + 1],interp,blockSize,skipped) for i in xrange(partitions)]
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        done = 0
+        for count in pool.imap_unordered(navdifPartition,tasks):
+            done += count
+            if progressHandle:
+                progressHandle(float(done) / epochs * 100.0)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def navdifPartition(task):
+    """
+    navdifParallel worker, computes epochs first to last in blocks and writes
+    them at their offset in the output file. Returns the number of epochs.
+    """
+    solutionFilename, solutionFields, refFilename, refFields, navdif_filename, \
+        startTime, inc, first, last, interp, blockSize, skipped = task
+
+    solution = pos.dataFile(solutionFilename,solutionFields)
+    ref = pos.dataFile(refFilename,refFields)
+    if not blockSize:
+        blockSize = max(last - first,1)
+
+    fid = open(navdif_filename,'r+b')
+    fid.seek(keptBefore(skipped,first) * NAVDIF_FIELD_COUNT * pos.dataFile.fieldLength)
+    for blockStart in xrange(first,last,blockSize):
+        blockEnd = min(blockStart + blockSize,last)
+        messages = navdifBlock(solution,ref,startTime,inc,blockStart,blockEnd,interp,True,skipped)
+        messages.astype("=f8").tofile(fid)
+    fid.close()
+
+    return last - first
+
+def navdifBlock(solution, ref, startTime, inc, first, last, interp = False, windowed = True, skipped = None):
+    """
+    Computes the navdif messages for epochs first up to (not including) last
+    less the skipped epoch ranges (see gapEpochRanges). windowed limits the
+    time lookups to the messages bracketing the block, otherwise the time
+    field of the whole file is searched.
+    """
+    times = epochTimes(startTime,inc,first,last)
+    if skipped is not None and len(skipped):
+        times = times[~inRanges(skipped,pl.arange(first,last))]
+        if len(times) == 0:
+            return pl.zeros((0,NAVDIF_FIELD_COUNT),dtype=pl.float64)
+
+    if windowed:
+        solution_data = sampleByTime(solution,times,interp,solution.getMsgWindowByTime(times[0],times[-1]),1.0 / inc)
+        ref_data = sampleByTime(ref,times,interp,ref.getMsgWindowByTime(times[0],times[-1]),1.0 / inc)
+    else:
+        solution_data = sampleByTime(solution,times,interp,rate = 1.0 / inc)
+        ref_data = sampleByTime(ref,times,interp,rate = 1.0 / inc)
+
+    return navdifMessages(times,solution_data,ref_data)
+
+def epochCount(startTime, endTime, inc, lastTime = None):
+    """
+    Number of navdif epochs in range(startTime,endTime,inc), less any epochs
+    after lastTime (the common end time is rounded up to a whole second)
+    """
+    epochs = max(int(math.ceil((endTime - startTime) / float(inc))),0)
+    if lastTime is not None:
+        epochs = min(epochs,max(int(math.floor((lastTime - startTime) / float(inc))) + 2,0))
+        while epochs > 0 and epochTimes(startTime,inc,epochs - 1,epochs)[0] > lastTime:
+            epochs -= 1
+    return epochs
+
+def gapEpochRanges(files, startTime, inc, epochs):
+    """
+    The epochs strictly inside a gap of any of the files, a sorted (ranges x
+    2) array of non-overlapping [first, last) epoch ranges
+    """
+    ranges = []
+    for dblfile in files:
+        gaps = dblfile.getGaps()
+        first = pl.floor((gaps["start"] - startTime) / inc).astype(pl.int64) + 1
+        last = pl.ceil((gaps["end"] - startTime) / inc).astype(pl.int64)
+        ranges.append(pl.column_stack((first.clip(0,epochs),last.clip(0,epochs))))
+    ranges = pl.concatenate(ranges) if ranges else pl.zeros((0,2),dtype=pl.int64)
+    ranges = ranges[ranges[:,1] > ranges[:,0]]
+    ranges = ranges[pl.argsort(ranges[:,0],kind='mergesort')]
+
+    merged = []
+    for first, last in ranges:
+        if merged and first <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1],last)
+        else:
+            merged.append([first,last])
+    return pl.array(merged,dtype=pl.int64).reshape((len(merged),2))
+
+def inRanges(ranges, epochs):
+    """
+    True for the epochs inside one of the sorted [first, last) ranges
+    """
+    which = pl.searchsorted(ranges[:,0],epochs,'right') - 1
+    return (which >= 0) & (epochs < ranges[which.clip(0,None),1])
+
+def keptBefore(ranges, epoch):
+    """
+    Number of epochs before epoch that aren't in the ranges, the output
+    message number of epoch
+    """
+    return epoch - int(((pl.minimum(ranges[:,1],epoch) - ranges[:,0]).clip(0,None)).sum())
+
+def epochTimes(startTime, inc, first, last):
+    """
+    Times of navdif epochs first up to (not including) last, computed the
+    same way for any block so streamed blocks match a single block
+    """
+    return startTime + pl.arange(first,last,dtype=pl.float64) * inc
+
+def sampleByTime(dblfile, times, interp = False, window = None, rate = None):
+    """
+    Reads the navdif fields of dblfile at times, either the nearest message,
+    interpolated or low-pass filtered to rate (interp = LOWPASS). window
+    limits the time lookup to a message range (see
+    dataFile.getMsgWindowByTime). Returns a (times x fields) array.
+    """
+    if interp == LOWPASS:
+        return resample.resampleByTime(dblfile,times,NAVDIF_READ_FIELDS,pos.SBET_ANGLE_FIELDS,rate = rate)
+    elif interp:
+        return dblfile.interpByTimes(times,NAVDIF_READ_FIELDS,pos.SBET_ANGLE_FIELDS,hermite = True,window = window)
+    else:
+        return dblfile.getData(dblfile.getMsgNumsByTime(times,window),NAVDIF_READ_FIELDS)
+
+def navdifMessages(times, solution_data, ref_data):
+    """
+    Computes the navdif messages for arrays of epochs, solution_data and
+    ref_data hold the NAVDIF_READ_FIELDS at each epoch. Returns a
+    (times x NAVDIF_FIELD_COUNT) array.
+    """
+    fld = {'time' : 0, 'lat' : 1, 'lon' : 2, 'alt' : 3, 'xVel' : 4, \
+           'yVel' : 5, 'zVel' : 6, 'roll' : 7,'pitch' : 8, 'heading' : 9, \
+           'wander' : 10 }
+
+    sol = dict((key, solution_data[:,fld[key]]) for key in fld)
+    ref = dict((key, ref_data[:,fld[key]]) for key in fld)
+
+    messages = pl.zeros((len(times),NAVDIF_FIELD_COUNT),dtype=pl.float64)
+
+    # time
+    messages[:,0] = times
+
+    #position difference
+    posDiff = geodetic.distVincentyArray(ref['lat'], ref['lon'], sol['lat'], sol['lon'])
+
+    northPosDiff = posDiff[0] * pl.cos(posDiff[1])
+    eastPosDiff = posDiff[0] * pl.sin(posDiff[1])
+    downPosDiff = ref['alt'] - sol['alt']
+
+    messages[:,1] = northPosDiff
+    messages[:,2] = eastPosDiff
+    messages[:,3] = downPosDiff
+
+    #velocity difference
+    velNorthSol, velEastSol, velDownSol = pos.trueVelocity(sol['xVel'],sol['yVel'],sol['zVel'],sol['wander'])
+    velNorthRef, velEastRef, velDownRef = pos.trueVelocity(ref['xVel'],ref['yVel'],ref['zVel'],ref['wander'])
+
+    velNorthDiff = velNorthSol - velNorthRef
+    velEastDiff = velEastSol - velEastRef
+    velDownDiff = velDownSol - velDownRef
+
+    messages[:,4] = velNorthDiff
+    messages[:,5] = velEastDiff
+    messages[:,6] = velDownDiff
+
+    # roll difference
+    messages[:,7] = sol['roll'] - ref['roll']
+
+    # pitch difference
+    messages[:,8] = sol['pitch'] - ref['pitch']
+
+    # heading difference
+    messages[:,9] = pos.trueHeading(ref['heading'],ref['wander']) - pos.trueHeading(sol['heading'],sol['wander'])
+
+    # 2D radial position difference
+    messages[:,10] = pl.sqrt(northPosDiff**2 + eastPosDiff**2)
+    # 3D radial position difference
+    messages[:,11] = pl.sqrt(northPosDiff**2 + eastPosDiff**2 + downPosDiff**2)
+    # 2D radial velocity difference
+    messages[:,12] = pl.sqrt(velNorthDiff**2 + velEastDiff**2)
+    # 3D radial velocity difference
+    messages[:,13] = pl.sqrt(velNorthDiff**2 + velEastDiff**2 + velDownDiff**2)
+
+    return messages
+
+def navdifByEpoch (solution, ref, navdif_filename, inc = 5, progressHandle = False):
+    """
+    Original epoch by epoch navdif, kept for comparison with navdif
+    """
 
     fid = open(navdif_filename,'wb')
 
@@ -0,0 +1,145 @@
+#-------------------------------------------------------------------------------
+# Name:     profiling
+# Purpose:  Optional instrumentation of QC runs, wall and CPU time per report
+#           section, seeks and bytes read per data file, navdif epochs per
+#           second and time spent in the print and progress callbacks,
+#           reported as JSON
+#
+# Usage:    report = profiling.timingReport()
+#           autoqc.autoqc(projectFile, navdifRefFile, printHandle,
+#                         progressHandle, timing = report)
+#           report.writeJSON("timing.json")
+#-------------------------------------------------------------------------------
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+try:
+    import resource # finer CPU times than os.times, not on Windows
+except ImportError:
+    resource = None
+
+# timingReport being filled, None when instrumentation is off. The
+# instrumented code only checks this before recording anything.
+report = None
+
+def cpuTime():
+    """
+    User plus system CPU seconds of the process
+    """
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+    times = os.times()
+    return times[0] + times[1]
+
+class timingReport():
+    """
+    Timings and counters of one or more QC runs, safe to fill from several
+    threads. Make it the active report with start (or pass it to autoqc)
+    and stop it when done.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = None
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.sections = OrderedDict()
+        self.files = OrderedDict()
+        self.callbacks = OrderedDict()
+        self.epochs = OrderedDict()
+
+    def start(self):
+        """
+        Makes this the active report, returns the report it replaces
+        """
+        global report
+        previous = report
+        report = self
+        self.started = (time.time(), cpuTime())
+        return previous
+
+    def stop(self, previous = None):
+        """
+        Restores the previous active report and adds the time since start
+        """
+        global report
+        if self.started is not None:
+            self.wall += time.time() - self.started[0]
+            self.cpu += cpuTime() - self.started[1]
+            self.started = None
+        report = previous
+
+    def addSection(self, name, wall, cpu):
+        with self.lock:
+            section = self.sections.setdefault(name, OrderedDict([("calls", 0), ("wall", 0.0), ("cpu", 0.0)]))
+            section["calls"] += 1
+            section["wall"] += wall
+            section["cpu"] += cpu
+
+    def addRead(self, filename, seeks, bytes):
+        with self.lock:
+            counters = self.files.setdefault(filename, OrderedDict([("reads", 0), ("seeks", 0), ("bytes_read", 0)]))
+            counters["reads"] += 1
+            counters["seeks"] += seeks
+            counters["bytes_read"] += bytes
+
+    def addCallback(self, name, seconds):
+        with self.lock:
+            callback = self.callbacks.setdefault(name, OrderedDict([("calls", 0), ("seconds", 0.0)]))
+            callback["calls"] += 1
+            callback["seconds"] += seconds
+
+    def addEpochs(self, name, epochs, seconds):
+        with self.lock:
+            stage = self.epochs.setdefault(name, OrderedDict([("runs", 0), ("epochs", 0), ("seconds", 0.0)]))
+            stage["runs"] += 1
+            stage["epochs"] += epochs
+            stage["seconds"] += seconds
+
+    def timeSection(self, section):
+        """
+        Wraps a report section so its wall and CPU time are recorded. CPU
+        time is the whole process's, with parallel sections it includes the
+        other sections running at the same time.
+        """
+        def run(*args):
+            wall, cpu = time.time(), cpuTime()
+            try:
+                return section(*args)
+            finally:
+                self.addSection(section.__name__, time.time() - wall, cpuTime() - cpu)
+        run.__name__ = section.__name__
+        return run
+
+    def timeCallback(self, name, callback):
+        """
+        Wraps a print or progress callback so the time spent in it is
+        recorded
+        """
+        def handle(*args):
+            start = time.time()
+            try:
+                return callback(*args)
+            finally:
+                self.addCallback(name, time.time() - start)
+        return handle
+
+    def toDict(self):
+        with self.lock:
+            epochs = OrderedDict()
+            for name in self.epochs:
+                stage = OrderedDict(self.epochs[name])
+                stage["epochs_per_second"] = stage["epochs"] / stage["seconds"] if stage["seconds"] else None
+                epochs[name] = stage
+            return OrderedDict([("wall", self.wall), ("cpu", self.cpu),
+                                ("sections", OrderedDict((name, OrderedDict(self.sections[name])) for name in self.sections)),
+                                ("files", OrderedDict((name, OrderedDict(self.files[name])) for name in self.files)),
+                                ("callbacks", OrderedDict((name, OrderedDict(self.callbacks[name])) for name in self.callbacks)),
+                                ("epochs", epochs)])
+
+    def writeJSON(self, filename):
+        fid = open(filename, 'w')
+        json.dump(self.toDict(), fid, indent = 2)
+        fid.close()
@@ -0,0 +1,176 @@
+#-------------------------------------------------------------------------------
+# Name:     resample
+# Purpose:  Anti-aliased resampling of POSPac data files to a lower rate or
+#           any set of output epochs, a low-pass windowed sinc filter is
+#           evaluated at the message times around every epoch so jitter and
+#           gaps in the input are handled, attitude fields are filtered as
+#           sin/cos pairs
+#-------------------------------------------------------------------------------
+import math
+import pylab as pl
+import ApplanixPOSPacModule as pos
+
+# default cutoff as a fraction of the output rate (0.5 is the output Nyquist)
+CUTOFF_FRACTION = 0.4
+# default filter half width in output periods
+HALF_WIDTH_PERIODS = 4.0
+# epochs whose filter window holds less than this fraction of the expected
+# absolute filter weight (the ends of the file) are set to NaN, the signed
+# weight isn't used as missing negative side lobes push it up
+MIN_COVERAGE = 0.95
+# limit on epochs x window samples evaluated at a time, bounds the memory
+BLOCK_ELEMENTS = 1 << 21
+
+def lowPassKernel(tau, cutoff, halfWidth):
+    """
+    Blackman windowed sinc low-pass filter with cutoff (Hz) at time offsets
+    tau (seconds), zero outside +/-halfWidth. Integrates to about 1.
+    """
+    x = tau / halfWidth
+    window = 0.42 + 0.5 * pl.cos(math.pi * x) + 0.08 * pl.cos(2 * math.pi * x)
+    return pl.where(pl.absolute(x) < 1.0, 2 * cutoff * pl.sinc(2 * cutoff * tau) * window, 0.0)
+
+def filterSettings(rate, cutoff = None, halfWidth = None):
+    """
+    Returns the (cutoff, halfWidth) for an output rate, defaults from
+    CUTOFF_FRACTION and HALF_WIDTH_PERIODS
+    """
+    if cutoff is None:
+        cutoff = CUTOFF_FRACTION * rate
+    if halfWidth is None:
+        halfWidth = HALF_WIDTH_PERIODS / rate
+    return cutoff, halfWidth
+
+def outputEpochs(dblfile, rate, startTime = None, endTime = None, halfWidth = None):
+    """
+    Epochs at rate (Hz) on whole multiples of the output period, from
+    startTime to endTime (default the whole file less the filter half width
+    at each end so every epoch has a full filter window)
+    """
+    if halfWidth is None:
+        halfWidth = filterSettings(rate)[1]
+    if startTime is None:
+        startTime = dblfile.startTime + halfWidth
+    if endTime is None:
+        endTime = dblfile.endTime - halfWidth
+    first = int(math.ceil(startTime * rate - 1e-9))
+    last = int(math.floor(endTime * rate + 1e-9))
+    return pl.arange(first, last + 1, dtype=pl.float64) / rate
+
+def resampleBlocks(dblfile, times, fields, angleFields = (), cutoff = None, halfWidth = None, rate = None):
+    """
+    Low-pass filters fields of dblfile at the sorted epochs times and yields
+    (epoch times, values) blocks, values is (epochs x fields). Each block
+    reads only the messages around its epochs so any length of file streams
+    with bounded memory. The time field (1) is returned as the epoch time.
+
+    The filter defaults to a cutoff of CUTOFF_FRACTION of rate (default
+    the mean epoch rate) and a half width of HALF_WIDTH_PERIODS output
+    periods. angleFields (e.g. pos.SBET_ANGLE_FIELDS) are filtered as sin
+    and cos and put back together with atan2, in [0, 2 pi) where every
+    message in the filter window is positive and [-pi, pi) otherwise. Epochs with less
+    than MIN_COVERAGE of the filter window covered by messages, or with a
+    gap (a step between messages longer than pos.INTERVAL_GAP_PERIODS
+    message periods) in the window, are NaN.
+    """
+    times = pl.asarray(times, dtype=pl.float64)
+    if len(times) == 0:
+        return
+    if rate is None:
+        rate = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 1.0
+    cutoff, halfWidth = filterSettings(rate, cutoff, halfWidth)
+
+    fields = list(fields)
+    readFields = sorted(set(fields + [dblfile.arrayStart]))
+    col = dict((field, i) for i, field in enumerate(readFields))
+    fieldIdx = dblfile.getFieldIndexes(readFields)
+
+    # absolute filter weight of a full window of messages at the nominal rate
+    step = dblfile.timeInc
+    maxGap = pos.INTERVAL_GAP_PERIODS * step
+    nominal = pl.absolute(lowPassKernel(pl.arange(-math.floor(halfWidth / step), math.floor(halfWidth / step) + 1) * step,
+                                        cutoff, halfWidth)).sum()
+    # the same window width for every block so the sums, and the results, don't
+    # depend on how the epochs are split into blocks
+    windowMessages = int(2.02 * halfWidth / step) + 3
+    blockEpochs = max(BLOCK_ELEMENTS // windowMessages, 1)
+
+    for first in xrange(0, len(times), blockEpochs):
+        epochs = times[first:first + blockEpochs]
+        values = pl.empty((len(epochs), len(fields)))
+        values.fill(pl.nan)
+
+        start = max(epochs[0] - halfWidth, dblfile.startTime)
+        end = min(epochs[-1] + halfWidth, dblfile.endTime)
+        if start <= end:
+            msgStart, msgEnd = dblfile.getMsgWindowByTime(start, end)
+            data = dblfile.readBlock(slice(msgStart - dblfile.arrayStart, msgEnd - dblfile.arrayStart), fieldIdx)
+            msgTimes = data[:,col[dblfile.arrayStart]]
+
+            left = pl.searchsorted(msgTimes, epochs - halfWidth, 'left')
+            right = pl.searchsorted(msgTimes, epochs + halfWidth, 'right')
+            width = max(int((right - left).max()), windowMessages)
+            index = left[:,None] + pl.arange(width)[None,:]
+            valid = index < right[:,None]
+            index = pl.minimum(index, len(msgTimes) - 1)
+
+            # gap steps k (between messages k and k + 1) overlapping the open
+            # window of each epoch, the kernel is zero at the window edges
+            gaps = pl.concatenate(([0], pl.cumsum(pl.diff(msgTimes) > maxGap)))
+            lastMsg = len(msgTimes) - 1
+            firstStep = left - (msgTimes[pl.minimum(left, lastMsg)] > epochs - halfWidth)
+            lastStep = right - (msgTimes[pl.maximum(right - 1, 0)] >= epochs + halfWidth)
+            gapFree = gaps[lastStep.clip(0, lastMsg)] == gaps[firstStep.clip(0, lastMsg)]
+
+            weights = lowPassKernel(epochs[:,None] - msgTimes[index], cutoff, halfWidth) * valid
+            total = weights.sum(axis=1)
+            covered = (pl.absolute(weights).sum(axis=1) >= MIN_COVERAGE * nominal) & gapFree
+            weights[covered] /= total[covered][:,None]
+
+            for i, field in enumerate(fields):
+                samples = data[:,col[field]]
+                if field == dblfile.arrayStart:
+                    continue
+                if field in angleFields:
+                    sin = (weights * pl.sin(samples)[index]).sum(axis=1)
+                    cos = (weights * pl.cos(samples)[index]).sum(axis=1)
+                    positive = pl.where(valid, samples[index], 0.0).min(axis=1) >= 0
+                    values[:,i] = pos.wrapAngle(pl.arctan2(sin, cos), pl.where(positive, 0.0, -math.pi))
+                else:
+                    values[:,i] = (weights * samples[index]).sum(axis=1)
+            values[~covered,:] = pl.nan
+
+        for i, field in enumerate(fields):
+            if field == dblfile.arrayStart:
+                values[:,i] = epochs
+
+        yield epochs, values
+
+def resampleByTime(dblfile, times, fields, angleFields = (), cutoff = None, halfWidth = None, rate = None):
+    """
+    Low-pass filtered values of fields at times, see resampleBlocks.
+    Returns a (times x fields) array.
+    """
+    blocks = [values for epochs, values in resampleBlocks(dblfile, times, fields, angleFields, cutoff, halfWidth, rate)]
+    if not blocks:
+        return pl.zeros((0, len(fields)))
+    return pl.concatenate(blocks)
+
+def resampleFile(dblfile, filename, rate, angleFields = (), cutoff = None, halfWidth = None, startTime = None,
+                 endTime = None):
+    """
+    Writes dblfile resampled to rate (Hz) as a data file with the same
+    fields, epochs from outputEpochs. Epochs without a full filter window
+    are left out. Returns the number of messages written.
+    """
+    cutoff, halfWidth = filterSettings(rate, cutoff, halfWidth)
+    times = outputEpochs(dblfile, rate, startTime, endTime, halfWidth)
+    fields = range(dblfile.arrayStart, dblfile.fields + dblfile.arrayStart)
+    written = 0
+    fid = open(filename, 'wb')
+    for epochs, values in resampleBlocks(dblfile, times, fields, angleFields, cutoff, halfWidth, rate):
+        values = values[~pl.isnan(values).any(axis=1)]
+        values.astype("=f8").tofile(fid)
+        written += len(values)
+    fid.close()
+    return written
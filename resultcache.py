@@ -0,0 +1,135 @@
+#-------------------------------------------------------------------------------
+# Name:     resultcache
+# Purpose:  Content addressed cache of QC results (report text, statistics
+#           and output files such as the navdif file) keyed on the identity
+#           of the input files and the parameters used
+#-------------------------------------------------------------------------------
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+RESULTS_NAME = "results.json"
+
+def fileIdentity(filename, hashContent = False):
+    """
+    Identity of a file for cache keys: absolute path, size, modified time and
+    optionally the SHA-1 of the content
+    """
+    identity = [os.path.abspath(filename), os.path.getsize(filename), os.path.getmtime(filename)]
+    if hashContent:
+        sha = hashlib.sha1()
+        fid = open(filename, 'rb')
+        chunk = fid.read(1 << 20)
+        while chunk:
+            sha.update(chunk)
+            chunk = fid.read(1 << 20)
+        fid.close()
+        identity.append(sha.hexdigest())
+    return identity
+
+class resultCache():
+    """
+    Cache of results in cacheDir, one folder per key holding RESULTS_NAME and
+    copies of any output files. The least recently used entries are removed
+    once the cache holds more than maxBytes.
+    """
+    def __init__(self, cacheDir, maxBytes = 1 << 30, hashContent = False):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.hashContent = hashContent
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+
+    def makeKey(self, inputs, params = None):
+        """
+        Key for the input files and parameters (anything JSON serializable),
+        any change to an input file's size or modified time (or content with
+        hashContent) gives a new key
+        """
+        identity = [fileIdentity(filename, self.hashContent) for filename in inputs]
+        text = json.dumps([identity, params], sort_keys = True)
+        return hashlib.sha1(text).hexdigest()
+
+    def getEntryDir(self, key):
+        return os.path.join(self.cacheDir, key)
+
+    def get(self, key):
+        """
+        Returns the cached results for key (or None) and marks the entry as
+        recently used
+        """
+        resultsFile = os.path.join(self.getEntryDir(key), RESULTS_NAME)
+        try:
+            fid = open(resultsFile, 'r')
+            entry = json.load(fid, object_pairs_hook = OrderedDict)
+            fid.close()
+            os.utime(resultsFile, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key, results, files = None):
+        """
+        Stores results (JSON serializable) and copies of files, a dictionary
+        of name to path, under key. The entry is written to a temporary
+        folder and renamed into place so readers never see part of an entry.
+        """
+        files = files or {}
+        tempDir = tempfile.mkdtemp(prefix = key + ".", dir = self.cacheDir)
+        try:
+            for name in files:
+                shutil.copy2(files[name], os.path.join(tempDir, name))
+            entry = OrderedDict([("results", results),
+                                 ("files", OrderedDict((name, fileIdentity(files[name])) for name in files))])
+            fid = open(os.path.join(tempDir, RESULTS_NAME), 'w')
+            json.dump(entry, fid)
+            fid.close()
+            entryDir = self.getEntryDir(key)
+            if os.path.isdir(entryDir):
+                shutil.rmtree(entryDir, True)
+            os.rename(tempDir, entryDir)
+        except (IOError, OSError):
+            shutil.rmtree(tempDir, True)
+            raise
+        self.evict()
+
+    def restoreFile(self, key, name, entry, destination):
+        """
+        Copies the cached file name back to destination unless destination is
+        still the file that was cached
+        """
+        if os.path.exists(destination) and fileIdentity(destination)[1:] == entry["files"][name][1:]:
+            return
+        shutil.copy2(os.path.join(self.getEntryDir(key), name), destination)
+
+    def getEntries(self):
+        """
+        Returns a list of (last used, bytes, key) for every entry
+        """
+        entries = []
+        for key in os.listdir(self.cacheDir):
+            entryDir = self.getEntryDir(key)
+            resultsFile = os.path.join(entryDir, RESULTS_NAME)
+            if not os.path.isfile(resultsFile):
+                continue # incomplete entry being written
+            size = sum(os.path.getsize(os.path.join(entryDir, name)) for name in os.listdir(entryDir))
+            entries.append((os.path.getmtime(resultsFile), size, key))
+        return entries
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits maxBytes
+        """
+        entries = sorted(self.getEntries())
+        total = sum(size for used, size, key in entries)
+        while entries and total > self.maxBytes:
+            used, size, key = entries.pop(0)
+            shutil.rmtree(self.getEntryDir(key), True)
+            total -= size
+
+    def clear(self):
+        for used, size, key in self.getEntries():
+            shutil.rmtree(self.getEntryDir(key), True)
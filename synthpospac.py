@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+#-------------------------------------------------------------------------------
+# Name:     synthpospac
+# Purpose:  Writes synthetic POSPac projects (sbet, vnav, smrmsg, smers, iincal,
+#           iinkaru, gamsu and navdif_bet files in the kernel Extract/Proc layout)
+#           of any mission length for testing and benchmarking, with optional
+#           data gaps, clock drift and bad segments
+#
+# Usage:    python synthpospac.py [options] root
+#           python synthpospac.py --help
+#-------------------------------------------------------------------------------
+import os
+import sys
+import math
+import argparse
+import pylab as pl
+from numpy.random import RandomState
+import geodetic
+import navdif
+import ApplanixPOSPacModule as pos
+
+# field counts of the generated files (POSPac 5.4)
+SBET_FIELD_COUNT = 17
+SMRMSG_FIELD_COUNT = 10
+SMERS_FIELD_COUNT = 50
+IINCAL_FIELD_COUNT = 19
+IINKARU_FIELD_COUNT = 5
+GAMSU_FIELD_COUNT = 5
+
+# GPS seconds of week of the first message
+DEFAULT_START_TIME = 302400.0
+# seconds of data generated and written at a time
+CHUNK_SECONDS = 600
+
+# survey pattern, back and forth lines LINE_SECONDS long stepping east
+# LINE_SPACING metres per line, flown at SPEED m/s around ALTITUDE m
+ORIGIN_LAT = math.radians(44.6)
+ORIGIN_LON = math.radians(-63.6)
+ALTITUDE = 1200.0 # metres
+SPEED = 65.0 # m/s
+LINE_SECONDS = 900.0
+LINE_SPACING = 400.0 # metres
+# base station north and east of the origin, metres
+BASE_OFFSET = (-5000.0, -3000.0)
+# converged IMU error estimates, accel bias (micro-g), gyro bias (deg/hr),
+# accel and gyro scale factor (ppm) per axis
+ACCEL_BIAS = (40.0, -25.0, 60.0)
+GYRO_BIAS = (0.8, -0.5, 1.1)
+ACCEL_SCALE = (120.0, -80.0, 150.0)
+GYRO_SCALE = (90.0, 110.0, -70.0)
+# installation lever arm, reference to primary GNSS antenna, metres
+LEVER_ARM = (0.12, -0.45, -1.30)
+GRAVITY = 9.81
+
+def trajectory(times, startTime):
+    """
+    Returns the (times x SBET_FIELD_COUNT) standard navigation record of the
+    survey pattern at times, north and east offsets from the origin in
+    metres. The pattern is a closed form function of time so every file
+    and every chunk agrees.
+    """
+    tau = times - startTime
+    w = math.pi / LINE_SECONDS
+    stepVel = LINE_SPACING / LINE_SECONDS
+
+    north = SPEED / w * pl.sin(w * tau)
+    east = stepVel * tau
+    up = ALTITUDE + 15.0 * pl.sin(2 * math.pi * tau / 1800.0)
+    velNorth = SPEED * pl.cos(w * tau)
+    velEast = stepVel * pl.ones(len(tau))
+    velUp = 15.0 * 2 * math.pi / 1800.0 * pl.cos(2 * math.pi * tau / 1800.0)
+
+    heading = pl.arctan2(velEast, velNorth) % (2 * math.pi)
+    turnRate = stepVel * SPEED * w * pl.sin(w * tau) / (stepVel**2 + velNorth**2)
+    speed = pl.sqrt(velNorth**2 + velEast**2)
+
+    meridian, primeVertical = geodetic.radiiOfCurvature(ORIGIN_LAT)
+
+    record = pl.zeros((len(tau), SBET_FIELD_COUNT))
+    record[:,0] = times
+    record[:,1] = ORIGIN_LAT + north / meridian
+    record[:,2] = ORIGIN_LON + east / (primeVertical * math.cos(ORIGIN_LAT))
+    record[:,3] = up
+    # wander angle 0, x north, y west, z up
+    record[:,4] = velNorth
+    record[:,5] = -velEast
+    record[:,6] = velUp
+    record[:,7] = pl.arctan(speed * turnRate / GRAVITY)
+    record[:,8] = math.radians(2.0) + 0.01 * pl.sin(2 * math.pi * tau / 37.0)
+    record[:,9] = heading
+    record[:,13] = -GRAVITY
+    record[:,16] = turnRate
+    return record, north, east
+
+def inSegments(times, startTime, segments):
+    """
+    Boolean mask of the times inside any of the (start, duration) segments,
+    start in seconds from startTime
+    """
+    mask = pl.zeros(len(times), dtype=bool)
+    for start, duration in segments:
+        mask |= (times >= startTime + start) & (times < startTime + start + duration)
+    return mask
+
+def sbetChunk(times, startTime, random, bad):
+    record = trajectory(times, startTime)[0]
+    record[:,11:17] += random.normal(0, 0.02, (len(times), 6))
+    return record
+
+def vnavChunk(times, startTime, random, bad):
+    """
+    Real-time solution, the trajectory plus slowly wandering position and
+    attitude errors, ten times larger in bad segments
+    """
+    record = trajectory(times, startTime)[0]
+    tau = times - startTime
+    meridian, primeVertical = geodetic.radiiOfCurvature(ORIGIN_LAT)
+    scale = pl.where(bad, 10.0, 1.0)
+    errors = pl.zeros((len(times), 3))
+    for i, (amplitude, period) in enumerate([(0.3, 1700.0), (0.25, 2300.0), (0.5, 3100.0)]):
+        errors[:,i] = amplitude * pl.sin(2 * math.pi * tau / period + i) + random.normal(0, 0.02, len(times))
+    errors *= scale[:,None]
+    record[:,1] += errors[:,0] / meridian
+    record[:,2] += errors[:,1] / (primeVertical * math.cos(ORIGIN_LAT))
+    record[:,3] += errors[:,2]
+    record[:,4:7] += random.normal(0, 0.01, (len(times), 3)) * scale[:,None]
+    record[:,7:10] += random.normal(0, math.radians(0.005), (len(times), 3)) * scale[:,None]
+    record[:,9] %= 2 * math.pi
+    record[:,11:17] += random.normal(0, 0.02, (len(times), 6))
+    return record
+
+def smrmsgChunk(times, startTime, random, bad):
+    """
+    Accuracy file, position and velocity RMS in metres and m/s, attitude RMS
+    in arc-minutes, twenty times larger in bad segments
+    """
+    record = pl.zeros((len(times), SMRMSG_FIELD_COUNT))
+    record[:,0] = times
+    record[:,1:4] = pl.absolute(random.normal(0.025, 0.005, (len(times), 3)))
+    record[:,4:7] = pl.absolute(random.normal(0.005, 0.001, (len(times), 3)))
+    record[:,7:10] = pl.absolute(random.normal(0.4, 0.1, (len(times), 3)))
+    record[bad,1:10] *= 20.0
+    return record
+
+def smersChunk(times, startTime, random, bad):
+    """
+    Smoothed error estimates in the assumed pos.SMERS_FIELDS layout (so
+    they only check the QC against that layout), the IMU errors
+    converge on ACCEL_BIAS, GYRO_BIAS, ACCEL_SCALE and GYRO_SCALE, the gyro
+    biases and lever arm errors are out of tolerance in bad segments
+    """
+    record = pl.zeros((len(times), SMERS_FIELD_COUNT))
+    record[:,0] = times
+    convergence = pl.exp(-(times - startTime) / 300.0)
+    fields = pos.SMERS_FIELDS
+    for i, axis in enumerate(["x", "y", "z"]):
+        record[:,fields[axis + "AccelBias"] - 1] = ACCEL_BIAS[i] * (1 + 5 * convergence) + random.normal(0, 2.0, len(times))
+        record[:,fields[axis + "GyroBias"] - 1] = pl.where(bad, 8.0, GYRO_BIAS[i] * (1 + 5 * convergence)) + \
+                                                  random.normal(0, 0.05, len(times))
+        record[:,fields[axis + "AccelScale"] - 1] = ACCEL_SCALE[i] + random.normal(0, 5.0, len(times))
+        record[:,fields[axis + "GyroScale"] - 1] = GYRO_SCALE[i] + random.normal(0, 5.0, len(times))
+        record[:,fields[axis + "LeverArm"] - 1] = pl.where(bad, 0.03, 0.002 + 0.02 * convergence) + \
+                                                  pl.absolute(random.normal(0, 0.0005, len(times)))
+    for name in ["north", "east", "down"]:
+        record[:,fields[name] - 1] = pl.where(bad, 0.5, 0.02) + pl.absolute(random.normal(0, 0.002, len(times)))
+    return record
+
+def iincalChunk(times, startTime, random, bad):
+    """
+    Installation parameters, the lever arm (fields 2-4) converges on
+    LEVER_ARM, field 5 is the figure of merit
+    """
+    record = pl.zeros((len(times), IINCAL_FIELD_COUNT))
+    record[:,0] = times
+    convergence = pl.exp(-(times - startTime) / 600.0)
+    for i in range(3):
+        record[:,i+1] = LEVER_ARM[i] + 0.1 * convergence + random.normal(0, 0.001, len(times))
+    record[:,4] = pl.where(convergence > 0.1, 2.0, 1.0)
+    record[:,5:] = random.normal(0, 0.001, (len(times), IINCAL_FIELD_COUNT - 5))
+    return record
+
+def iinkaruChunk(times, startTime, random, bad):
+    """
+    Solution status, SVs, PDOP, baseline length and processing mode, bad
+    segments drop to 3-4 SVs and float or C/A mode
+    """
+    record = pl.zeros((len(times), IINKARU_FIELD_COUNT))
+    north, east = trajectory(times, startTime)[1:]
+    record[:,0] = times
+    record[:,1] = random.randint(8, 13, len(times))
+    record[:,2] = random.uniform(1.2, 2.2, len(times))
+    record[:,3] = pl.sqrt((north - BASE_OFFSET[0])**2 + (east - BASE_OFFSET[1])**2)
+    record[:,4] = pl.where(random.uniform(0, 1, len(times)) < 0.02, 1.0, 0.0)
+    badCount = bad.sum()
+    record[bad,1] = random.randint(3, 5, badCount)
+    record[bad,2] = random.uniform(3.5, 6.0, badCount)
+    record[bad,4] = random.choice([2.0, 6.0], badCount)
+    return record
+
+def gamsuChunk(times, startTime, random, bad):
+    """
+    GAMS solution, heading, heading accuracy, antenna baseline length and
+    status (field 5, 1 in use, 0 not in use in bad segments)
+    """
+    record = pl.zeros((len(times), GAMSU_FIELD_COUNT))
+    record[:,0] = times
+    record[:,1] = trajectory(times, startTime)[0][:,9]
+    record[:,2] = pl.absolute(random.normal(0.02, 0.005, len(times)))
+    record[:,3] = 2.0 + random.normal(0, 0.001, len(times))
+    record[:,4] = pl.where(bad, 0.0, 1.0)
+    return record
+
+def writeFile(filename, makeChunk, startTime, seconds, rate, seed, gaps = (), drift = 0.0, badSegments = ()):
+    """
+    Writes rate messages a second for seconds from startTime, CHUNK_SECONDS
+    at a time so memory doesn't grow with the mission length. Messages in
+    gaps are dropped and drift (ppm) is applied to the recorded times.
+    Returns the number of messages written.
+    """
+    random = RandomState(seed)
+    messages = int(round(seconds * rate))
+    chunkMessages = max(int(CHUNK_SECONDS * rate), 1)
+    written = 0
+    fid = open(filename, 'wb')
+    for first in xrange(0, messages, chunkMessages):
+        times = startTime + pl.arange(first, min(first + chunkMessages, messages)) / float(rate)
+        times = times[~inSegments(times, startTime, gaps)]
+        record = makeChunk(times, startTime, random, inSegments(times, startTime, badSegments))
+        record[:,0] += drift * 1e-6 * (times - startTime)
+        record.astype("=f8").tofile(fid)
+        written += len(record)
+    fid.close()
+    return written
+
+def makeProject(root, hours = 1.0, name = "synthetic", kernel = "S1", sbetRate = 200.0, vnavRate = 50.0,
+                statusRate = 1.0, gaps = (), drift = 0.0, badSegments = (), seed = 0, navdifFile = True,
+                startTime = DEFAULT_START_TIME, smersRate = None):
+    """
+    Writes a synthetic project, root/name.pospac and root/name/kernel/
+    Extract and Proc, for a mission of hours. sbetRate, vnavRate and
+    statusRate (smrmsg, iincal, iinkaru and gamsu) and smersRate (default
+    statusRate) are messages a second.
+
+    gaps are (start, duration) seconds from the start of the mission dropped
+    from the real-time vnav file, drift is the vnav clock drift in ppm and
+    badSegments are (start, duration) seconds with degraded accuracy, status
+    and real-time errors. With navdifFile the navdif_bet file of the vnav
+    against the sbet is written too.
+
+    Returns the project file and the reference SBET.
+    """
+    seconds = hours * 3600.0
+    projectFile = os.path.join(root, name + ".pospac")
+    kernelDir = os.path.join(root, name, kernel)
+    for folder in [pos.project.EXTRACTED_DIR, pos.project.PROCESSED_DIR]:
+        if not os.path.isdir(os.path.join(kernelDir, folder)):
+            os.makedirs(os.path.join(kernelDir, folder))
+    open(projectFile, 'w').close()
+
+    def path(prefix, folder):
+        return os.path.join(kernelDir, folder, "%s_%s.out" % (prefix, kernel))
+
+    proc = pos.project.PROCESSED_DIR
+    sbetFile = path("sbet", proc)
+    vnavFile = path("vnav", pos.project.EXTRACTED_DIR)
+    writeFile(sbetFile, sbetChunk, startTime, seconds, sbetRate, seed)
+    writeFile(vnavFile, vnavChunk, startTime, seconds, vnavRate, seed + 1, gaps, drift, badSegments)
+    writeFile(path("smrmsg", proc), smrmsgChunk, startTime, seconds, statusRate, seed + 2, badSegments = badSegments)
+    writeFile(path("smers", proc), smersChunk, startTime, seconds, smersRate or statusRate, seed + 6,
+              badSegments = badSegments)
+    writeFile(path("iincal", proc), iincalChunk, startTime, seconds, statusRate, seed + 3, badSegments = badSegments)
+    writeFile(path("iinkaru", proc), iinkaruChunk, startTime, seconds, statusRate, seed + 4, badSegments = badSegments)
+    writeFile(path("gamsu", proc), gamsuChunk, startTime, seconds, statusRate, seed + 5, badSegments = badSegments)
+
+    if navdifFile:
+        navdif.navdif(pos.dataFile(sbetFile, SBET_FIELD_COUNT), pos.dataFile(vnavFile, SBET_FIELD_COUNT),
+                      path("navdif_bet", proc), 1, blockSize = CHUNK_SECONDS)
+
+    return projectFile, sbetFile
+
+def parseSegments(text):
+    """
+    Parses "start:duration,start:duration" (seconds) into a list of tuples
+    """
+    segments = []
+    for item in text.split(","):
+        if item.strip():
+            start, duration = item.split(":")
+            segments.append((float(start), float(duration)))
+    return segments
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Write a synthetic POSPac project.")
+    parser.add_argument("root", help = "folder for the project")
+    parser.add_argument("--hours", type = float, default = 1.0, help = "mission length (default: %(default)s)")
+    parser.add_argument("--name", default = "synthetic", help = "project name (default: %(default)s)")
+    parser.add_argument("--kernel", default = "S1", help = "kernel name (default: %(default)s)")
+    parser.add_argument("--sbet-rate", type = float, default = 200.0, help = "sbet messages a second (default: %(default)s)")
+    parser.add_argument("--vnav-rate", type = float, default = 50.0, help = "vnav messages a second (default: %(default)s)")
+    parser.add_argument("--status-rate", type = float, default = 1.0,
+                        help = "smrmsg, iincal, iinkaru and gamsu messages a second (default: %(default)s)")
+    parser.add_argument("--smers-rate", type = float, help = "smers messages a second (default: the status rate)")
+    parser.add_argument("--gaps", type = parseSegments, default = [], help = "vnav gaps, start:duration,... seconds")
+    parser.add_argument("--drift", type = float, default = 0.0, help = "vnav clock drift in ppm")
+    parser.add_argument("--bad", type = parseSegments, default = [], help = "bad segments, start:duration,... seconds")
+    parser.add_argument("--seed", type = int, default = 0, help = "random seed (default: %(default)s)")
+    parser.add_argument("--no-navdif", action = "store_true", help = "don't write the navdif_bet file")
+    args = parser.parse_args(argv)
+
+    projectFile, sbetFile = makeProject(args.root, args.hours, args.name, args.kernel, args.sbet_rate, args.vnav_rate,
+                                        args.status_rate, args.gaps, args.drift, args.bad, args.seed, not args.no_navdif,
+                                        smersRate = args.smers_rate)
+    print projectFile
+    print sbetFile
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#-------------------------------------------------------------------------------
+# Name:     test_ApplanixPOSPacModule
+# Purpose:  Checks the data file indexes and lookups, the segment index
+#           finds the real gaps and rate changes of a file with timestamp
+#           jitter and a time lookup doesn't read the whole time field
+#
+# Usage:    python -m unittest test_ApplanixPOSPacModule
+#-------------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+import unittest
+import pylab as pl
+from numpy.random import RandomState
+import ApplanixPOSPacModule as pos
+
+class segmentIndexTest(unittest.TestCase):
+    MESSAGES = 200000
+    GAP_MESSAGE = 120000 # first message after the 1 s gap
+    CHANGE_MESSAGE = 150000 # 50 Hz to 10 Hz from this message
+
+    def makeFile(self, jitter):
+        times = 1000.0 + pl.arange(self.MESSAGES) * 0.02
+        times[self.GAP_MESSAGE:] += 1.0
+        times[self.CHANGE_MESSAGE:] = times[self.CHANGE_MESSAGE] + pl.arange(self.MESSAGES - self.CHANGE_MESSAGE) * 0.1
+        times += RandomState(1).normal(0, jitter, self.MESSAGES)
+        record = pl.zeros((self.MESSAGES, 5))
+        record[:,0] = times
+        filename = os.path.join(self.root, "jitter_%s.out" % jitter)
+        record.astype("=f8").tofile(filename)
+        return pos.dataFile(filename, 5)
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, True)
+
+    def testJitteredTimestamps(self):
+        for jitter in [0, 0.001, 0.0015]:
+            dblfile = self.makeFile(jitter)
+            segments = dblfile.getSegments()
+            self.assertEqual(list(segments["msgStart"] - dblfile.arrayStart), [0, self.GAP_MESSAGE, self.CHANGE_MESSAGE])
+            self.assertEqual(list(segments["gapBefore"]), [False, True, False])
+            self.assertTrue(pl.allclose(segments["rate"], [50.0, 50.0, 10.0], rtol = 1e-3))
+
+            gaps = dblfile.getGaps()
+            self.assertEqual(len(gaps["start"]), 1)
+            self.assertAlmostEqual(gaps["duration"][0], 1.02, delta = 0.01)
+            self.assertLess(os.path.getsize(dblfile.filename + pos.SEGMENT_INDEX_SUFFIX), 4096)
+            del dblfile
+
+    def testChunksDontChangeIndex(self):
+        dblfile = self.makeFile(0.0015)
+        whole = dblfile.buildSegmentIndex()
+        chunkMessages = pos.READ_CHUNK_MESSAGES
+        try:
+            pos.READ_CHUNK_MESSAGES = 1000
+            chunked = dblfile.buildSegmentIndex()
+        finally:
+            pos.READ_CHUNK_MESSAGES = chunkMessages
+        for key in ["msgStart", "count", "gapBefore"]:
+            self.assertTrue(pl.array_equal(whole[key], chunked[key]))
+
+class timeLookupTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        random = RandomState(2)
+        times = 5000.0 + pl.cumsum(random.uniform(0.004, 0.006, 100000))
+        times[60000:] += 3.0 # a gap
+        record = pl.zeros((len(times), 5))
+        record[:,0] = times
+        self.filename = os.path.join(self.root, "lookup.out")
+        record.astype("=f8").tofile(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, True)
+
+    def testScalarLookupDoesntReadTimeField(self):
+        dblfile = pos.dataFile(self.filename, 5)
+        whole = pos.dataFile(self.filename, 5)
+        lookups = pl.linspace(dblfile.startTime, dblfile.endTime, 101)
+        expected = whole.getPreciseMsgNumsByTime(lookups)
+        for time, msgNum in zip(lookups, expected):
+            self.assertEqual(dblfile.getPreciseMsgNumByTime(time), msgNum)
+        self.assertIsNone(dblfile.timeColumn)
+        self.assertRaises(IOError, dblfile.getPreciseMsgNumByTime, dblfile.endTime + 1.0)
+
+if __name__ == "__main__":
+    unittest.main()
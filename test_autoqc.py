@@ -0,0 +1,77 @@
+#-------------------------------------------------------------------------------
+# Name:     test_autoqc
+# Purpose:  Checks follow mode finds the same status rule results as the
+#           Solution Status section when the file is written a piece at a
+#           time and a failed parallel section stops the other sections
+#
+# Usage:    python -m unittest test_autoqc
+#-------------------------------------------------------------------------------
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import ApplanixPOSPacModule as pos
+import autoqc
+import tolerances
+import synthpospac
+
+class followStatusTest(unittest.TestCase):
+    PIECE_BYTES = 9999 # not a whole number of messages
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        projectFile, sbetFile = synthpospac.makeProject(self.root, hours = 1.0, sbetRate = 1.0, vnavRate = 1.0,
+                                                        badSegments = [(600, 150), (1800, 90)], navdifFile = False)
+        self.project = pos.project(projectFile)
+        self.statusFile = self.project.getDataFilePath("iinkaru", self.project.PROCESSED_DIR)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, True)
+
+    def testFollowMatchesWholeFile(self):
+        data = open(self.statusFile, 'rb').read()
+        followed = os.path.join(self.root, "following.out")
+        fid = open(followed, 'wb')
+        written = [0]
+
+        def stopHandle():
+            # appends the next piece of the file before every poll
+            if written[0] >= len(data):
+                return True
+            fid.write(data[written[0]:written[0] + self.PIECE_BYTES])
+            fid.flush()
+            written[0] += self.PIECE_BYTES
+            return False
+
+        lines = []
+        totals = autoqc.followStatus(followed, synthpospac.IINKARU_FIELD_COUNT, lines.append, 0, stopHandle)
+        fid.close()
+        self.assertTrue(lines)
+
+        rules = autoqc.getStatusRules()
+        expected = tolerances.evaluateFile(self.project.getProcessedDataObject("iinkaru"), rules)
+        results = totals.getResults()
+        for rule in rules:
+            self.assertEqual(results["rules"][rule.name], expected[rule.name])
+        self.assertFalse(results["rules"]["processing_mode"]["passed"])
+
+class parallelSectionsTest(unittest.TestCase):
+    def testFailedSectionStopsTheOthers(self):
+        def slowSection(project, navdifRefFile, printHandle, progressHandle):
+            for i in xrange(200):
+                time.sleep(0.05)
+                progressHandle(i / 2.0)
+            return {}
+
+        def failedSection(project, navdifRefFile, printHandle, progressHandle):
+            time.sleep(0.1)
+            raise ValueError("failed section")
+
+        started = time.time()
+        self.assertRaises(ValueError, autoqc.runSectionsParallel, [slowSection, failedSection], None, None,
+                          lambda text: None, None)
+        self.assertLess(time.time() - started, 5.0) # the slow section alone takes 10 s
+
+if __name__ == "__main__":
+    unittest.main()
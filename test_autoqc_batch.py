@@ -0,0 +1,57 @@
+#-------------------------------------------------------------------------------
+# Name:     test_autoqc_batch
+# Purpose:  Checks batch QC writes a summary of its own for every project,
+#           including projects with the same path under different roots, and
+#           leaves the autoqc settings as they were
+#
+# Usage:    python -m unittest test_autoqc_batch
+#-------------------------------------------------------------------------------
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import autoqc
+import autoqc_batch
+import tolerances
+import synthpospac
+
+class batchNamesTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.roots = [os.path.join(self.root, "first"), os.path.join(self.root, "second")]
+        for i, root in enumerate(self.roots):
+            os.makedirs(root)
+            synthpospac.makeProject(root, hours = 0.1, sbetRate = 10.0, vnavRate = 5.0, seed = i, navdifFile = False)
+        self.output = os.path.join(self.root, "results")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, True)
+
+    def testSameProjectNameUnderTwoRoots(self):
+        summaries = autoqc_batch.runBatch(self.roots, outputDir = self.output)
+        self.assertEqual([summary["status"] for summary in summaries], ["ok", "ok"])
+
+        written = sorted(name for name in os.listdir(self.output) if name.endswith(".json")
+                         and not name.startswith(autoqc_batch.AGGREGATE_NAME))
+        self.assertEqual(written, ["synthetic.json", "synthetic_2.json"])
+        projects = sorted(json.load(open(os.path.join(self.output, name)))["project"] for name in written)
+        self.assertEqual(projects, sorted(summary["project"] for summary in summaries))
+
+    def testSettingsDontLeak(self):
+        rulesFile = os.path.join(self.root, "rules.json")
+        tolerances.saveRules(rulesFile, autoqc.getToleranceRules())
+        summaries = autoqc_batch.runBatch(self.roots[:1], outputDir = self.output, rulesFile = rulesFile,
+                                          navdifBlockSize = 100)
+        self.assertEqual(summaries[0]["status"], "ok")
+        self.assertIsNone(autoqc.TOLERANCE_RULES_FILE)
+        self.assertIsNone(autoqc.NAVDIF_BLOCK_SIZE)
+
+    def testUniqueName(self):
+        used = set([autoqc_batch.AGGREGATE_NAME.lower()])
+        self.assertEqual(autoqc_batch.uniqueName("synthetic", used), "synthetic")
+        self.assertEqual(autoqc_batch.uniqueName("Synthetic", used), "Synthetic_2")
+        self.assertEqual(autoqc_batch.uniqueName(autoqc_batch.AGGREGATE_NAME, used), autoqc_batch.AGGREGATE_NAME + "_2")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+#-------------------------------------------------------------------------------
+# Name:     test_resample
+# Purpose:  Checks the low-pass resampler leaves epochs next to data gaps out
+#           (NaN) instead of filtering across the gap
+#
+# Usage:    python -m unittest test_resample
+#-------------------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+import unittest
+import pylab as pl
+import ApplanixPOSPacModule as pos
+import resample
+import synthpospac
+
+class lowPassGapTest(unittest.TestCase):
+    GAP_START = 600.0 # seconds from the start of the mission
+    GAP_LENGTH = 30.0
+    RATE = 0.2 # output epochs a second, navdif at inc = 5
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        projectFile, sbetFile = synthpospac.makeProject(self.root, hours = 0.5, sbetRate = 50.0, vnavRate = 50.0,
+                                                        gaps = [(self.GAP_START, self.GAP_LENGTH)], navdifFile = False)
+        self.project = pos.project(projectFile)
+        self.vnav = self.project.getExtractedDataObject("vnav")
+
+    def tearDown(self):
+        del self.vnav
+        shutil.rmtree(self.root, True)
+
+    def testEpochsNextToGapAreNaN(self):
+        cutoff, halfWidth = resample.filterSettings(self.RATE)
+        times = resample.outputEpochs(self.vnav, self.RATE)
+        values = resample.resampleByTime(self.vnav, times, [pos.SBET_FIELDS["lat"]], rate = self.RATE)[:,0]
+
+        gaps = self.vnav.getGaps()
+        self.assertEqual(len(gaps["start"]), 1)
+        near = (times > gaps["start"][0] - halfWidth) & (times < gaps["end"][0] + halfWidth)
+        self.assertTrue(near.any())
+        self.assertTrue(pl.isnan(values[near]).all())
+        self.assertFalse(pl.isnan(values[~near]).any())
+
+    def testBlocksDontChangeResult(self):
+        times = resample.outputEpochs(self.vnav, self.RATE)
+        fields = [pos.SBET_FIELDS["lat"], pos.SBET_FIELDS["heading"]]
+        whole = resample.resampleByTime(self.vnav, times, fields, pos.SBET_ANGLE_FIELDS, rate = self.RATE)
+        blockElements = resample.BLOCK_ELEMENTS
+        try:
+            resample.BLOCK_ELEMENTS = 1 << 12 # a few epochs per block
+            blocked = resample.resampleByTime(self.vnav, times, fields, pos.SBET_ANGLE_FIELDS, rate = self.RATE)
+        finally:
+            resample.BLOCK_ELEMENTS = blockElements
+        self.assertTrue(pl.array_equal(pl.isnan(whole), pl.isnan(blocked)))
+        self.assertTrue(pl.allclose(whole[~pl.isnan(whole)], blocked[~pl.isnan(blocked)], rtol = 0, atol = 1e-12))
+
+if __name__ == "__main__":
+    unittest.main()
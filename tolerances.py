@@ -0,0 +1,255 @@
+#-------------------------------------------------------------------------------
+# Name:     tolerances
+# Purpose:  Declarative tolerance rules for POSPac data files. A rule names a
+#           data file type, a field, the comparator and threshold the field
+#           has to meet, how long it may fail before it is reported and the
+#           blanking at the start and end of the file. Rules are grouped by
+#           data file and every field is read once however many rules check it.
+#
+# Usage:    rules = tolerances.loadRules("tolerances.json")
+#           results = tolerances.evaluateRules(project, rules)
+#
+#           tolerances.json is a list of rules, e.g.
+#           [{"name": "pdop", "file": "iinkaru", "field": 3,
+#             "comparator": "<=", "threshold": 3}, ...]
+#           optional keys: "min_duration" (seconds, 0), "blanking" (seconds,
+#           0), "directory" ("Proc" or "Extract", "Proc") and "optional"
+#           (true to skip the rule when the file doesn't exist, false)
+#-------------------------------------------------------------------------------
+import os
+import json
+import pylab as pl
+import ApplanixPOSPacModule as pos
+from collections import OrderedDict
+
+# comparator that is true where a rule's comparator is not met
+VIOLATIONS = {"<": ">=", "<=": ">", ">": "<=", ">=": "<", "==": "!=", "!=": "=="}
+
+class toleranceRule():
+    """
+    A field of a data file type has to compare true to threshold. Messages
+    within blanking seconds of the start or end of the file are not checked
+    and the rule only fails where the field is out of tolerance for at least
+    minDuration seconds (0, any message).
+    """
+    def __init__(self, name, fileType, field, comparator, threshold, minDuration = 0, blanking = 0,
+                 directory = pos.project.PROCESSED_DIR, optional = False):
+        if comparator not in VIOLATIONS:
+            raise ValueError("Unknown comparator %s in tolerance rule %s." % (comparator, name))
+        self.name = name
+        self.fileType = fileType
+        self.field = int(field)
+        self.comparator = comparator
+        self.threshold = threshold
+        self.minDuration = minDuration
+        self.blanking = blanking
+        self.directory = directory
+        self.optional = optional
+
+    def toDict(self):
+        return OrderedDict([("name", self.name), ("file", self.fileType), ("field", self.field),
+                            ("comparator", self.comparator), ("threshold", self.threshold),
+                            ("min_duration", self.minDuration), ("blanking", self.blanking),
+                            ("directory", self.directory), ("optional", self.optional)])
+
+    def __str__(self):
+        return "%s: %s field %s %s %s" % (self.name, self.fileType, self.field, self.comparator, self.threshold)
+
+def ruleFromDict(rule):
+    """
+    Returns the toleranceRule of a rule dictionary (see toleranceRule.toDict)
+    """
+    return toleranceRule(rule["name"], rule["file"], rule["field"], rule["comparator"], rule["threshold"],
+                         rule.get("min_duration", 0), rule.get("blanking", 0),
+                         rule.get("directory", pos.project.PROCESSED_DIR), rule.get("optional", False))
+
+def loadRules(filename):
+    """
+    Reads a list of rules from a JSON file, rule names have to be unique
+    """
+    try:
+        rules = [ruleFromDict(rule) for rule in json.load(open(filename), object_pairs_hook = OrderedDict)]
+    except (KeyError, TypeError, ValueError) as error:
+        raise IOError(0, "Bad tolerance rules file (%s)." % error, filename)
+    names = [rule.name for rule in rules]
+    for name in names:
+        if names.count(name) > 1:
+            raise IOError(0, "Tolerance rule %s is defined more than once." % name, filename)
+    return rules
+
+def saveRules(filename, rules):
+    fid = open(filename, 'w')
+    json.dump([rule.toDict() for rule in rules], fid, indent = 2)
+    fid.close()
+
+def groupRules(rules):
+    """
+    Groups rules by data file, an OrderedDict of (directory, file type) to
+    rules in the order the files first appear
+    """
+    groups = OrderedDict()
+    for rule in rules:
+        groups.setdefault((rule.directory, rule.fileType), []).append(rule)
+    return groups
+
+def groupFields(rules):
+    """
+    Groups the rules of one data file by field, an OrderedDict of field to
+    (index in rules, rule) in the order the fields first appear
+    """
+    fields = OrderedDict()
+    for i, rule in enumerate(rules):
+        fields.setdefault(rule.field, []).append((i, rule))
+    return fields
+
+def checkFields(dblfile, rules):
+    """
+    Raises IOError if a rule checks a field the data file doesn't have
+    """
+    for rule in rules:
+        if rule.field < dblfile.arrayStart or rule.field >= dblfile.fields + dblfile.arrayStart:
+            raise IOError(0, "Tolerance rule %s checks field %s of a %s field file." %
+                          (rule.name, rule.field, dblfile.fields), dblfile.filename)
+
+class runningRules():
+    """
+    The rules of one data file evaluated a block of messages at a time, the
+    rules of a field are compared with a block in one comparison per
+    comparator and every rule keeps running counts, its worst values and a
+    pos.runningIntervals of the messages out of tolerance. Blocks are added
+    in time order. Messages within a rule's blanking of startTime or endTime
+    are not checked, None (e.g. the end of a file still being written) for
+    no blanking at that end.
+    """
+    def __init__(self, rules, timeInc, startTime = None, endTime = None):
+        self.rules = rules
+        self.timeInc = timeInc
+        # fields read, the columns of the blocks passed to add
+        self.fields = list(groupFields(rules))
+        self.startTimes = [startTime + rule.blanking if startTime is not None else -pl.inf for rule in rules]
+        self.endTimes = [endTime - rule.blanking if endTime is not None else pl.inf for rule in rules]
+        self.worsts = [pl.minimum if rule.comparator in (">", ">=") else pl.maximum for rule in rules]
+        self.intervals = [pos.runningIntervals(self.worsts[i], rule.minDuration, timeInc) for i, rule in enumerate(rules)]
+        self.messages = [0] * len(rules)
+        self.violations = [0] * len(rules)
+        self.worstChecked = [None] * len(rules)
+        self.worstViolation = [None] * len(rules)
+        # comparisons per field, the column, the comparator true out of
+        # tolerance, the thresholds and the rules (index in rules) compared
+        self.comparisons = []
+        for column, (field, fieldRules) in enumerate(groupFields(rules).items()):
+            for comparator in set(VIOLATIONS[rule.comparator] for i, rule in fieldRules):
+                compared = [i for i, rule in fieldRules if VIOLATIONS[rule.comparator] == comparator]
+                thresholds = pl.array([rules[i].threshold for i in compared], dtype=pl.float64)
+                self.comparisons.append((column, pos.COMPARATORS[comparator], thresholds, compared))
+
+    def setTimeInc(self, timeInc):
+        """
+        Updates the message period, e.g. of a file still being written
+        """
+        self.timeInc = timeInc
+        for intervals in self.intervals:
+            intervals.setTimeInc(timeInc)
+
+    def add(self, times, values):
+        """
+        Adds a block of messages, values is (messages x fields)
+        """
+        if len(times) == 0:
+            return
+        for column, compare, thresholds, compared in self.comparisons:
+            violation = compare(values[:,column,None], thresholds[None,:])
+            for j, i in enumerate(compared):
+                first = pl.searchsorted(times, self.startTimes[i], 'left') if self.startTimes[i] > times[0] else 0
+                last = pl.searchsorted(times, self.endTimes[i], 'right') if self.endTimes[i] < times[-1] else len(times)
+                if last <= first:
+                    continue
+                checked = values[first:last,column]
+                out = violation[first:last,j]
+                worst = self.worsts[i]
+                count = int(pl.count_nonzero(out))
+                self.messages[i] += len(checked)
+                self.violations[i] += count
+                blockWorst = worst.reduce(checked)
+                self.worstChecked[i] = blockWorst if self.worstChecked[i] is None else worst(self.worstChecked[i], blockWorst)
+                if count:
+                    blockWorst = worst.reduce(checked[out])
+                    self.worstViolation[i] = blockWorst if self.worstViolation[i] is None else \
+                                             worst(self.worstViolation[i], blockWorst)
+                self.intervals[i].add(times[first:last], out, checked)
+
+    def getResults(self):
+        """
+        Results of the messages added so far, see evaluateFile, an interval
+        still open at the last message is included
+        """
+        results = OrderedDict()
+        for i, rule in enumerate(self.rules):
+            result = rule.toDict()
+            result["messages"] = self.messages[i]
+            result["violations"] = self.violations[i]
+            result["seconds"] = self.violations[i] * self.timeInc
+            worst = self.worstViolation[i] if self.violations[i] else self.worstChecked[i]
+            result["worst"] = float(worst) if worst is not None else None
+            found = self.intervals[i].getIntervals()
+            result["intervals"] = [OrderedDict([("start", float(found["start"][k])), ("end", float(found["end"][k])),
+                                                ("duration", float(found["duration"][k])),
+                                                ("worst", float(found["worst"][k]))])
+                                   for k in xrange(len(found["start"]))]
+            result["passed"] = not result["intervals"]
+            results[rule.name] = result
+        return results
+
+def evaluateFile(dblfile, rules):
+    """
+    Evaluates the rules for one data file in one pass over the file, read a
+    block at a time (see dataFile.readBlocks and runningRules) so memory
+    stays flat however long the file is.
+
+    Returns an OrderedDict of rule name to the result, the rule, messages
+    checked, messages out of tolerance ("violations") and their time
+    ("seconds"), the worst value (of the messages out of tolerance if there
+    are any), the intervals out of tolerance for at least min_duration and
+    "passed" when there are none.
+    """
+    checkFields(dblfile, rules)
+    running = runningRules(rules, dblfile.timeInc, dblfile.startTime, dblfile.endTime)
+    if rules:
+        for times, values in dblfile.readBlocks(running.fields, min(running.startTimes), max(running.endTimes)):
+            running.add(times, values)
+    return running.getResults()
+
+def evaluateRules(project, rules, progressHandle = None):
+    """
+    Evaluates rules on the data files of a project (pos.project), each data
+    file is opened once. Rules of missing optional files are skipped, their
+    result is None. Returns an OrderedDict of rule name to the result of
+    evaluateFile in the order of rules.
+    """
+    groups = groupRules(rules)
+    found = {}
+    for i, (directory, fileType) in enumerate(groups):
+        if progressHandle:
+            progressHandle(100.0 * i / len(groups))
+        fileRules = groups[(directory, fileType)]
+        path = project.getDataFilePath(fileType, directory)
+        if not os.path.exists(path) and all(rule.optional for rule in fileRules):
+            continue
+        dblfile = project.getDataFileObject(fileType, directory)
+        found.update(evaluateFile(dblfile, fileRules))
+        del dblfile
+    if progressHandle:
+        progressHandle(100.0)
+    return OrderedDict((rule.name, found.get(rule.name)) for rule in rules)
+
+def ruleInputs(project, rules):
+    """
+    The data files the rules read, for the result cache
+    """
+    inputs = []
+    groups = groupRules(rules)
+    for directory, fileType in groups:
+        path = project.getDataFilePath(fileType, directory)
+        if os.path.exists(path) or not all(rule.optional for rule in groups[(directory, fileType)]):
+            inputs.append(path)
+    return inputs